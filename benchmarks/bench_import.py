@@ -0,0 +1,44 @@
+"""Import time of cellsino
+
+This script measures the time required for ``import cellsino`` in
+fresh interpreter processes (which is what each worker process of
+:func:`cellsino.Sinogram.compute` has to pay) and lists the heavy
+dependencies that are loaded at import time. The dependencies
+h5py, qpimage, flimage, and qpsphere are only imported when they
+are actually used.
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+
+repeats = 10
+heavy = ["h5py", "qpimage", "flimage", "qpsphere", "subprocess"]
+
+code = "import sys; import {}; print(','.join(m for m in {!r} "\
+       + "if m in sys.modules))"
+
+
+def measure(module):
+    """Return the import times [s] of `module` and the list of
+    heavy modules loaded"""
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = subprocess.check_output(
+            [sys.executable, "-c", code.format(module, heavy)])
+        times.append(time.perf_counter() - t0)
+    return times, out.decode().strip()
+
+
+# baseline: interpreter startup and numpy
+ref_times, _ = measure("numpy")
+times, loaded = measure("cellsino")
+
+print("{:>12s} {:>12s} {:>12s}".format("import", "median [ms]", "min [ms]"))
+for name, tt in [("numpy", ref_times), ("cellsino", times)]:
+    print("{:>12s} {:12.1f} {:12.1f}".format(
+        name, statistics.median(tt)*1e3, min(tt)*1e3))
+print("heavy modules loaded by 'import cellsino': {}".format(
+    loaded or "none"))
@@ -0,0 +1,65 @@
+"""Single vs. double precision sinogram computation
+
+This script compares the computation time and the accuracy of
+sinograms computed with ``dtype=np.float32`` to sinograms computed
+in double precision for several propagators and fluorescence
+projectors.
+
+Results (64x64 grid, 32 angles, "simple cell" phantom):
+
+=============  ==============  =========  =========  =========
+propagator     fluorescence    field err  phase err  fluor err
+=============  ==============  =========  =========  =========
+projection     analytic        9e-08      8e-08      7e-06
+rytov          analytic        2e-07      1e-07      7e-06
+rytov-fourier  fourier-slice   6e-06      6e-06      2e-07
+born-fourier   analytic        6e-06      6e-07      7e-06
+=============  ==============  =========  =========  =========
+
+The field error is the maximum absolute difference of the fields
+(the incident field has the amplitude 1), the phase error is the
+maximum phase difference [rad], and the fluorescence error is the
+maximum absolute difference relative to the maximum fluorescence.
+All errors are far below the noise level of experimental data.
+The sinograms require half the memory; the "rytov" and "projection"
+fields are computed by qpsphere in double precision.
+"""
+import time
+
+import numpy as np
+
+import cellsino
+
+
+sino = cellsino.Sinogram(phantom="simple cell",
+                         wavelength=550e-9,
+                         pixel_size=0.4e-6,
+                         grid_size=(64, 64))
+angles = 32
+
+print("{:>14s} {:>14s} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s}".format(
+    "propagator", "fluorescence", "t64 [s]", "t32 [s]", "field err",
+    "phase err", "fluor err"))
+for propagator, projector in [("projection", "analytic"),
+                              ("rytov", "analytic"),
+                              ("rytov-fourier", "fourier-slice"),
+                              ("born-fourier", "analytic")]:
+    kw = {"angles": angles,
+          "propagator": propagator,
+          "fluorescence_projector": projector}
+    # warm up caches (e.g. the spectra of the Fourier propagators)
+    sino.compute(angles=1, propagator=propagator,
+                 fluorescence_projector=projector)
+    sino.compute(angles=1, propagator=propagator,
+                 fluorescence_projector=projector, dtype=np.float32)
+    t0 = time.perf_counter()
+    field64, fluor64 = sino.compute(**kw)
+    t1 = time.perf_counter()
+    field32, fluor32 = sino.compute(dtype=np.float32, **kw)
+    t2 = time.perf_counter()
+    field_err = np.abs(field32 - field64).max()
+    phase_err = np.abs(np.angle(field32 / field64)).max()
+    fluor_err = np.abs(fluor32 - fluor64).max() / np.abs(fluor64).max()
+    print("{:>14s} {:>14s} {:9.3f} {:9.3f} {:9.1e} {:9.1e} {:9.1e}".format(
+        propagator, projector, t1 - t0, t2 - t1, field_err, phase_err,
+        fluor_err))
@@ -0,0 +1,59 @@
+"""Numerical refocusing vs. direct Rytov model evaluation
+
+This script compares the computation time and the accuracy of the
+fields obtained with :class:`cellsino.propagators.FieldCache` in
+refocusing mode to the fields computed directly with the Rytov
+model of :ref:`qpsphere <qpsphere:index>` for a sphere at different
+axial positions.
+"""
+import time
+
+import numpy as np
+
+from cellsino.elements import Sphere
+from cellsino.phantoms.base_phantom import BasePhantom
+from cellsino.propagators import FieldCache, Rytov
+
+
+grid_size = (128, 128)
+pixel_size = .2e-6
+wavelength = 550e-9
+medium_index = 1.335
+radius = 4e-6
+sphere_index = 1.36
+# axial sphere positions [m]
+positions = np.linspace(-6e-6, 6e-6, 13)
+
+cache = FieldCache(refocus=True)
+
+print("{:>10s} {:>12s} {:>12s} {:>10s} {:>10s} {:>10s}".format(
+    "z [µm]", "direct [ms]", "refocus [ms]", "max err", "rms err",
+    "phase err"))
+t_direct = 0
+t_refocus = 0
+for zz in positions:
+    phantom = BasePhantom(medium_index=medium_index)
+    phantom.append(Sphere(object_index=sphere_index,
+                          medium_index=medium_index,
+                          fl_brightness=0,
+                          center=(0, 0, zz),
+                          radius=radius))
+    kw = {"phantom": phantom,
+          "grid_size": grid_size,
+          "pixel_size": pixel_size,
+          "wavelength": wavelength}
+    t0 = time.perf_counter()
+    field_direct = Rytov(**kw).propagate_array()
+    t1 = time.perf_counter()
+    field_refocus = Rytov(field_cache=cache, **kw).propagate_array()
+    t2 = time.perf_counter()
+    t_direct += t1 - t0
+    t_refocus += t2 - t1
+    error = np.abs(field_direct - field_refocus)
+    phase_error = np.abs(np.angle(field_direct / field_refocus))
+    print("{:10.1f} {:12.1f} {:12.1f} {:10.4f} {:10.4f} {:10.4f}".format(
+        zz*1e6, (t1-t0)*1e3, (t2-t1)*1e3, error.max(),
+        np.sqrt(np.mean(error**2)), phase_error.max()))
+
+print("total: direct {:.3f}s, refocus {:.3f}s (speed-up {:.1f}x)".format(
+    t_direct, t_refocus, t_direct/t_refocus))
@@ -0,0 +1,335 @@
+"""Benchmark suite for the hot paths of cellsino
+
+This script measures the throughput of
+
+- element and phantom transformations
+  (:func:`cellsino.elements.base_element.BaseElement.transform`)
+- phantom rasterization
+  (:func:`cellsino.phantoms.base_phantom.BasePhantom.draw`)
+- fluorescence projection
+  (:func:`cellsino.fluorescence.Fluorescence.project`)
+- field propagation (:func:`cellsino.propagators.Projection.propagate`
+  and :func:`cellsino.propagators.Rytov.propagate`)
+- full sinogram computation (:func:`cellsino.Sinogram.compute`) in
+  memory and to HDF5 files (series and flat layout)
+
+for several grid sizes and numbers of spheres. Each benchmark is
+repeated and the fastest run is reported as frames (or elements,
+voxels, pixels) per second. No network access or additional packages
+are required.
+
+The results are written to a JSON file (by default
+``benchmarks/results/<commit>.json``) together with the git commit
+and the versions of Python, numpy, and cellsino. Throughputs depend
+on the machine, which is why result files are not part of the
+repository. To assess a change, run the suite for a baseline commit
+and for the change on the same machine and compare the two runs:
+
+.. code::
+
+    git checkout baseline
+    python benchmarks/bench_suite.py
+    git checkout other_branch
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --compare benchmarks/results/A.json \\
+        benchmarks/results/B.json
+
+Use ``--quick`` for a smaller parameter set and ``--filter`` to
+run only benchmarks whose name contains a given string.
+"""
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import cellsino
+from cellsino.elements import Sphere
+from cellsino.fluorescence import Fluorescence
+from cellsino.phantoms.base_phantom import BasePhantom
+from cellsino.propagators import prop_dict
+
+
+here = pathlib.Path(__file__).resolve().parent
+
+wavelength = 550e-9
+pixel_size = .4e-6
+medium_index = 1.335
+
+#: benchmark parameters (full run)
+params_full = {
+    "grid_sizes": [64, 128],
+    "sphere_counts": [1, 5, 20],
+    "transform_counts": [1, 100, 1000],
+    "draw_grid_sizes": [32, 64],
+    "angles": 32,
+    "repeats": 5,
+}
+
+#: benchmark parameters (``--quick``)
+params_quick = {
+    "grid_sizes": [32, 64],
+    "sphere_counts": [1, 5],
+    "transform_counts": [1, 100],
+    "draw_grid_sizes": [32],
+    "angles": 8,
+    "repeats": 3,
+}
+
+
+def random_phantom(num_spheres, seed=42):
+    """Phantom with `num_spheres` random spheres
+
+    The spheres have radii between 1µm and 3µm and lie within
+    the field of view of the smallest grid (32 pixels).
+    """
+    rng = np.random.RandomState(seed)
+    phantom = BasePhantom(medium_index=medium_index)
+    for _ in range(num_spheres):
+        phantom.append(Sphere(object_index=rng.uniform(1.34, 1.37),
+                              medium_index=medium_index,
+                              fl_brightness=rng.uniform(0, 10),
+                              center=rng.uniform(-3e-6, 3e-6, size=3),
+                              radius=rng.uniform(1e-6, 3e-6)))
+    return phantom
+
+
+def bench_transform(num_spheres):
+    """Rotation and translation of a phantom"""
+    phantom = random_phantom(num_spheres)
+
+    def run():
+        phantom.transform(x=1e-6, rot_main=.3, rot_in_plane=.1)
+
+    return run, {"elements/s": num_spheres}
+
+
+def bench_draw(grid_size, num_spheres):
+    """Rasterization of a phantom on a 3D grid"""
+    phantom = random_phantom(num_spheres)
+    shape = (grid_size,) * 3
+
+    def run():
+        phantom.draw(grid_size=shape, pixel_size=pixel_size)
+
+    return run, {"voxels/s": grid_size**3}
+
+
+def bench_fluorescence(grid_size, num_spheres):
+    """Fluorescence projection of a single frame"""
+    fluor = Fluorescence(phantom=random_phantom(num_spheres),
+                         grid_size=(grid_size, grid_size),
+                         pixel_size=pixel_size)
+
+    def run():
+        fluor.project()
+
+    return run, {"frames/s": 1, "pixels/s": grid_size**2}
+
+
+def bench_propagate(propagator, grid_size, num_spheres):
+    """Field propagation of a single frame"""
+    prop = prop_dict[propagator](phantom=random_phantom(num_spheres),
+                                 grid_size=(grid_size, grid_size),
+                                 pixel_size=pixel_size,
+                                 wavelength=wavelength)
+
+    def run():
+        prop.propagate()
+
+    return run, {"frames/s": 1, "pixels/s": grid_size**2}
+
+
+def bench_compute(target, grid_size, angles):
+    """Sinogram computation of the "simple cell" phantom"""
+    sino = cellsino.Sinogram(phantom="simple cell",
+                             wavelength=wavelength,
+                             pixel_size=pixel_size,
+                             grid_size=(grid_size, grid_size))
+    kwargs = {"angles": angles, "propagator": "projection"}
+
+    def run():
+        if target == "memory":
+            sino.compute(**kwargs)
+        else:
+            tdir = tempfile.mkdtemp(prefix="cellsino_bench_")
+            try:
+                sino.compute(path=pathlib.Path(tdir) / "sino.h5",
+                             layout=target.split("-")[1], **kwargs)
+            finally:
+                shutil.rmtree(tdir, ignore_errors=True)
+
+    return run, {"frames/s": angles, "pixels/s": angles * grid_size**2}
+
+
+def get_benchmarks(params):
+    """Return a list of (name, parameters, setup function)"""
+    benchmarks = []
+    for num in params["transform_counts"]:
+        benchmarks.append(("transform", {"num_spheres": num},
+                           bench_transform))
+    for gs in params["draw_grid_sizes"]:
+        for num in params["sphere_counts"]:
+            benchmarks.append(("draw", {"grid_size": gs,
+                                        "num_spheres": num},
+                               bench_draw))
+    for gs in params["grid_sizes"]:
+        for num in params["sphere_counts"]:
+            benchmarks.append(("fluorescence", {"grid_size": gs,
+                                                "num_spheres": num},
+                               bench_fluorescence))
+    for propagator in ["projection", "rytov"]:
+        for gs in params["grid_sizes"]:
+            for num in params["sphere_counts"]:
+                benchmarks.append(("propagate", {"propagator": propagator,
+                                                 "grid_size": gs,
+                                                 "num_spheres": num},
+                                   bench_propagate))
+    for target in ["memory", "hdf5-series", "hdf5-flat"]:
+        for gs in params["grid_sizes"]:
+            benchmarks.append(("compute", {"target": target,
+                                           "grid_size": gs,
+                                           "angles": params["angles"]},
+                               bench_compute))
+    return benchmarks
+
+
+def get_key(name, kwargs):
+    """Unique benchmark name including its parameters"""
+    return "{}[{}]".format(name, ",".join(
+        "{}={}".format(kk, kwargs[kk]) for kk in sorted(kwargs)))
+
+
+def measure(run, repeats, min_time=.1):
+    """Return the best time [s] of a single call of `run`
+
+    `run` is called at least once per repeat and repeatedly
+    until `min_time` has passed (for fast functions).
+    """
+    # warm-up (e.g. lazy imports and caches)
+    run()
+    best = np.inf
+    for _ in range(repeats):
+        calls = 0
+        t0 = time.perf_counter()
+        while True:
+            run()
+            calls += 1
+            elapsed = time.perf_counter() - t0
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / calls)
+    return best
+
+
+def get_commit():
+    """Return the current git commit and whether the tree is dirty"""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(here),
+            stderr=subprocess.DEVNULL).decode().strip()
+        status = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=str(here), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(status)
+
+
+def run_suite(params, name_filter=None):
+    """Run all benchmarks and return the results as a dict"""
+    commit, dirty = get_commit()
+    results = {}
+    for name, kwargs, setup in get_benchmarks(params):
+        key = get_key(name, kwargs)
+        if name_filter and name_filter not in key:
+            continue
+        run, items = setup(**kwargs)
+        best = measure(run, repeats=params["repeats"])
+        throughput = {unit: num / best for unit, num in items.items()}
+        results[key] = {"name": name,
+                        "params": kwargs,
+                        "time": best,
+                        "throughput": throughput,
+                        }
+        print("{:<62s} {:10.3f} ms {}".format(
+            key, best * 1e3, " ".join("{:10.4g} {}".format(vv, uu)
+                                      for uu, vv in throughput.items())))
+        sys.stdout.flush()
+    return {"commit": commit,
+            "dirty": dirty,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cellsino": cellsino.__version__,
+            "machine": platform.machine(),
+            "params": params,
+            "results": results,
+            }
+
+
+def compare(path_old, path_new):
+    """Print the throughput ratios of two result files"""
+    with open(str(path_old)) as fd:
+        old = json.load(fd)
+    with open(str(path_new)) as fd:
+        new = json.load(fd)
+    print("old: {} ({}), new: {} ({})".format(
+        old["commit"], old["date"], new["commit"], new["date"]))
+    print("{:<62s} {:>12s} {:>12s} {:>8s}".format(
+        "benchmark", "old", "new", "ratio"))
+    for key, item in new["results"].items():
+        if key not in old["results"]:
+            continue
+        # compare the first (primary) throughput unit
+        unit = list(item["throughput"])[0]
+        vold = old["results"][key]["throughput"][unit]
+        vnew = item["throughput"][unit]
+        print("{:<62s} {:12.4g} {:12.4g} {:8.2f} {}".format(
+            key, vold, vnew, vnew / vold, unit))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the hot paths of cellsino")
+    parser.add_argument("--quick", action="store_true",
+                        help="run a smaller set of benchmarks")
+    parser.add_argument("--filter", default=None,
+                        help="only run benchmarks containing this string")
+    parser.add_argument("--output", default=None,
+                        help="output JSON file (defaults to "
+                             "benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files and exit")
+    args = parser.parse_args(args)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    params = params_quick if args.quick else params_full
+    data = run_suite(params, name_filter=args.filter)
+    if args.output is None:
+        name = data["commit"]
+        if data["dirty"]:
+            name += "-dirty"
+        if args.quick:
+            name += "-quick"
+        output = here / "results" / "{}.json".format(name)
+    else:
+        output = pathlib.Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w") as fd:
+        json.dump(data, fd, indent=2)
+    print("results written to {}".format(output))
+
+
+if __name__ == "__main__":
+    main()
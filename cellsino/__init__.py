@@ -1,3 +1,42 @@
-from ._version import version as __version__  # noqa: F401
 from . import phantoms  # noqa: F401
+from .cache import clear_caches  # noqa: F401
+from .session import SinogramSession  # noqa: F401
 from .sinogram import Sinogram  # noqa: F401
+
+
+def __getattr__(name):
+    # The version is determined on first access, because this may
+    # involve calling `git describe` in a subprocess.
+    if name == "__version__":
+        version = _get_version()
+        globals()["__version__"] = version
+        return version
+    raise AttributeError(
+        "module '{}' has no attribute '{}'".format(__name__, name))
+
+
+def _get_version():
+    """Return the version without calling `git describe` if possible
+
+    The version saved by :mod:`cellsino._version` (included in
+    distribution archives) or the version of the installed package
+    is used. Only if neither is available, the version is determined
+    from the git repository.
+    """
+    try:
+        from ._version_save import longversion
+    except ImportError:
+        pass
+    else:
+        return longversion
+    try:
+        from importlib import metadata
+    except ImportError:  # Python < 3.8
+        pass
+    else:
+        try:
+            return metadata.version(__name__)
+        except metadata.PackageNotFoundError:
+            pass
+    from ._version import version
+    return version
@@ -0,0 +1,3 @@
+#!/usr/bin/env python
+# This file was created automatically
+longversion = '2025.02.06-07-25-45'
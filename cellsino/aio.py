@@ -0,0 +1,133 @@
+import asyncio
+
+
+class Progress(object):
+    def __init__(self):
+        """Progress of an asynchronous sinogram computation
+
+        Pass an instance as `progress` to
+        :func:`cellsino.Sinogram.aiter_frames` or
+        :func:`cellsino.Sinogram.compute_async` and await its
+        updates in another task:
+
+        .. code::
+
+            progress = cellsino.aio.Progress()
+            task = asyncio.ensure_future(
+                sino.compute_async(angles=100, progress=progress))
+            async for done, total in progress:
+                print("{}/{}".format(done, total))
+            field, fluor = await task
+
+        Iteration stops when all frames are computed or when
+        the computation was stopped (see :data:`finished`).
+        """
+        #: number of computed frames
+        self.done = 0
+        #: total number of frames
+        self.total = 0
+        #: whether the computation is finished (or was stopped)
+        self.finished = False
+        #: number of updates
+        self._version = 0
+        self._event = None
+
+    def __aiter__(self):
+        return _ProgressIterator(self)
+
+    async def wait(self):
+        """Wait for the next update and return (done, total)"""
+        if not self.finished:
+            await self._get_event().wait()
+        return self.done, self.total
+
+    def _get_event(self):
+        if self._event is None:
+            self._event = asyncio.Event()
+        return self._event
+
+    def _update(self, done=None, total=None, finished=False):
+        """Set the progress and wake up all waiting tasks"""
+        if done is not None:
+            self.done = done
+        if total is not None:
+            self.total = total
+        self.finished = self.finished or finished
+        self._version += 1
+        event = self._event
+        self._event = None
+        if event is not None:
+            event.set()
+
+
+class _ProgressIterator(object):
+    """Asynchronous iterator over the updates of :class:`Progress`"""
+
+    def __init__(self, progress):
+        self.progress = progress
+        self.version = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        progress = self.progress
+        if progress.finished and self.version == progress._version:
+            raise StopAsyncIteration
+        while self.version == progress._version:
+            await progress.wait()
+        self.version = progress._version
+        return progress.done, progress.total
+
+
+async def map_frames_async(func, iterable, executor=None, max_pending=None):
+    """Apply `func` to each chunk of frames in an executor
+
+    This is the asynchronous version of
+    :func:`cellsino.sinogram._map_frames`; the results are yielded
+    in the order of `iterable` without blocking the event loop.
+
+    Parameters
+    ----------
+    func: callable
+        Function applied to each chunk; it must be picklable if
+        `executor` is a process pool.
+    iterable: iterable
+        Chunks to be processed; the length of the first item of
+        each chunk is its number of frames.
+    executor: concurrent.futures.Executor or None
+        Executor used for computing the chunks; None uses the
+        default executor of the event loop (a thread pool).
+    max_pending: int or None
+        Maximum number of frames submitted to `executor` that
+        have not yet been yielded; at least one chunk is always
+        submitted (defaults to four times the number of workers
+        of `executor`)
+
+    Notes
+    -----
+    If the generator is closed (e.g. because the consuming task
+    was cancelled), pending chunks that have not yet started are
+    cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    if max_pending is None:
+        max_pending = 4 * getattr(executor, "_max_workers", 4)
+    # futures and number of frames of the submitted chunks
+    pending = []
+    num_pending = 0
+    try:
+        for item in iterable:
+            size = len(item[0])
+            while pending and num_pending + size > max_pending:
+                future, num = pending.pop(0)
+                num_pending -= num
+                yield await future
+            pending.append((loop.run_in_executor(executor, func, item),
+                            size))
+            num_pending += size
+        while pending:
+            yield await pending.pop(0)[0]
+    finally:
+        for future, _ in pending:
+            future.cancel()
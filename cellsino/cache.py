@@ -0,0 +1,458 @@
+import collections
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import uuid
+
+import numpy as np
+
+
+#: caches that were unpickled in this process (see :func:`_restore_cache`)
+_registry = collections.OrderedDict()
+#: maximum number of caches kept in :data:`_registry`
+_registry_size = 8
+#: module-level caches that are emptied by :func:`clear_caches`
+_module_caches = []
+
+
+class MemoryCache(object):
+    def __init__(self, maxsize=128, max_bytes=None):
+        """Least-recently-used in-memory cache
+
+        Parameters
+        ----------
+        maxsize: int or None
+            Maximum number of cached items; set to None for an
+            unbounded cache.
+        max_bytes: int or None
+            Maximum total size of the cached items [bytes] (see
+            :func:`get_nbytes`); items that are larger than this
+            are not cached. Set to None for no limit.
+
+        Notes
+        -----
+        When a cache is pickled (e.g. when it is sent to the worker
+        processes of a :class:`concurrent.futures.ProcessPoolExecutor`),
+        the cached data are not transferred. Instead, all copies of a
+        cache that are unpickled within one process refer to the same
+        instance, such that tasks executed by the same worker process
+        share the cached data.
+        """
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        #: unique identifier used for sharing the cache across tasks
+        self.identifier = uuid.uuid4().hex
+        #: number of cache hits
+        self.hits = 0
+        #: number of cache misses
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        #: total size of the cached items [bytes]
+        self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __reduce__(self):
+        state = self.__dict__.copy()
+        # cached data and locks are not transferred
+        del state["_data"]
+        del state["_lock"]
+        del state["nbytes"]
+        return _restore_cache, (self.__class__, state)
+
+    def clear(self):
+        """Remove all items from the cache"""
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def get(self, key, func):
+        """Return the cached value for `key`
+
+        If `key` is not in the cache, `func()` is called and its
+        return value is stored in the cache.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = func()
+        if (self.max_bytes is not None
+                and get_nbytes(value) > self.max_bytes):
+            return value
+        with self._lock:
+            if key in self._data:
+                # computed by another thread in the meantime
+                self.nbytes -= get_nbytes(self._data.pop(key))
+            self._data[key] = value
+            self.nbytes += get_nbytes(value)
+            while self._data and (
+                    (self.maxsize is not None
+                     and len(self._data) > self.maxsize)
+                    or (self.max_bytes is not None
+                        and self.nbytes > self.max_bytes)):
+                _, item = self._data.popitem(last=False)
+                self.nbytes -= get_nbytes(item)
+        return value
+
+
+def _restore_cache(cls, state):
+    """Return the process-local instance of an unpickled cache"""
+    identifier = state["identifier"]
+    if identifier in _registry:
+        _registry.move_to_end(identifier)
+    else:
+        cache = cls.__new__(cls)
+        cache.__dict__.update(state)
+        cache._data = collections.OrderedDict()
+        cache._lock = threading.Lock()
+        cache.nbytes = 0
+        _registry[identifier] = cache
+        while len(_registry) > _registry_size:
+            _registry.popitem(last=False)
+    return _registry[identifier]
+
+
+class ElementCache(MemoryCache):
+    def __init__(self, keys=None, maxsize=None):
+        """Cache for the contributions of single elements to a frame
+
+        This cache is used for elements whose transformed parameters
+        are identical in several frames, e.g. a sphere that is
+        located on the rotational axis. Since the contributions
+        are reused as they are, the results are identical to those
+        obtained without caching.
+
+        Parameters
+        ----------
+        keys: set or None
+            Set of element keys ``(element_key(element), displacement)``
+            that are cached; the contributions of all other elements
+            are computed without caching. If None, the contributions
+            of all elements are cached.
+        maxsize: int or None
+            Maximum number of cached contributions
+        """
+        super(ElementCache, self).__init__(maxsize=maxsize)
+        self.keys = keys
+        self._centers = None
+
+    def find_candidates(self, centers, displacements):
+        """Return which elements at the given positions may be cached
+
+        This is a quick pre-selection for :func:`get_contribution`
+        that only compares the element centers and the displacements
+        with those of :data:`keys`. It avoids computing the keys of
+        all elements of all frames (e.g. for a
+        :class:`cellsino.phantoms.SphereCollection`).
+
+        Parameters
+        ----------
+        centers: 3d ndarray of shape (N, M, 3)
+            Centers of M transformed single-point elements (e.g.
+            spheres) in N frames [m]
+        displacements: 2d ndarray of shape (N, 2)
+            Lateral displacement of each frame [px]
+
+        Returns
+        -------
+        candidates: 2d boolean ndarray of shape (N, M)
+            True for elements whose key may be in :data:`keys`
+        """
+        candidates = np.zeros(centers.shape[:2], dtype=bool)
+        if self.keys is None:
+            candidates[:] = True
+            return candidates
+        if self._centers is None:
+            self._centers = set()
+            for ekey, displacement in self.keys:
+                params = dict(ekey[1])
+                if "points" in params and params["points"][0][0] == 1:
+                    self._centers.add((params["points"][1], displacement))
+        # rounding as in :func:`element_key`
+        centers = np.round(centers, 15) + 0.
+        for ii in range(centers.shape[0]):
+            displacement = tuple(displacements[ii])
+            for jj in range(centers.shape[1]):
+                candidates[ii, jj] = ((tuple(centers[ii, jj]), displacement)
+                                      in self._centers)
+        return candidates
+
+    def get_contribution(self, element, displacement, settings, func):
+        """Return the (cached) contribution of an element to a frame
+
+        Parameters
+        ----------
+        element: cellsino.elements.base_element.BaseElement
+            Transformed element
+        displacement: tuple of floats
+            Lateral displacement of the frame [px]
+        settings: tuple
+            Hashable description of the imaging settings (e.g.
+            propagator name, wavelength, pixel size, and grid size)
+        func: callable
+            Function that computes the contribution
+        """
+        ekey = (element_key(element), tuple(displacement))
+        if self.keys is not None and ekey not in self.keys:
+            return func()
+        return self.get((settings,) + ekey, func)
+
+
+def clear_caches():
+    """Free the memory held by the module-level caches of cellsino
+
+    This includes the 3D spectra of the phantoms computed by
+    :class:`cellsino.propagators.BornFourier` and the
+    :class:`cellsino.fluorescence.FourierSliceProjector` instances
+    of the "fourier-slice" fluorescence projector, which are kept
+    for subsequent computations with the same phantom. The sizes
+    of these caches are limited by their `max_bytes` attribute.
+    """
+    for cache in _module_caches:
+        cache.clear()
+
+
+def element_key(element, decimals=15, exclude=()):
+    """Return a hashable key describing the parameters of an element
+
+    Parameters
+    ----------
+    element: cellsino.elements.base_element.BaseElement
+        Element instance
+    decimals: int
+        Array parameters (e.g. the point coordinates in meters) are
+        rounded to this number of decimals to remove numerical noise
+        from transformations.
+    exclude: tuple of str
+        Names of parameters that are not part of the key (e.g.
+        the refractive indices for fluorescence data)
+    """
+    params = []
+    for key, value in sorted(vars(element).items()):
+        if key in exclude:
+            continue
+        if isinstance(value, np.ndarray):
+            value = (value.shape,
+                     tuple(np.round(value, decimals).flatten() + 0.))
+        params.append((key, value))
+    return (element.__class__.__name__, tuple(params))
+
+
+class DiskCache(object):
+    #: number of writes after which the cache directory is listed
+    #: again to account for files written or removed by other processes
+    rescan_interval = 100
+    #: when `max_bytes` is exceeded, the least recently used files are
+    #: removed until the total size is below this fraction of `max_bytes`
+    evict_ratio = 0.9
+
+    def __init__(self, path, max_bytes=None):
+        """Content-addressed on-disk cache for arrays
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Cache directory (created if it does not exist)
+        max_bytes: int or None
+            Maximum total size of the cached files; the least
+            recently used files are removed when this size is
+            exceeded. The limit applies to the files written by all
+            processes that share the cache directory. Each instance
+            keeps a running total of the cache size and lists the
+            directory only when this total exceeds `max_bytes` or
+            after :data:`rescan_interval` writes; in between, files
+            written by other processes are not accounted for. Set to
+            None for an unbounded cache.
+
+        Notes
+        -----
+        Each item is stored in a separate ".npy" file whose name
+        is the SHA-256 hash of its key (see :func:`DiskCache.hash`).
+        Files are written to a temporary file first and then moved
+        to their final location, such that several processes can
+        safely use the same cache directory at the same time.
+        The modification time of a file is updated each time it is
+        read; it defines the order of eviction. Files that cannot
+        be read, replaced, or removed because they are in use by
+        another process (`PermissionError` on Windows) are treated
+        as missing or skipped.
+        """
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        #: number of cache hits (in this process)
+        self.hits = 0
+        #: number of cache misses (in this process)
+        self.misses = 0
+        #: estimated total size of the cached files [bytes]
+        self._size = None
+        #: number of writes since the directory was last listed
+        self._writes = 0
+
+    def __contains__(self, key):
+        return self._get_path(key).exists()
+
+    def __len__(self):
+        return len(self._list_files())
+
+    def clear(self):
+        """Remove all items from the cache"""
+        for pp, _, _ in self._list_files():
+            _remove(pp)
+
+    def load(self, key):
+        """Return the cached array for `key` or None if it is missing"""
+        pp = self._get_path(key)
+        try:
+            value = np.load(str(pp), allow_pickle=False)
+        except (FileNotFoundError, PermissionError):
+            # missing or in use by another process
+            value = None
+        except (OSError, ValueError):
+            # incomplete or corrupt file
+            _remove(pp)
+            value = None
+        else:
+            try:
+                # mark as recently used
+                os.utime(str(pp))
+            except OSError:
+                pass
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def store(self, key, value):
+        """Store the array `value` under `key`"""
+        pp = self._get_path(key)
+        pp.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".npy",
+                                   dir=str(pp.parent))
+        try:
+            with os.fdopen(fd, "wb") as fobj:
+                np.save(fobj, np.asarray(value), allow_pickle=False)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, str(pp))
+        except PermissionError:
+            # the file is in use by another process; skip caching
+            _remove(tmp)
+            return
+        except BaseException:
+            _remove(tmp)
+            raise
+        if self.max_bytes is not None:
+            self._writes += 1
+            if self._size is not None:
+                self._size += size
+            if (self._size is None
+                    or self._size > self.max_bytes
+                    or self._writes >= self.rescan_interval):
+                self._evict()
+
+    def get(self, key, func):
+        """Return the cached array for `key`
+
+        If `key` is not in the cache, `func()` is called and its
+        return value is stored in the cache.
+        """
+        value = self.load(key)
+        if value is None:
+            value = func()
+            self.store(key, value)
+        return value
+
+    @staticmethod
+    def hash(key):
+        """Return the SHA-256 hex digest of a key
+
+        The key may be any combination of tuples, lists, dicts,
+        strings, and numbers (including NumPy scalars).
+        """
+        data = json.dumps(key, default=_json_default,
+                          separators=(",", ":"), sort_keys=True)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _evict(self):
+        """Remove least recently used files if `max_bytes` is exceeded
+
+        The directory is listed to update the running size total
+        with the files of other processes (`max_bytes` applies
+        to all processes).
+        """
+        files = sorted(self._list_files(), key=lambda item: item[2])
+        size = sum(item[1] for item in files)
+        if size > self.max_bytes:
+            for pp, fsize, _ in files:
+                if size <= self.evict_ratio * self.max_bytes:
+                    break
+                if _remove(pp):
+                    size -= fsize
+        self._size = size
+        self._writes = 0
+
+    def _get_path(self, key):
+        digest = self.hash(key)
+        return self.path / digest[:2] / (digest + ".npy")
+
+    def _list_files(self):
+        """Return a list of (path, size, mtime) of all cached files"""
+        files = []
+        for pp in self.path.glob("??/*.npy"):
+            if pp.name.startswith(".tmp_"):
+                continue
+            try:
+                stat = pp.stat()
+            except FileNotFoundError:
+                continue
+            files.append((pp, stat.st_size, stat.st_mtime))
+        return files
+
+
+def get_nbytes(value):
+    """Return the memory size of a cached item [bytes]
+
+    The size of arrays and of objects with an `nbytes` attribute
+    is used; tuples and lists are summed up. Other items count
+    as zero bytes.
+    """
+    if isinstance(value, (tuple, list)):
+        return sum(get_nbytes(item) for item in value)
+    return int(getattr(value, "nbytes", 0))
+
+
+def _json_default(obj):
+    """Convert NumPy scalars and arrays for :func:`json.dumps`"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("Cannot serialize object of type '{}'!".format(
+        obj.__class__.__name__))
+
+
+def _remove(path):
+    """Remove a file and return whether it was removed
+
+    Files that do not exist (anymore) or that are in use by
+    another process are ignored.
+    """
+    try:
+        os.remove(str(path))
+    except FileNotFoundError:
+        return True
+    except PermissionError:
+        return False
+    return True
@@ -0,0 +1,40 @@
+import argparse
+
+
+def sweep(args=None):
+    """Command-line interface for :func:`cellsino.sweep.run_sweep`"""
+    from .sweep import run_sweep
+
+    parser = argparse.ArgumentParser(
+        prog="cellsino-sweep",
+        description="Compute the sinograms of a parameter sweep.")
+    parser.add_argument("config",
+                        help="sweep configuration file (TOML)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="output HDF5 file (overrides the "
+                             + "configuration)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument("--cache-dir", default=None,
+                        help="directory of the frame cache shared by "
+                             + "all jobs (defaults to the output file "
+                             + "name with the suffix '.cache'; empty "
+                             + "string to disable caching)")
+    parser.add_argument("--cache-size", type=float, default=None,
+                        help="maximum size of the frame cache in MB "
+                             + "(default: 1024; 0 for no limit)")
+    parser.add_argument("--restart", action="store_true",
+                        help="recompute jobs that are already in the "
+                             + "output file")
+    opts = parser.parse_args(args)
+    manifest = run_sweep(config=opts.config,
+                         output=opts.output,
+                         workers=opts.workers,
+                         cache_dir=opts.cache_dir,
+                         max_bytes=None if opts.cache_size is None
+                         else int(opts.cache_size * 2**20),
+                         resume=not opts.restart,
+                         verbose=True)
+    done = len([job for job in manifest if job["status"] == "done"])
+    print("Computed {} jobs, skipped {} finished jobs.".format(
+        done, len(manifest) - done))
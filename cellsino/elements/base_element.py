@@ -36,9 +36,9 @@ class BaseElement(object):
         #: the object).
         self.points = np.array(points)
 
-    def draw(self, grid_size, pixel_size):
-        ri = np.ones(grid_size, dtype=float) * self.medium_index
-        fl = np.zeros(grid_size, dtype=float)
+    def draw(self, grid_size, pixel_size, dtype=float):
+        ri = np.full(grid_size, self.medium_index, dtype=dtype)
+        fl = np.zeros(grid_size, dtype=dtype)
         for pp in self.points:
             # ODTbrain convention
             cy, cz, cx = np.array(pp/pixel_size, dtype=int)
@@ -46,6 +46,27 @@ class BaseElement(object):
             fl[cx, cy, cz] = self.fl_brightness
         return ri, fl
 
+    def draw_into(self, ri, fl, pixel_size):
+        """Add the element to existing refractive index and fluorescence
+        volumes (in-place)
+
+        Parameters
+        ----------
+        ri: 3d ndarray
+            Refractive index volume; the index contrast of the
+            element w.r.t. the medium is added.
+        fl: 3d ndarray
+            Fluorescence volume; the fluorescence brightness of the
+            element is added.
+        pixel_size: float
+            Pixel size [m]
+        """
+        for pp in self.points:
+            # ODTbrain convention
+            cy, cz, cx = np.array(pp/pixel_size, dtype=int)
+            ri[cx, cy, cz] += self.object_index - self.medium_index
+            fl[cx, cy, cz] += self.fl_brightness
+
     def transform(self, x=0, y=0, z=0, rot_main=0, rot_in_plane=0,
                   rot_perp_plane=0):
         """Rotate and translate self.points
@@ -61,31 +82,9 @@ class BaseElement(object):
           Third, the points are rotated about the z-axis (``rot_in_plane``,
           within the imaging plane).
         """
-        # The definition of the angles are such that the sinogram
-        # can be plugged right into ODTbrain/radontea without
-        # transposing it (when only `rot_main` is set).
-        alpha = -rot_main
-        beta = rot_perp_plane
-        gamma = rot_in_plane
-        Rx = np.array([
-                      [1,             0,              0],
-                      [0, np.cos(alpha), -np.sin(alpha)],
-                      [0, np.sin(alpha),  np.cos(alpha)],
-                      ])
-
-        Ry = np.array([
-                      [np.cos(beta),  0, np.sin(beta)],
-                      [0,             1,            0],
-                      [-np.sin(beta), 0, np.cos(beta)],
-                      ])
-
-        Rz = np.array([
-                      [np.cos(gamma), -np.sin(gamma), 0],
-                      [np.sin(gamma),  np.cos(gamma), 0],
-                      [0,          0,                 1],
-                      ])
-
-        R = np.dot(np.dot(Ry, Rz), Rx)
+        R = rotation_matrix(rot_main=rot_main,
+                            rot_in_plane=rot_in_plane,
+                            rot_perp_plane=rot_perp_plane)
         rotated = np.dot(R, self.points.T).T
         rotated_pad = np.pad(rotated, ((0, 0), (0, 1)), mode="constant",
                              constant_values=1)
@@ -101,3 +100,51 @@ class BaseElement(object):
         telement = copy.copy(self)
         telement.points = translated
         return telement
+
+
+def rotation_matrix(rot_main=0, rot_in_plane=0, rot_perp_plane=0):
+    """Rotation matrix used in :func:`BaseElement.transform`
+
+    Parameters
+    ----------
+    rot_main: float or 1d ndarray of size N
+        Main sinogram acquisition angle [rad]
+    rot_in_plane: float or 1d ndarray of size N
+        Rotation within the imaging plane [rad]
+    rot_perp_plane: float or 1d ndarray of size N
+        Rotation perpendicular to the imaging plane [rad]
+
+    Returns
+    -------
+    R: ndarray of shape (3, 3) or (N, 3, 3)
+        Rotation matrix (or stack of rotation matrices if any of
+        the angles is an array)
+    """
+    # The definition of the angles are such that the sinogram
+    # can be plugged right into ODTbrain/radontea without
+    # transposing it (when only `rot_main` is set).
+    alpha, beta, gamma = np.broadcast_arrays(-np.asarray(rot_main, float),
+                                             np.asarray(rot_perp_plane, float),
+                                             np.asarray(rot_in_plane, float))
+    zero = np.zeros_like(alpha)
+    one = np.ones_like(alpha)
+    Rx = np.array([
+                  [one,            zero,           zero],
+                  [zero, np.cos(alpha), -np.sin(alpha)],
+                  [zero, np.sin(alpha),  np.cos(alpha)],
+                  ])
+
+    Ry = np.array([
+                  [np.cos(beta),  zero, np.sin(beta)],
+                  [zero,           one,         zero],
+                  [-np.sin(beta), zero, np.cos(beta)],
+                  ])
+
+    Rz = np.array([
+                  [np.cos(gamma), -np.sin(gamma), zero],
+                  [np.sin(gamma),  np.cos(gamma), zero],
+                  [zero,          zero,            one],
+                  ])
+    # move the matrix axes to the end for stacks of angles
+    Rx, Ry, Rz = [np.moveaxis(rr, (0, 1), (-2, -1)) for rr in [Rx, Ry, Rz]]
+    return np.matmul(np.matmul(Ry, Rz), Rx)
@@ -33,19 +33,73 @@ class Sphere(BaseElement):
     def center(self):
         return self.points[0]
 
-    def draw(self, grid_size, pixel_size):
-        ri = np.ones(grid_size, dtype=float) * self.medium_index
-        fl = np.zeros(grid_size, dtype=float)
-        center = np.array(grid_size) / 2 - .5
-        x = (np.arange(grid_size[0]) - center[0]) * pixel_size
-        y = (np.arange(grid_size[1]) - center[1]) * pixel_size
-        z = (np.arange(grid_size[2]) - center[2]) * pixel_size
-
-        xx, yy, zz = np.meshgrid(x, y, z, indexing="ij", sparse=True)
-        cy, cz, cx = self.center
-
-        volume = (cx-xx)**2 + (cy-yy)**2 + (cz-zz)**2
-        inside = volume <= self.radius**2
-        ri[inside] = self.object_index
-        fl[inside] = self.fl_brightness
+    def draw(self, grid_size, pixel_size, dtype=float):
+        ri = np.full(grid_size, self.medium_index, dtype=dtype)
+        fl = np.zeros(grid_size, dtype=dtype)
+        roi, inside = self.get_inside(grid_size, pixel_size)
+        ri[roi][inside] = self.object_index
+        fl[roi][inside] = self.fl_brightness
         return ri, fl
+
+    def draw_into(self, ri, fl, pixel_size):
+        roi, inside = self.get_inside(ri.shape, pixel_size)
+        ri[roi][inside] += self.object_index - self.medium_index
+        fl[roi][inside] += self.fl_brightness
+
+    def get_inside(self, grid_size, pixel_size):
+        """Return the voxels of a volume that are inside the sphere
+
+        Only the bounding box of the sphere is evaluated.
+
+        Parameters
+        ----------
+        grid_size: tuple of ints
+            Size of the volume [px]
+        pixel_size: float
+            Pixel size [m]
+
+        Returns
+        -------
+        roi: tuple of slices
+            Bounding box of the sphere within the volume
+        inside: 3d boolean ndarray
+            Voxels within `roi` that are inside the sphere
+        """
+        return sphere_inside(center=self.center,
+                             radius=self.radius,
+                             grid_size=grid_size,
+                             pixel_size=pixel_size)
+
+
+def sphere_inside(center, radius, grid_size, pixel_size):
+    """Voxels of a volume inside a sphere (see :func:`Sphere.get_inside`)
+
+    Parameters
+    ----------
+    center: list-like
+        Center coordinates (x, y, z) of the sphere [m]
+    radius: float
+        Radius of the sphere [m]
+    grid_size: tuple of ints
+        Size of the volume [px]
+    pixel_size: float
+        Pixel size [m]
+    """
+    gcenter = np.array(grid_size) / 2 - .5
+    # ODTbrain convention
+    cy, cz, cx = center
+    roi = []
+    coords = []
+    for ii, cc in enumerate([cx, cy, cz]):
+        # one pixel margin to account for rounding errors
+        start = int(np.floor(gcenter[ii] + (cc-radius)/pixel_size))
+        stop = int(np.ceil(gcenter[ii] + (cc+radius)/pixel_size))
+        start = min(max(start - 1, 0), grid_size[ii])
+        stop = min(max(stop + 2, 0), grid_size[ii])
+        roi.append(slice(start, stop))
+        coords.append((np.arange(start, stop) - gcenter[ii]) * pixel_size)
+
+    xx, yy, zz = np.meshgrid(*coords, indexing="ij", sparse=True)
+    volume = (cx-xx)**2 + (cy-yy)**2 + (cz-zz)**2
+    inside = volume <= radius**2
+    return tuple(roi), inside
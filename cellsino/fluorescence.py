@@ -1,15 +1,41 @@
-import flimage
 import numpy as np
 
+from . import profiling
+from .cache import MemoryCache, _module_caches, element_key
 from .elements import Sphere
+from .elements.base_element import rotation_matrix
+from .fourier import slice_spectrum, volume_spectrum
+from .phantoms.sphere_collection import SphereCollection
 
 
 class Fluorescence(object):
 
     def __init__(self, phantom, grid_size, pixel_size, displacement=(0, 0),
-                 bleach_factor=1, background=0):
+                 bleach_factor=1, background=0, element_cache=None,
+                 dtype=float):
         """Fluorescence projector
 
+        Parameters
+        ----------
+        phantom: cellsino.phantoms.base_phantom.BasePhantom
+            Phantom (in the coordinates of the detector)
+        grid_size: tuple of ints
+            Detector grid size [px]
+        pixel_size: float
+            Pixel size [m]
+        displacement: tuple of floats
+            Lateral displacement of the phantom [px]
+        bleach_factor: float
+            Photobleaching factor
+        background: float
+            Fluorescence background signal
+        element_cache: cellsino.cache.ElementCache or None
+            If set, the fluorescence of elements with parameters that
+            occur in several frames is computed only once.
+        dtype: dtype
+            Floating point type of the computation (e.g.
+            `np.float32` for single precision)
+
         Notes
         -----
         - The origin of the coordinate system is the center of the grid.
@@ -24,38 +50,439 @@ class Fluorescence(object):
         self.center = np.array([gx, gy, 0]) / 2 - .5
         self.center[0] += displacement[0]
         self.center[1] += displacement[1]
+        self.displacement = tuple(displacement)
         #: bleaching factor (image is multiplied by this factor
         #: to simulate photobleaching)
         self.bleach_factor = bleach_factor
         self.background = background
+        self.element_cache = element_cache
+        #: floating point type of the computation
+        self.dtype = np.dtype(dtype)
 
     def project(self):
-        fluor = np.zeros(self.grid_size, dtype=float)
-        for element in self.phantom:
-            if isinstance(element, Sphere):
-                fluor += self.project_sphere(element)
-
+        """Compute the fluorescence and return it as a
+        :class:`flimage.FLImage`"""
+        import flimage
         flifull = flimage.FLImage(
-                    data=fluor * self.bleach_factor + self.background,
+                    data=self.project_array(),
                     meta_data={
                         "pixel size": self.pixel_size,
                         }
                     )
         return flifull
 
-    def project_sphere(self, sphere):
+    def project_array(self):
+        """Compute the fluorescence image as a 2d ndarray"""
+        fluor = np.zeros(self.grid_size, dtype=self.dtype)
+        if self.element_cache is None:
+            # directly use the sphere parameters
+            points, radii, brightness = _sphere_arrays(self.phantom)
+            centers = self.center + points / self.pixel_size
+            for jj in range(radii.size):
+                with profiling.stage("project_sphere", "Sphere"):
+                    _project_circle(center=centers[jj, :2],
+                                    radius=radii[jj] / self.pixel_size,
+                                    brightness=brightness[jj],
+                                    out=fluor)
+            fluor *= self.bleach_factor
+            fluor += self.background
+            return fluor
+        for element in self.phantom:
+            if isinstance(element, Sphere):
+                fluor += self.element_cache.get_contribution(
+                    element=element,
+                    displacement=self.displacement,
+                    settings=(self.__class__.__name__,
+                              self.pixel_size,
+                              tuple(self.grid_size),
+                              self.dtype.str),
+                    func=lambda: self.project_sphere(element))
+        fluor *= self.bleach_factor
+        fluor += self.background
+        return fluor
+
+    def project_sphere(self, sphere, out=None):
+        """Compute the fluorescence projection of a sphere
+
+        Only the bounding box of the sphere is evaluated.
+
+        Parameters
+        ----------
+        sphere: cellsino.elements.Sphere
+            Sphere element
+        out: 2d ndarray or None
+            If given, the projection is added to this array in-place.
+
+        Returns
+        -------
+        fluor: 2d ndarray
+            Fluorescence projection (`out` if given)
+        """
         center = self.center + sphere.center/self.pixel_size
+        if out is None:
+            out = np.zeros(self.grid_size, dtype=self.dtype)
+        with profiling.stage("project_sphere", sphere):
+            _project_circle(center=center[:2],
+                            radius=sphere.radius / self.pixel_size,
+                            brightness=sphere.fl_brightness,
+                            out=out)
+        return out
+
+
+def project_angles(phantom, angles, grid_size, pixel_size, axis_roll=0,
+                   displacements=None, bleach_factors=1, background=0,
+                   max_bytes=2**26, element_cache=None, dtype=float):
+    """Compute fluorescence projections for many angles at once
+
+    This is a vectorized version of :func:`Fluorescence.project_array`
+    for a stack of rotational positions of `phantom`. The sphere
+    centers are rotated for all angles at once and the chord-length
+    images are computed for chunks of frames with NumPy broadcasting.
+    Spheres that are at the same lateral position in several frames
+    of a chunk (e.g. spheres on the rotational axis) are projected
+    only once. Use `element_cache` to reuse these projections across
+    calls (e.g. for the chunks of :func:`cellsino.Sinogram.iter_frames`).
+
+    Parameters
+    ----------
+    phantom: cellsino.phantoms.base_phantom.BasePhantom
+        Phantom (not transformed)
+    angles: 1d ndarray of size N
+        Rotational positions (`rot_main`) [rad]
+    grid_size: tuple of ints
+        Detector grid size [px]
+    pixel_size: float
+        Pixel size [m]
+    axis_roll: float
+        In-plane rotation of the rotational axis [rad]
+    displacements: 2d ndarray of shape (N, 2) or None
+        Lateral displacement of each frame [px]
+    bleach_factors: float or 1d ndarray of size N
+        Photobleaching factor of each frame
+    background: float
+        Fluorescence background signal
+    max_bytes: int
+        Approximate upper limit for the size of the temporary
+        arrays [bytes]; frames are processed in chunks accordingly.
+    element_cache: cellsino.cache.ElementCache or None
+        If set, the projections of spheres with parameters that
+        occur in several frames are taken from this cache (see
+        :func:`BasePhantom.find_repeated_elements`).
+    dtype: dtype
+        Floating point type of the computation (e.g. `np.float32`
+        for single precision)
+
+    Returns
+    -------
+    fluor: 3d ndarray of shape (N, gx, gy)
+        Fluorescence projections
+    """
+    angles = np.atleast_1d(angles)
+    num = angles.size
+    gx, gy = grid_size
+    if displacements is None:
+        displacements = np.zeros((num, 2))
+    bleach_factors = np.broadcast_to(bleach_factors, (num,))
+
+    dtype = np.dtype(dtype)
+    points, radii, brightness = _sphere_arrays(phantom)
+    fluor = np.zeros((num, gx, gy), dtype=dtype)
+    if radii.size:
+        # rotated sphere centers (N, M, 3)
+        rot = rotation_matrix(rot_main=angles, rot_in_plane=axis_roll)
+        rotated = np.matmul(rot, points.T).swapaxes(1, 2)
+        if element_cache is None:
+            cached = np.zeros(rotated.shape[:2], dtype=bool)
+        else:
+            cached = element_cache.find_candidates(
+                centers=rotated, displacements=displacements)
+        # sphere centers in pixels
+        centers = rotated / pixel_size
+        centers[:, :, :2] += np.array([gx, gy]) / 2 - .5
+        centers[:, :, :2] += displacements[:, np.newaxis, :]
+        centers = centers.astype(dtype)
+
+        x = np.arange(gx, dtype=dtype).reshape(1, -1, 1)
+        y = np.arange(gy, dtype=dtype).reshape(1, 1, -1)
+
+        def project(jj, lateral, out):
+            with profiling.stage("project_sphere", "Sphere"):
+                _project_sphere_chunk(
+                    out=out,
+                    cx=lateral[:, 0].reshape(-1, 1, 1),
+                    cy=lateral[:, 1].reshape(-1, 1, 1),
+                    radius=dtype.type(radii[jj] / pixel_size),
+                    brightness=dtype.type(brightness[jj]),
+                    x=x,
+                    y=y)
+            return out
+
+        # three temporary arrays of shape (chunk, gx, gy)
+        chunk = max(1, int(max_bytes // (3 * dtype.itemsize * gx * gy)))
+        for start in range(0, num, chunk):
+            stop = min(start + chunk, num)
+            if np.any(cached[start:stop]):
+                spheres = _transformed_spheres(
+                    phantom, angles[start:stop], axis_roll)
+            for jj in range(radii.size):
+                for ii in np.where(cached[start:stop, jj])[0]:
+                    fluor[start + ii] += element_cache.get_contribution(
+                        element=spheres[ii][jj],
+                        displacement=displacements[start + ii],
+                        settings=("project_angles",
+                                  pixel_size,
+                                  tuple(grid_size),
+                                  dtype.str),
+                        func=lambda: project(
+                            jj,
+                            centers[start + ii, jj, :2].reshape(1, 2),
+                            np.zeros((1, gx, gy), dtype=dtype))[0])
+                frames = np.where(~cached[start:stop, jj])[0] + start
+                if frames.size == 0:
+                    continue
+                # The projection of a sphere only depends on its lateral
+                # position. Positions that occur in several frames
+                # (e.g. spheres on the rotational axis) are computed
+                # only once.
+                lateral = centers[frames, jj, :2]
+                inverse = None
+                if frames.size > 1:
+                    unique, indices = np.unique(lateral, axis=0,
+                                                return_inverse=True)
+                    if unique.shape[0] < frames.size:
+                        lateral = unique
+                        inverse = indices.reshape(-1)
+                if inverse is None and frames.size == stop - start:
+                    project(jj, lateral, fluor[start:stop])
+                else:
+                    out = project(jj, lateral, np.zeros(
+                        (lateral.shape[0], gx, gy), dtype=dtype))
+                    if inverse is not None:
+                        out = out[inverse]
+                    fluor[frames] += out
+    fluor *= bleach_factors.reshape(-1, 1, 1)
+    fluor += background
+    return fluor
+
+
+def project_angles_fourier(phantom, angles, grid_size, pixel_size,
+                           axis_roll=0, displacements=None, bleach_factors=1,
+                           background=0, element_cache=None, dtype=float):
+    """Compute fluorescence projections with the Fourier slice theorem
+
+    The fluorescence volume of `phantom` is rasterized with
+    :func:`BasePhantom.draw` in a cube with the side length of
+    the largest grid size and projected with
+    :class:`FourierSliceProjector`. The projector is cached for
+    subsequent calls with the same phantom (see
+    :func:`cellsino.cache.clear_caches`). The parameters are
+    the same as in :func:`project_angles`; `element_cache` is
+    ignored.
+    """
+    dtype = np.dtype(dtype)
+    size = int(np.max(grid_size))
+    key = (tuple(element_key(el) for el in phantom),
+           pixel_size,
+           size,
+           dtype.str)
+
+    def create_projector():
+        _, fl = phantom.draw(grid_size=(size, size, size),
+                             pixel_size=pixel_size,
+                             dtype=dtype)
+        return FourierSliceProjector(volume=fl, pixel_size=pixel_size)
+
+    projector = _projectors.get(key, create_projector)
+    return projector.project_angles(angles=angles,
+                                    grid_size=grid_size,
+                                    axis_roll=axis_roll,
+                                    displacements=displacements,
+                                    bleach_factors=bleach_factors,
+                                    background=background)
+
+
+class FourierSliceProjector(object):
+    def __init__(self, volume, pixel_size, upsampling=2):
+        """Fluorescence projector for voxel volumes (Fourier slice theorem)
+
+        The 3D Fourier transform of the volume is computed once.
+        The projection at each rotational position is obtained
+        by interpolating the central slice perpendicular to the
+        optical axis and by a 2D inverse FFT.
+
+        Parameters
+        ----------
+        volume: 3d ndarray
+            Fluorescence volume, e.g. as returned by
+            :func:`BasePhantom.draw` (ODTbrain convention); the
+            origin is at the center of the volume. Single-precision
+            volumes are projected in single precision.
+        pixel_size: float
+            Voxel size (same as the detector pixel size) [m]
+        upsampling: float
+            The volume is zero-padded to a cube with `upsampling`
+            times its largest side length to reduce interpolation
+            errors in Fourier space.
+
+        Notes
+        -----
+        Since the projections are band-limited, sharp edges exhibit
+        ringing (Gibbs phenomenon), i.e. the projections may contain
+        small negative values.
+        """
+        # ODTbrain convention (z, x, y) to (x, y, z)
+        volume = np.asarray(volume)
+        if volume.dtype != np.float32:
+            volume = volume.astype(float)
+        volume = volume.transpose(1, 2, 0)
+        size = int(np.ceil(upsampling * np.max(volume.shape)))
+        self.pixel_size = pixel_size
+        #: spectrum and offset (see :func:`cellsino.fourier.volume_spectrum`)
+        self.spectrum, self.offset = volume_spectrum(volume, size=size)
+
+    @property
+    def nbytes(self):
+        """Memory size of the spectrum [bytes]"""
+        return self.spectrum.nbytes
+
+    def project_angles(self, angles, grid_size, axis_roll=0,
+                       displacements=None, bleach_factors=1, background=0):
+        """Compute fluorescence projections for many angles
+
+        See :func:`project_angles` for a description of the parameters.
+        """
+        angles = np.atleast_1d(angles)
+        num = angles.size
+        gx, gy = grid_size
+        px = self.pixel_size
+        if displacements is None:
+            displacements = np.zeros((num, 2))
+        bleach_factors = np.broadcast_to(bleach_factors, (num,))
+        # detector frequencies in the central slice (M, 3)
+        kx = 2 * np.pi * np.fft.fftfreq(gx, d=px).reshape(-1, 1)
+        ky = 2 * np.pi * np.fft.fftfreq(gy, d=px).reshape(1, -1)
+        kx, ky = np.broadcast_arrays(kx, ky)
+        kvec = np.stack([kx.flatten(), ky.flatten(), np.zeros(kx.size)],
+                        axis=1)
+        # frequencies in the coordinates of the volume (N, M, 3)
+        rot = rotation_matrix(rot_main=angles, rot_in_plane=axis_roll)
+        rot = rot.reshape(-1, 3, 3)
+        kvec = np.einsum("nji,mj->nmi", rot, kvec)
+        values = slice_spectrum(spectrum=self.spectrum,
+                                offset=self.offset,
+                                kvec=kvec,
+                                pixel_size=px).reshape(num, gx, gy)
+        # origin and lateral displacement of the detector
+        center = np.array([gx, gy]) / 2 - .5 + displacements
+        cx = center[:, 0].reshape(-1, 1, 1)
+        cy = center[:, 1].reshape(-1, 1, 1)
+        values *= np.exp(-1j * px * (kx * cx + ky * cy))
+        # projection in units of pixels (see :func:`project_angles`)
+        fluor = np.fft.ifft2(values).real.astype(self.spectrum.real.dtype,
+                                                 copy=False) / px**3
+        fluor *= bleach_factors.reshape(-1, 1, 1)
+        fluor += background
+        return fluor
+
+
+def _bounding_box(center, radius, grid_size, extent=(0, 0)):
+    """Pixel bounding box of a circle (or of a circle moving within
+    a rectangle of size `extent`), clipped to the grid
+
+    Returns
+    -------
+    (x0, x1), (y0, y1): tuples of ints
+        Start and stop indices along both axes
+    """
+    bbox = []
+    for cc, ee, size in zip(center, extent, grid_size):
+        # one pixel margin to account for rounding errors
+        start = int(np.floor(cc - radius)) - 1
+        stop = int(np.ceil(cc + ee + radius)) + 2
+        bbox.append((min(max(start, 0), size), min(max(stop, 0), size)))
+    return bbox
+
+
+def _transformed_spheres(phantom, angles, axis_roll):
+    """Return the transformed spheres of `phantom` for each angle
+
+    The order of the spheres is the same as in :func:`_sphere_arrays`.
+    """
+    spheres = []
+    for ang in angles:
+        ph = phantom.transform(rot_main=ang, rot_in_plane=axis_roll)
+        if not isinstance(ph, SphereCollection):
+            ph = [el for el in ph if isinstance(el, Sphere)]
+        spheres.append(ph)
+    return spheres
+
+
+def _project_sphere_chunk(out, cx, cy, radius, brightness, x, y):
+    """Add the chord-length images of a sphere to a stack of frames
+
+    Parameters
+    ----------
+    out: 3d ndarray of shape (N, gx, gy)
+        Fluorescence frames (modified in-place)
+    cx, cy: 3d ndarrays of shape (N, 1, 1)
+        Sphere center in each frame [px]
+    radius: float
+        Sphere radius [px]
+    brightness: float
+        Fluorescence brightness of the sphere
+    x, y: 3d ndarrays of shape (1, gx, 1) and (1, 1, gy)
+        Pixel coordinates
+    """
+    # bounding box of the sphere in all frames
+    (x0, x1), (y0, y1) = _bounding_box(
+        center=(cx.min(), cy.min()),
+        radius=radius,
+        grid_size=out.shape[1:],
+        extent=(cx.max() - cx.min(), cy.max() - cy.min()))
+    if x0 < x1 and y0 < y1:
+        r = radius**2 - (x[:, x0:x1] - cx)**2 - (y[:, :, y0:y1] - cy)**2
+        np.maximum(r, 0, out=r)
+        out[:, x0:x1, y0:y1] += 2 * np.sqrt(r) * brightness
+
+
+def _sphere_arrays(phantom):
+    """Return the centers (M, 3), radii, and fluorescence brightness
+    values of all spheres in `phantom` as arrays"""
+    if isinstance(phantom, SphereCollection):
+        return phantom.centers, phantom.radii, phantom.fl_brightness
+    spheres = [el for el in phantom if isinstance(el, Sphere)]
+    points = np.array([sp.center for sp in spheres]).reshape(-1, 3)
+    radii = np.array([sp.radius for sp in spheres], dtype=float)
+    brightness = np.array([sp.fl_brightness for sp in spheres], dtype=float)
+    return points, radii, brightness
+
+
+def _project_circle(center, radius, brightness, out):
+    """Add the chord-length image of a sphere to `out` (in pixels)"""
+    cx, cy = center
+    (x0, x1), (y0, y1) = _bounding_box(center=(cx, cy),
+                                       radius=radius,
+                                       grid_size=out.shape)
+    if x0 < x1 and y0 < y1:
         # grid
-        x = np.arange(self.grid_size[0]).reshape(-1, 1)
-        y = np.arange(self.grid_size[1]).reshape(1, -1)
-        cx, cy, _ = center
-        # sphere location
-        rpx = sphere.radius / self.pixel_size
-        r = rpx**2 - (x - cx)**2 - (y - cy)**2
+        dtype = out.dtype.type
+        x = np.arange(x0, x1, dtype=dtype).reshape(-1, 1)
+        y = np.arange(y0, y1, dtype=dtype).reshape(1, -1)
+        r = dtype(radius)**2 - (x - dtype(cx))**2 - (y - dtype(cy))**2
         # distance
         z = np.zeros_like(r)
         rvalid = r > 0
         z[rvalid] = 2 * np.sqrt(r[rvalid])
+        out[x0:x1, y0:y1] += z * dtype(brightness)
 
-        fluor = z * sphere.fl_brightness
-        return fluor
+
+#: cache for :class:`FourierSliceProjector` instances
+#: (see :func:`cellsino.cache.clear_caches`)
+_projectors = MemoryCache(maxsize=2, max_bytes=2**31)
+_module_caches.append(_projectors)
+
+#: fluorescence projectors for sinogram computation
+proj_dict = {
+    "analytic": project_angles,
+    "fourier-slice": project_angles_fourier,
+}
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def volume_spectrum(volume, size):
+    """Return the 3D Fourier transform of a zero-padded volume
+
+    Parameters
+    ----------
+    volume: 3d ndarray
+        Real-valued volume with axes (x, y, z); its origin is
+        located at ``np.array(volume.shape) / 2 - .5``. The
+        precision of `volume` (float32 or float64) is retained.
+    size: int
+        Side length of the zero-padded cube that is transformed;
+        must not be smaller than any axis of `volume`.
+
+    Returns
+    -------
+    spectrum: 3d complex ndarray
+        Real-to-complex FFT with the zero frequency at the center
+        of the first two axes (and at the first element of the last
+        axis), i.e. the format expected by :func:`slice_spectrum`
+    offset: 1d ndarray of size 3
+        Position [px] of the first voxel of the (shifted) cube
+        relative to the origin of `volume` (see
+        :func:`slice_spectrum`)
+    """
+    shape = np.array(volume.shape)
+    start = (size - shape) // 2
+    cube = np.zeros((size, size, size), dtype=volume.dtype)
+    cube[start[0]:start[0]+shape[0],
+         start[1]:start[1]+shape[1],
+         start[2]:start[2]+shape[2]] = volume
+    # move the voxel at index `size // 2` to the first voxel
+    spec = np.fft.rfftn(np.fft.ifftshift(cube))
+    # NumPy < 2 always computes the FFT in double precision
+    spec = spec.astype(np.result_type(cube.dtype, np.complex64), copy=False)
+    offset = size // 2 - (start + shape / 2 - .5)
+    return np.fft.fftshift(spec, axes=(0, 1)), offset
+
+
+def slice_spectrum(spectrum, offset, kvec, pixel_size):
+    """Interpolate the continuous Fourier transform of a volume
+
+    Parameters
+    ----------
+    spectrum: 3d complex ndarray
+        Spectrum of a cube computed with :func:`volume_spectrum`
+    offset: 1d ndarray of size 3
+        Offset returned by :func:`volume_spectrum`
+    kvec: ndarray of shape (..., 3)
+        Angular frequencies (kx, ky, kz) [rad/m] at which the
+        spectrum is evaluated
+    pixel_size: float
+        Voxel size [m]
+
+    Returns
+    -------
+    values: complex ndarray of shape ``kvec.shape[:-1]``
+        Fourier transform at `kvec` (trilinear interpolation) in
+        units of the volume times the voxel volume [m³]
+
+    Notes
+    -----
+    Frequencies outside of the sampled band are set to zero.
+    """
+    from scipy import ndimage
+
+    size = spectrum.shape[0]
+    kvec = np.asarray(kvec, dtype=float)
+    shape = kvec.shape[:-1]
+    kvec = kvec.reshape(-1, 3)
+    # The spectrum of a real volume is Hermitian; only the half
+    # with non-negative frequencies along the last axis is stored.
+    sign = np.where(kvec[:, 2] < 0, -1, 1)
+    coords = kvec * sign[:, np.newaxis] * pixel_size * size / (2 * np.pi)
+    coords[:, :2] += size // 2
+    values = ndimage.map_coordinates(spectrum.real, coords.T, order=1,
+                                     mode="constant", cval=0) \
+        + 1j * ndimage.map_coordinates(spectrum.imag, coords.T, order=1,
+                                       mode="constant", cval=0)
+    values.imag *= sign
+    # position of the first voxel relative to the origin
+    values *= np.exp(-1j * pixel_size * np.dot(kvec, offset))
+    return values.reshape(shape) * pixel_size**3
@@ -0,0 +1,151 @@
+import json
+import pathlib
+
+import numpy as np
+
+
+#: identifies raw frame store files
+MAGIC = b"CSFRAMES"
+#: size of the file header in bytes (the frame data start here)
+HEADER_SIZE = 256
+#: version of the frame store format
+VERSION = 1
+
+
+class FrameStore(object):
+    def __init__(self, path, mode="r"):
+        """Raw memory-mapped stack of frames on disk
+
+        The file consists of a header of :data:`HEADER_SIZE` bytes
+        followed by the uncompressed frame data in C order:
+
+        - bytes 0-7: :data:`MAGIC`
+        - bytes 8-15: number of frames written (little-endian uint64)
+        - bytes 16-255: JSON object with the keys "version",
+          "dtype", and "shape" (capacity, gx, gy), padded with spaces
+
+        Frames can only be appended. The frame counter in the header
+        is incremented after the frame data are flushed, such that
+        the file can be read (e.g. by another process) while it is
+        still being written.
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Path to an existing frame store (see :func:`create`)
+        mode: str
+            "r" for reading or "r+" for appending frames
+
+        Notes
+        -----
+        A frame store can be passed as `out_field` or
+        `out_fluorescence` to :func:`cellsino.Sinogram.compute`
+        to compute sinograms that do not fit into memory.
+        """
+        if mode not in ["r", "r+"]:
+            raise ValueError("Invalid mode: '{}'".format(mode))
+        self.path = pathlib.Path(path)
+        self.mode = mode
+        with self.path.open("rb") as fd:
+            header = fd.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE or header[:8] != MAGIC:
+            raise ValueError("'{}' is not a frame store!".format(path))
+        info = json.loads(header[16:].decode("ascii"))
+        if info["version"] > VERSION:
+            raise ValueError("Unsupported frame store version: "
+                             + "{}".format(info["version"]))
+        #: data type of the frames
+        self.dtype = np.dtype(info["dtype"])
+        #: maximum number of frames
+        self.capacity = info["shape"][0]
+        #: shape of a single frame
+        self.frame_shape = tuple(info["shape"][1:])
+        self._count = np.memmap(self.path, dtype="<u8", mode=mode,
+                                offset=8, shape=(1,))
+        #: memory-mapped frame data (including unwritten frames)
+        self.data = np.memmap(self.path, dtype=self.dtype, mode=mode,
+                              offset=HEADER_SIZE,
+                              shape=tuple(info["shape"]))
+
+    def __array__(self, dtype=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getitem__(self, index):
+        return self.data[:len(self)][index]
+
+    def __len__(self):
+        return int(self._count[0])
+
+    def __setitem__(self, index, frame):
+        if index != len(self):
+            raise ValueError("Frames must be written in order (expected "
+                             + "index {}, got {})!".format(len(self), index))
+        self.append(frame)
+
+    @property
+    def shape(self):
+        """Shape of the frames written so far"""
+        return (len(self),) + self.frame_shape
+
+    @classmethod
+    def create(cls, path, shape, dtype=float):
+        """Create an empty frame store
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Output file (overwritten if it exists)
+        shape: tuple of int
+            Capacity and frame shape (N, gx, gy)
+        dtype: dtype
+            Data type of the frames
+
+        Returns
+        -------
+        store: FrameStore
+            The frame store opened in "r+" mode
+        """
+        dtype = np.dtype(dtype)
+        shape = tuple(int(ss) for ss in shape)
+        info = json.dumps({"version": VERSION,
+                           "dtype": dtype.str,
+                           "shape": shape}).encode("ascii")
+        if len(info) > HEADER_SIZE - 16:
+            raise ValueError("Frame store header too large!")
+        path = pathlib.Path(path)
+        with path.open("wb") as fd:
+            fd.write(MAGIC)
+            fd.write(np.zeros(1, dtype="<u8").tobytes())
+            fd.write(info.ljust(HEADER_SIZE - 16))
+            # allocate the (sparse) frame data
+            fd.truncate(HEADER_SIZE + int(np.prod(shape)) * dtype.itemsize)
+        return cls(path, mode="r+")
+
+    def append(self, frame):
+        """Write the next frame and update the frame counter"""
+        num = len(self)
+        if num >= self.capacity:
+            raise ValueError("Frame store is full ({} frames)!".format(num))
+        self.data[num] = frame
+        self.data.flush()
+        self._count[0] = num + 1
+        self._count.flush()
+
+    def close(self):
+        """Flush the data and release the memory maps"""
+        if self.mode == "r+":
+            self.data.flush()
+            self._count.flush()
+        self.data = None
+        self._count = None
+
+    def flush(self):
+        """Write all changes to disk"""
+        self.data.flush()
+        self._count.flush()
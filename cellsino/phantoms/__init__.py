@@ -1,4 +1,5 @@
 from .ph_simple_cell import SimpleCell
+from .sphere_collection import SphereCollection  # noqa: F401
 
 phan_dict = {
     "simple cell": SimpleCell,
@@ -1,5 +1,9 @@
+import collections
+
 import numpy as np
 
+from ..cache import element_key
+
 
 class BasePhantom(object):
     def __init__(self, medium_index):
@@ -13,16 +17,44 @@ class BasePhantom(object):
     def append(self, element):
         self.elements.append(element)
 
-    def draw(self, grid_size, pixel_size):
-        ri = np.ones(grid_size, dtype=float) * self.medium_index
-        fl = np.zeros(grid_size, dtype=float)
+    def draw(self, grid_size, pixel_size, dtype=float):
+        ri = np.full(grid_size, self.medium_index, dtype=dtype)
+        fl = np.zeros(grid_size, dtype=dtype)
 
         for el in self:
-            riel, flel = el.draw(grid_size, pixel_size)
-            ri += riel - el.medium_index
-            fl += flel
+            el.draw_into(ri, fl, pixel_size)
         return ri, fl
 
+    def find_repeated_elements(self, angles, axis_roll=0,
+                               displacements=None):
+        """Find elements that have the same parameters in several frames
+
+        Parameters
+        ----------
+        angles: 1d ndarray of size N
+            Rotational positions (`rot_main`) [rad]
+        axis_roll: float
+            In-plane rotation of the rotational axis [rad]
+        displacements: 2d ndarray of shape (N, 2) or None
+            Lateral displacement of each frame [px]
+
+        Returns
+        -------
+        keys: set
+            Keys ``(element_key(element), displacement)`` of the
+            transformed elements that occur in more than one frame
+            (see :class:`cellsino.cache.ElementCache`)
+        """
+        angles = np.atleast_1d(angles)
+        if displacements is None:
+            displacements = np.zeros((angles.size, 2))
+        counter = collections.Counter()
+        for ang, displacement in zip(angles, displacements):
+            ph = self.transform(rot_main=ang, rot_in_plane=axis_roll)
+            for element in ph:
+                counter[(element_key(element), tuple(displacement))] += 1
+        return set(key for key in counter if counter[key] > 1)
+
     def transform(self, x=0, y=0, z=0, rot_main=0, rot_in_plane=0,
                   rot_perp_plane=0):
         ph = BasePhantom(medium_index=self.medium_index)
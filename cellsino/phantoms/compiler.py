@@ -0,0 +1,86 @@
+import collections
+
+from ..elements import Sphere
+from .base_phantom import BasePhantom
+from .sphere_collection import SphereCollection
+
+
+def compile_phantom(phantom, mode, merge=False):
+    """Prepare a phantom for the computation of one imaging modality
+
+    Elements that do not contribute to the modality are removed:
+    elements whose refractive index equals the medium index
+    (``mode="field"``) or elements without fluorescence
+    (``mode="fluorescence"``). Phantoms that consist only of spheres
+    with the medium index of the phantom are converted to a
+    :class:`SphereCollection`, such that the sphere parameters are
+    stored in arrays and transformed at once for each frame.
+
+    Parameters
+    ----------
+    phantom: cellsino.phantoms.base_phantom.BasePhantom
+        Phantom (not modified)
+    mode: str
+        Imaging modality ("field" or "fluorescence")
+    merge: bool
+        If True, spheres with the same center, radius, and medium
+        index are merged into a single sphere with the sum of their
+        refractive index contrasts and fluorescence brightness values.
+        This is only valid if the contributions of the spheres add
+        up, i.e. for the fluorescence and for the propagators with
+        :data:`BasePropagator.additive_contrast` set.
+
+    Returns
+    -------
+    compiled: cellsino.phantoms.base_phantom.BasePhantom
+        Phantom with the same contribution to the modality as
+        `phantom`; the order of the remaining elements is kept.
+    """
+    if mode not in ["field", "fluorescence"]:
+        raise ValueError("Invalid mode: `{}`".format(mode))
+    elements = list(phantom)
+    if merge:
+        elements = _merge_spheres(elements)
+    if mode == "field":
+        elements = [el for el in elements
+                    if el.object_index != el.medium_index]
+    else:
+        elements = [el for el in elements if el.fl_brightness != 0]
+
+    compiled = BasePhantom(medium_index=phantom.medium_index)
+    for el in elements:
+        compiled.append(el)
+    if all(isinstance(el, Sphere)
+           and el.medium_index == phantom.medium_index
+           for el in elements):
+        compiled = SphereCollection.from_phantom(compiled)
+    return compiled
+
+
+def _merge_spheres(elements):
+    """Merge spheres with the same center, radius, and medium index
+
+    The merged sphere takes the place of the first of these
+    spheres; other elements are not modified.
+    """
+    groups = collections.OrderedDict()
+    for ii, el in enumerate(elements):
+        if isinstance(el, Sphere):
+            key = (tuple(el.center), el.radius, el.medium_index)
+        else:
+            key = ii
+        groups.setdefault(key, []).append(el)
+    merged = []
+    for group in groups.values():
+        if len(group) == 1:
+            merged.append(group[0])
+        else:
+            medium_index = group[0].medium_index
+            contrast = sum(el.object_index - medium_index for el in group)
+            merged.append(Sphere(
+                object_index=medium_index + contrast,
+                medium_index=medium_index,
+                fl_brightness=sum(el.fl_brightness for el in group),
+                center=group[0].center,
+                radius=group[0].radius))
+    return merged
@@ -0,0 +1,180 @@
+import numpy as np
+
+from ..cache import element_key
+from ..elements import Sphere
+from ..elements.base_element import rotation_matrix
+from ..elements.el_sphere import sphere_inside
+from .base_phantom import BasePhantom
+
+
+class SphereCollection(BasePhantom):
+    def __init__(self, centers, radii, object_index, fl_brightness,
+                 medium_index):
+        """Phantom consisting of many spheres stored in arrays
+
+        In contrast to :class:`BasePhantom`, which stores a list
+        of element instances, the parameters of all spheres are
+        stored in contiguous arrays. This allows to efficiently
+        handle phantoms with thousands of spheres.
+
+        Parameters
+        ----------
+        centers: 2d ndarray of shape (M, 3)
+            Center coordinates (x, y, z) of the spheres [m]
+        radii: 1d ndarray of size M or float
+            Radii of the spheres [m]
+        object_index: 1d ndarray of size M or float
+            Refractive indices of the spheres
+        fl_brightness: 1d ndarray of size M or float
+            Fluorescence brightness of the spheres
+        medium_index: float
+            Refractive index of the surrounding medium
+
+        Notes
+        -----
+        Iterating over a sphere collection yields instances of
+        :class:`cellsino.elements.Sphere`, such that collections
+        can be used wherever a :class:`BasePhantom` is expected.
+        """
+        self.medium_index = medium_index
+        #: sphere centers (x, y, z) [m]
+        self.centers = np.array(centers, dtype=float).reshape(-1, 3)
+        size = self.centers.shape[0]
+        #: sphere radii [m]
+        self.radii = _as_array(radii, size)
+        #: sphere refractive indices
+        self.object_index = _as_array(object_index, size)
+        #: sphere fluorescence brightness values
+        self.fl_brightness = _as_array(fl_brightness, size)
+
+    def __iter__(self):
+        for ii in range(len(self)):
+            yield self[ii]
+
+    def __getitem__(self, index):
+        return Sphere(object_index=self.object_index[index],
+                      medium_index=self.medium_index,
+                      fl_brightness=self.fl_brightness[index],
+                      center=self.centers[index],
+                      radius=self.radii[index])
+
+    def __len__(self):
+        return self.centers.shape[0]
+
+    @property
+    def elements(self):
+        """List of :class:`cellsino.elements.Sphere` instances"""
+        return list(self)
+
+    @classmethod
+    def from_phantom(cls, phantom):
+        """Convert a phantom consisting of spheres to a sphere collection
+
+        Parameters
+        ----------
+        phantom: cellsino.phantoms.base_phantom.BasePhantom
+            Phantom whose elements are all instances of
+            :class:`cellsino.elements.Sphere` with the
+            same medium index as the phantom
+        """
+        if isinstance(phantom, SphereCollection):
+            return phantom
+        spheres = list(phantom)
+        for el in spheres:
+            if not isinstance(el, Sphere):
+                raise ValueError("Only spheres are supported, got "
+                                 + "'{}'!".format(el.__class__.__name__))
+            if el.medium_index != phantom.medium_index:
+                raise ValueError("All elements must have the same medium "
+                                 + "index as the phantom!")
+        return cls(centers=[el.center for el in spheres],
+                   radii=[el.radius for el in spheres],
+                   object_index=[el.object_index for el in spheres],
+                   fl_brightness=[el.fl_brightness for el in spheres],
+                   medium_index=phantom.medium_index)
+
+    def append(self, element):
+        if not isinstance(element, Sphere):
+            raise ValueError("Only spheres can be added to a "
+                             + "SphereCollection!")
+        if element.medium_index != self.medium_index:
+            raise ValueError("The medium index of the sphere must match "
+                             + "that of the collection!")
+        self.centers = np.concatenate([self.centers, [element.center]])
+        self.radii = np.append(self.radii, element.radius)
+        self.object_index = np.append(self.object_index,
+                                      element.object_index)
+        self.fl_brightness = np.append(self.fl_brightness,
+                                       element.fl_brightness)
+
+    def draw(self, grid_size, pixel_size, dtype=float):
+        ri = np.full(grid_size, self.medium_index, dtype=dtype)
+        fl = np.zeros(grid_size, dtype=dtype)
+        contrast = self.object_index - self.medium_index
+        for ii in range(len(self)):
+            roi, inside = sphere_inside(center=self.centers[ii],
+                                        radius=self.radii[ii],
+                                        grid_size=grid_size,
+                                        pixel_size=pixel_size)
+            ri[roi][inside] += contrast[ii]
+            fl[roi][inside] += self.fl_brightness[ii]
+        return ri, fl
+
+    def find_repeated_elements(self, angles, axis_roll=0,
+                               displacements=None):
+        """Find spheres that have the same parameters in several frames
+
+        This is a vectorized version of
+        :func:`BasePhantom.find_repeated_elements`.
+        """
+        angles = np.atleast_1d(angles)
+        if displacements is None:
+            displacements = np.zeros((angles.size, 2))
+        # transformed centers of all spheres for all angles (N, M, 3)
+        rot = rotation_matrix(rot_main=angles, rot_in_plane=axis_roll)
+        centers = np.matmul(rot, self.centers.T).swapaxes(1, 2)
+        # rounding as in :func:`cellsino.cache.element_key`
+        centers = np.round(centers, 15) + 0.
+        keys = set()
+        for jj in range(len(self)):
+            rows = np.concatenate([centers[:, jj, :], displacements], axis=1)
+            _, inverse, counts = np.unique(rows, axis=0,
+                                           return_inverse=True,
+                                           return_counts=True)
+            inverse = inverse.reshape(-1)
+            repeated = np.where(counts[inverse] > 1)[0]
+            if repeated.size:
+                # compute keys as in :func:`SphereCollection.transform`
+                single = SphereCollection(
+                    centers=self.centers[jj],
+                    radii=self.radii[jj],
+                    object_index=self.object_index[jj],
+                    fl_brightness=self.fl_brightness[jj],
+                    medium_index=self.medium_index)
+                for ii in repeated:
+                    el = single.transform(rot_main=angles[ii],
+                                          rot_in_plane=axis_roll)[0]
+                    keys.add((element_key(el), tuple(displacements[ii])))
+        return keys
+
+    def transform(self, x=0, y=0, z=0, rot_main=0, rot_in_plane=0,
+                  rot_perp_plane=0):
+        """Rotate and translate all spheres
+
+        See :func:`cellsino.elements.base_element.BaseElement.transform`
+        for the definition of the parameters.
+        """
+        R = rotation_matrix(rot_main=rot_main,
+                            rot_in_plane=rot_in_plane,
+                            rot_perp_plane=rot_perp_plane)
+        centers = np.dot(self.centers, R.T) + np.array([x, y, z])
+        return SphereCollection(centers=centers,
+                                radii=self.radii,
+                                object_index=self.object_index,
+                                fl_brightness=self.fl_brightness,
+                                medium_index=self.medium_index)
+
+
+def _as_array(value, size):
+    """Broadcast a scalar or list-like value to a 1d array"""
+    return np.array(np.broadcast_to(value, (size,)), dtype=float)
@@ -0,0 +1,263 @@
+import collections
+import contextlib
+import json
+import threading
+import time
+import tracemalloc
+
+
+#: profiler that records the stages (see :func:`stage`)
+_active = None
+#: context manager used when no profiler is active
+_null = contextlib.nullcontext()
+
+
+class Profiler(object):
+    def __init__(self, trace_memory=False):
+        """Record the time spent in the stages of sinogram computation
+
+        Parameters
+        ----------
+        trace_memory: bool
+            If True, the net change of the memory traced with
+            :mod:`tracemalloc` (allocated minus freed) is recorded
+            for each stage (this slows down the computation).
+
+        Notes
+        -----
+        Pass an instance as `profiler` to :func:`cellsino.Sinogram.compute`
+        or activate it with a `with` statement. The following stages
+        are recorded (the times of nested stages are included in the
+        times of the enclosing stages):
+
+        - "field": field computation of a chunk of frames
+        - "transform": transformation of the phantom for a frame
+        - "propagate_sphere": field of a single element
+        - "fluorescence": fluorescence projection of a chunk of frames
+        - "project_sphere": fluorescence of a single element
+        - "qpimage", "flimage": construction of
+          :class:`qpimage.QPImage` and :class:`flimage.FLImage`
+          instances for HDF5 output
+        - "hdf5": writing data to the HDF5 file
+
+        Wall time is measured with :func:`time.perf_counter` and
+        CPU time with :func:`time.thread_time`. Frames are computed
+        in chunks; the wall time between the arrival of two chunks
+        is split evenly across the frames of the chunk (see
+        :func:`add_chunk`). Stages that are
+        executed in worker processes (`workers` or `executor`
+        arguments of :func:`cellsino.Sinogram.compute`) are not
+        recorded.
+        """
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self._stages = collections.OrderedDict()
+        self._elements = collections.OrderedDict()
+        self._frames = []
+        self._previous = None
+        self._start = None
+        self._last_frame = None
+        self._last_chunk = None
+        self._frame_wall = None
+        self._wall = 0
+        self._cpu = 0
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        if self.trace_memory:
+            self._stop_tracing = not tracemalloc.is_tracing()
+            tracemalloc.start()
+        self._start = time.perf_counter(), time.process_time()
+        self._last_frame = None
+        self._last_chunk = None
+        self._frame_wall = None
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        global _active
+        _active = self._previous
+        self._previous = None
+        self._wall += time.perf_counter() - self._start[0]
+        self._cpu += time.process_time() - self._start[1]
+        if self.trace_memory and self._stop_tracing:
+            tracemalloc.stop()
+
+    def add_chunk(self, size):
+        """Record the arrival of a chunk of `size` frames
+
+        The wall time since the previous chunk (or since the
+        profiler was activated) is split evenly across the frames
+        of the chunk, which are then recorded with :func:`add_frame`.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            wall = now - (self._last_chunk or self._start[0])
+            self._last_chunk = now
+            self._frame_wall = wall / max(size, 1)
+
+    def add_frame(self, index, wall=None):
+        """Record the wall time [s] of a frame
+
+        If `wall` is None, the time of the current chunk per frame
+        (see :func:`add_chunk`) or, if no chunk was recorded, the
+        time since the previous frame (or since the profiler was
+        activated) is recorded.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            if wall is None:
+                if self._frame_wall is not None:
+                    wall = self._frame_wall
+                else:
+                    wall = now - (self._last_frame or self._start[0])
+            self._last_frame = now
+            self._frames.append({"index": int(index), "wall": wall})
+
+    def add_stage(self, name, wall, cpu, nbytes=None, element=None):
+        """Record a call of a stage
+
+        Parameters
+        ----------
+        name: str
+            Name of the stage
+        wall: float
+            Wall time [s]
+        cpu: float
+            CPU time [s]
+        nbytes: int or None
+            Net change of the traced memory [bytes]
+        element: str or None
+            Element type (class name) the stage refers to
+        """
+        with self._lock:
+            _accumulate(self._stages, name, wall, cpu, nbytes)
+            if element is not None:
+                _accumulate(self._elements.setdefault(
+                    name, collections.OrderedDict()),
+                    element, wall, cpu, nbytes)
+
+    def stage(self, name, element=None):
+        """Context manager that records a stage"""
+        return _Stage(self, name, element)
+
+    def summary(self):
+        """Return the recorded data as a JSON-serializable dict
+
+        Returns
+        -------
+        summary: dict
+            - "total": wall and CPU time [s] during which the
+              profiler was active
+            - "stages": number of calls, wall time, CPU time, and
+              net change of the traced memory ("net_bytes", None if
+              not traced) of each stage
+            - "elements": the same per element type for the stages
+              that refer to single elements
+            - "frames": wall time of each frame (index and time)
+        """
+        with self._lock:
+            return {
+                "total": {"wall": self._wall, "cpu": self._cpu},
+                "stages": json.loads(json.dumps(self._stages)),
+                "elements": json.loads(json.dumps(self._elements)),
+                "frames": list(self._frames),
+            }
+
+    def to_json(self, path=None):
+        """Export the summary as JSON
+
+        Parameters
+        ----------
+        path: str, pathlib.Path, or None
+            If set, the summary is written to this file
+
+        Returns
+        -------
+        text: str
+            JSON representation of :func:`summary`
+        """
+        text = json.dumps(self.summary(), indent=2)
+        if path is not None:
+            with open(str(path), "w") as fd:
+                fd.write(text)
+        return text
+
+
+class _Stage(object):
+    """Context manager that records a stage in a :class:`Profiler`"""
+
+    def __init__(self, profiler, name, element=None):
+        self.profiler = profiler
+        self.name = name
+        self.element = element
+
+    def __enter__(self):
+        if self.profiler.trace_memory:
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        if self.profiler.trace_memory:
+            nbytes = tracemalloc.get_traced_memory()[0] - self.memory
+        else:
+            nbytes = None
+        self.profiler.add_stage(name=self.name,
+                                wall=wall,
+                                cpu=cpu,
+                                nbytes=nbytes,
+                                element=self.element)
+
+
+def add_chunk(size):
+    """Record a chunk of frames in the active :class:`Profiler` (if any)
+
+    See :func:`Profiler.add_chunk`.
+    """
+    if _active is not None:
+        _active.add_chunk(size)
+
+
+def add_frame(index):
+    """Record the time of a frame in the active :class:`Profiler` (if any)
+
+    See :func:`Profiler.add_frame`.
+    """
+    if _active is not None:
+        _active.add_frame(index)
+
+
+def stage(name, element=None):
+    """Record a stage in the active :class:`Profiler` (if any)
+
+    Parameters
+    ----------
+    name: str
+        Name of the stage
+    element: object, str, or None
+        Element (or name of the element type) the stage refers
+        to; the time is also recorded for its type.
+    """
+    if _active is None:
+        return _null
+    if element is not None and not isinstance(element, str):
+        element = element.__class__.__name__
+    return _active.stage(name, element)
+
+
+def _accumulate(stats, key, wall, cpu, nbytes):
+    """Add a call of a stage to a dictionary of statistics"""
+    item = stats.setdefault(key, {"calls": 0,
+                                  "wall": 0.,
+                                  "cpu": 0.,
+                                  "net_bytes": None})
+    item["calls"] += 1
+    item["wall"] += wall
+    item["cpu"] += cpu
+    if nbytes is not None:
+        item["net_bytes"] = (item["net_bytes"] or 0) + nbytes
@@ -1,9 +1,13 @@
+from .field_cache import FieldCache  # noqa: F401
+from .pp_born_fourier import BornFourier, RytovFourier
 from .pp_rytov import Rytov
 from .pp_projection import Projection
 
 prop_dict = {
+    "born-fourier": BornFourier,
     "projection": Projection,
     "rytov": Rytov,
+    "rytov-fourier": RytovFourier,
 }
 
 available = sorted(prop_dict.keys())
@@ -1,18 +1,52 @@
 import abc
 
 import numpy as np
-import qpimage
 
 from ..elements import Sphere
+from ..phantoms.sphere_collection import SphereCollection
+from .. import profiling
 
 
 class BasePropagator(object):
     __metaclass__ = abc.ABCMeta
+    #: whether the field of a sphere depends on its axial position
+    depends_on_focus = True
+    #: whether the field of a phantom is the product of the fields
+    #: of its elements (see :class:`cellsino.SinogramSession`)
+    separable = True
+    #: whether concentric spheres with the same radius may be merged
+    #: into one sphere with the sum of their refractive index contrasts
+    #: (see :func:`cellsino.phantoms.compiler.compile_phantom`)
+    additive_contrast = False
 
     def __init__(self, phantom, grid_size, pixel_size, wavelength,
-                 displacement=(0, 0)):
+                 displacement=(0, 0), field_cache=None, element_cache=None,
+                 dtype=float):
         """Base propagator
 
+        Parameters
+        ----------
+        phantom: cellsino.phantoms.base_phantom.BasePhantom
+            Phantom (in the coordinates of the detector)
+        grid_size: tuple of ints
+            Detector grid size [px]
+        pixel_size: float
+            Pixel size [m]
+        wavelength: float
+            Vacuum wavelength [m]
+        displacement: tuple of floats
+            Lateral displacement of the phantom [px]
+        field_cache: cellsino.propagators.FieldCache or None
+            If set, the fields of spheres are computed once at the
+            grid center and shifted to their actual positions.
+        element_cache: cellsino.cache.ElementCache or None
+            If set, the fields of elements with parameters that
+            occur in several frames are computed only once.
+        dtype: dtype
+            Real floating point type of the computation (e.g.
+            `np.float32` for single precision); the fields are
+            complex arrays of the corresponding precision.
+
         Notes
         -----
         - The origin of the coordinate system is the center of the grid.
@@ -28,17 +62,17 @@ class BasePropagator(object):
         self.center = np.array([gx, gy, 0]) / 2 - .5
         self.center[0] += displacement[0]
         self.center[1] += displacement[1]
+        self.displacement = tuple(displacement)
+        self.field_cache = field_cache
+        self.element_cache = element_cache
+        #: real floating point type of the computation
+        self.dtype = np.dtype(dtype)
 
     def propagate(self):
-        # dtype was previously np.complex256 which caused tests to
-        # fail on Windows (no support). I assume that regular double
-        # precision is enough here.
-        field = np.ones(self.grid_size, dtype=np.complex128)
-        for element in self.phantom:
-            if isinstance(element, Sphere):
-                field *= self.propagate_sphere(element).field
+        """Compute the field and return it as a :class:`qpimage.QPImage`"""
+        import qpimage
         qpifull = qpimage.QPImage(
-                    data=field,
+                    data=self.propagate_array(),
                     which_data="field",
                     meta_data={
                         "wavelength": self.wavelength,
@@ -48,6 +82,136 @@ class BasePropagator(object):
                     )
         return qpifull
 
+    def propagate_array(self):
+        """Compute the field as a complex 2d ndarray"""
+        # dtype was previously np.complex256 which caused tests to
+        # fail on Windows (no support). I assume that regular double
+        # precision is enough here.
+        field = np.ones(self.grid_size, dtype=self.field_dtype)
+        if (isinstance(self.phantom, SphereCollection)
+                and self.element_cache is None):
+            # work directly on the arrays of the collection
+            self.apply_sphere_collection(field, self.phantom)
+        else:
+            for element in self.phantom:
+                if isinstance(element, Sphere):
+                    with profiling.stage("propagate_sphere", element):
+                        self._apply_element(field, element)
+        return field
+
+    def _apply_element(self, field, element):
+        """Multiply `field` by the field of `element` (in-place)"""
+        if self.element_cache is None:
+            self.apply_sphere(field, element)
+        else:
+            field *= self.element_cache.get_contribution(
+                element=element,
+                displacement=self.displacement,
+                settings=(self.__class__.__name__,
+                          self.wavelength,
+                          self.pixel_size,
+                          tuple(self.grid_size),
+                          self.dtype.str),
+                func=lambda: self.sphere_field(element))
+
+    def propagate_angles(self, angles, axis_roll=0, displacements=None):
+        """Compute the fields for several rotational positions of the phantom
+
+        Parameters
+        ----------
+        angles: 1d ndarray of size N
+            Rotational positions (`rot_main`) of :data:`phantom` [rad]
+        axis_roll: float
+            In-plane rotation of the rotational axis [rad]
+        displacements: 2d ndarray of shape (N, 2) or None
+            Lateral displacement of each frame [px]; if None,
+            the displacement of this instance is used.
+
+        Returns
+        -------
+        fields: 3d complex ndarray of shape (N, gx, gy)
+            Field of each frame
+
+        Notes
+        -----
+        By default, the phantom is transformed for each angle and
+        the field is computed with :func:`propagate_array`. Subclasses
+        may override this method to compute all frames at once.
+        """
+        angles = np.atleast_1d(angles)
+        if displacements is None:
+            displacements = [self.displacement] * angles.size
+        fields = np.zeros((angles.size,) + tuple(self.grid_size),
+                          dtype=self.field_dtype)
+        for ii, (ang, displacement) in enumerate(zip(angles, displacements)):
+            with profiling.stage("transform"):
+                ph = self.phantom.transform(rot_main=ang,
+                                            rot_in_plane=axis_roll)
+            pp = self.__class__(phantom=ph,
+                                grid_size=self.grid_size,
+                                pixel_size=self.pixel_size,
+                                wavelength=self.wavelength,
+                                displacement=displacement,
+                                field_cache=self.field_cache,
+                                element_cache=self.element_cache,
+                                dtype=self.dtype)
+            fields[ii] = pp.propagate_array()
+        return fields
+
+    @property
+    def field_dtype(self):
+        """Complex floating point type of the fields"""
+        return np.result_type(self.dtype, np.complex64)
+
+    def apply_sphere(self, field, sphere):
+        """Multiply `field` in-place by the field of a single sphere"""
+        field *= self.sphere_field(sphere)
+
+    def apply_sphere_collection(self, field, collection):
+        """Multiply `field` in-place by the fields of all spheres
+
+        Parameters
+        ----------
+        field: 2d complex ndarray
+            Field that is modified
+        collection: cellsino.phantoms.SphereCollection
+            Spheres (in the coordinates of the propagator)
+
+        Notes
+        -----
+        This implementation calls :func:`apply_sphere` for each
+        sphere. Subclasses may override this method to read the
+        sphere parameters directly from the arrays of `collection`.
+        """
+        for ii in range(len(collection)):
+            with profiling.stage("propagate_sphere", "Sphere"):
+                self.apply_sphere(field, collection[ii])
+
+    def sphere_field(self, sphere):
+        """Compute the field of a single sphere as a 2d ndarray"""
+        if self.field_cache is None:
+            return self.propagate_sphere_array(sphere)
+        else:
+            return self.field_cache.get_field(self, sphere)
+
     @abc.abstractmethod
     def propagate_sphere(self, sphere):
-        pass
+        """Compute the field of a sphere as a :class:`qpimage.QPImage`"""
+
+    def propagate_sphere_array(self, sphere):
+        """Compute the field of a sphere as a complex 2d ndarray
+
+        Subclasses should override this method to avoid the
+        overhead of creating a :class:`qpimage.QPImage` for each
+        sphere in each frame.
+        """
+        return self.propagate_sphere(sphere).field
+
+    def propagate_sphere_cphase(self, sphere):
+        """Compute the complex phase of the field of a sphere
+
+        The complex phase is the logarithm of the field with
+        unwrapped phase (used by :class:`FieldCache`).
+        """
+        qpi = self.propagate_sphere(sphere)
+        return np.log(qpi.amp) + 1j*qpi.pha
@@ -0,0 +1,201 @@
+import copy
+
+import numpy as np
+
+from ..cache import MemoryCache
+
+
+class FieldCache(MemoryCache):
+    def __init__(self, maxsize=128, focus_step=1, refocus=False,
+                 max_phase=np.pi):
+        """Cache for the fields of spheres computed at the grid center
+
+        The field of a sphere only depends on its lateral position
+        by a translation. This cache stores the field of each sphere
+        computed at the center of the grid and produces the field at
+        the actual sphere position by a sub-pixel shift in Fourier
+        space.
+
+        Parameters
+        ----------
+        maxsize: int or None
+            Maximum number of cached fields
+        focus_step: float
+            Bin size [px] of the axial sphere position for
+            propagators that depend on the focus position
+            (see :data:`BasePropagator.depends_on_focus`). The
+            cached field is computed at the center of the bin. If
+            `refocus` is set, this is the bin size of the cached
+            propagation kernels.
+        refocus: bool
+            If set, the field of each sphere is computed only once
+            in focus (at the axial center of the sphere) and the
+            field at the actual axial position is obtained by
+            numerical refocusing (angular spectrum propagation,
+            see notes below).
+        max_phase: float
+            Only spheres whose maximum phase shift
+            :math:`4 \\pi r |n - n_\\mathrm{m}| / \\lambda` is at most
+            `max_phase` [rad] are refocused; the fields of more
+            strongly scattering spheres are computed for each
+            axial position (binned with `focus_step`).
+
+        Notes
+        -----
+        The complex phase of each field (the logarithm of the field
+        with unwrapped phase) is cached and shifted, because it
+        decays to zero outside of the sphere. Shifts are periodic,
+        i.e. spheres that are close to the border of the grid
+        wrap around.
+
+        Refocusing propagates the complex phase, not the field.
+        This linearization is the Rytov approximation: the complex
+        phase is the (normalized) scattered field of the first Born
+        approximation, which propagates like a field. It is thus
+        consistent with the Rytov model of qpsphere, which applies
+        the defocus in the same way, but not with the propagation
+        of the actual field behind strongly scattering spheres.
+        Compared to the direct evaluation of the Rytov model, the
+        maximum phase error grows with the phase shift of the sphere
+        (about 0.04 rad for a phase shift of 1.1 rad and 0.15 rad
+        for 4.6 rad at defocus distances of up to 4µm), which is
+        why refocusing is limited by `max_phase`.
+        """
+        super(FieldCache, self).__init__(maxsize=maxsize)
+        self.focus_step = focus_step
+        self.refocus = refocus
+        self.max_phase = max_phase
+        #: cache for propagation kernels (only used if `refocus` is set)
+        self.kernels = MemoryCache(maxsize=maxsize)
+
+    def get_field(self, propagator, sphere):
+        """Return the field of `sphere` for a propagator instance
+
+        Parameters
+        ----------
+        propagator: cellsino.propagators.base_propagator.BasePropagator
+            Propagator instance defining the imaging parameters
+        sphere: cellsino.elements.Sphere
+            Sphere element (in the coordinates of `propagator`)
+
+        Returns
+        -------
+        field: 2d complex ndarray
+            Field of the sphere
+        """
+        center = propagator.center + sphere.center/propagator.pixel_size
+        grid_center = np.array(propagator.grid_size) / 2 - .5
+        if propagator.depends_on_focus:
+            zbin = int(np.round(center[2] / self.focus_step))
+        else:
+            zbin = None
+        if (self.refocus and zbin is not None
+                and self.get_max_phase(propagator, sphere) <= self.max_phase):
+            # compute in focus and refocus numerically
+            refocus_bin = zbin
+            zbin = 0
+        else:
+            refocus_bin = 0
+        key = (propagator.__class__.__name__,
+               sphere.radius,
+               sphere.object_index,
+               sphere.medium_index,
+               propagator.wavelength,
+               propagator.pixel_size,
+               tuple(propagator.grid_size),
+               zbin,
+               )
+
+        def compute_centered():
+            # copy of the sphere located at the center of the grid
+            csphere = copy.copy(sphere)
+            csphere.points = np.zeros((1, 3))
+            csphere.points[0, :2] = (grid_center - propagator.center[:2]) \
+                * propagator.pixel_size
+            if zbin is not None:
+                csphere.points[0, 2] = (zbin * self.focus_step
+                                        - propagator.center[2]) \
+                    * propagator.pixel_size
+            return propagator.propagate_sphere_cphase(csphere)
+
+        cphase = self.get(key, compute_centered)
+        if refocus_bin:
+            # The focus position is defined along the direction of
+            # light propagation, measured from the sphere center.
+            distance = -refocus_bin * self.focus_step
+            kernel = self.get_kernel(grid_size=propagator.grid_size,
+                                     pixel_size=propagator.pixel_size,
+                                     wavelength=propagator.wavelength,
+                                     medium_index=sphere.medium_index,
+                                     distance=distance)
+            cphase = np.fft.ifft2(np.fft.fft2(cphase) * kernel)
+        return np.exp(fourier_shift(cphase, center[:2] - grid_center))
+
+    @staticmethod
+    def get_max_phase(propagator, sphere):
+        """Maximum phase shift [rad] of a sphere (projection)"""
+        return 4 * np.pi * sphere.radius \
+            * abs(sphere.object_index - sphere.medium_index) \
+            / propagator.wavelength
+
+    def get_kernel(self, grid_size, pixel_size, wavelength, medium_index,
+                   distance):
+        """Return the angular spectrum propagation kernel
+
+        Parameters
+        ----------
+        grid_size: tuple of ints
+            Grid size [px]
+        pixel_size: float
+            Pixel size [m]
+        wavelength: float
+            Vacuum wavelength [m]
+        medium_index: float
+            Refractive index of the medium
+        distance: float
+            Propagation distance [px]
+
+        Returns
+        -------
+        kernel: 2d complex ndarray
+            Kernel in Fourier space (unshifted frequencies); the
+            phase of the incident plane wave is removed and
+            evanescent components are set to zero.
+        """
+        key = (tuple(grid_size), pixel_size, wavelength, medium_index,
+               distance)
+
+        def compute_kernel():
+            km = 2 * np.pi * medium_index / wavelength * pixel_size
+            kx = 2 * np.pi * np.fft.fftfreq(grid_size[0]).reshape(-1, 1)
+            ky = 2 * np.pi * np.fft.fftfreq(grid_size[1]).reshape(1, -1)
+            valid = kx**2 + ky**2 < km**2
+            kz = np.sqrt((km**2 - kx**2 - ky**2) * valid)
+            return np.exp(1j * (kz - km) * distance) * valid
+
+        return self.kernels.get(key, compute_kernel)
+
+
+def fourier_shift(data, shift):
+    """Shift a 2d array by a (sub-pixel) amount using the FFT
+
+    Parameters
+    ----------
+    data: 2d ndarray
+        Input data
+    shift: tuple of floats
+        Shift along the two axes [px]
+
+    Returns
+    -------
+    shifted: 2d complex ndarray
+        Periodically shifted data
+    """
+    ishift = np.round(shift)
+    if np.allclose(shift, ishift, rtol=0, atol=1e-9):
+        # integer shifts are exact
+        return np.roll(data, np.array(ishift, dtype=int), axis=(0, 1))
+    kx = np.fft.fftfreq(data.shape[0]).reshape(-1, 1)
+    ky = np.fft.fftfreq(data.shape[1]).reshape(1, -1)
+    ramp = np.exp(-2j*np.pi*(kx*shift[0] + ky*shift[1]))
+    return np.fft.ifft2(np.fft.fft2(data) * ramp)
@@ -0,0 +1,209 @@
+import warnings
+
+import numpy as np
+
+from ..cache import MemoryCache, _module_caches, element_key
+from ..elements.base_element import rotation_matrix
+from ..fourier import slice_spectrum, volume_spectrum
+from ..phantoms.base_phantom import BasePhantom
+from .base_propagator import BasePropagator
+
+
+#: cache for the Fourier transforms of rasterized phantoms
+#: (see :func:`cellsino.cache.clear_caches`)
+_spectra = MemoryCache(maxsize=2, max_bytes=2**31)
+_module_caches.append(_spectra)
+
+
+class SpectrumMemoryWarning(UserWarning):
+    """The 3D spectrum of a phantom requires a lot of memory"""
+    pass
+
+
+class BornFourier(BasePropagator):
+    """Born approximation (Fourier diffraction theorem)
+
+    The scattering potential of the entire phantom is rasterized
+    once with :func:`BasePhantom.draw` and Fourier-transformed in 3D.
+    The field of each frame is obtained by interpolating the
+    spectrum on the rotated Ewald sphere. In contrast to the other
+    propagators, overlapping elements are not treated independently.
+
+    Notes
+    -----
+    - The phantom is rasterized in a cube with the side length
+      :data:`upsampling` times the largest grid size; elements
+      outside of this cube are clipped.
+    - The memory required grows with the third power of the grid
+      size (see :func:`BornFourier.get_spectrum_memory`). For a
+      256x256 grid, the cached spectrum takes up 1.1GB and about
+      five times as much is needed while it is computed. The
+      spectra are cached up to a total of 2GB (per process) and
+      can be freed with :func:`cellsino.cache.clear_caches`. When frames
+      are computed in parallel, each worker process computes and
+      caches its own spectrum. A :class:`SpectrumMemoryWarning`
+      is issued above :data:`warn_bytes`.
+    - The field is computed in the plane through the rotational
+      axis (i.e. the phantom center is in focus).
+    - The arguments `field_cache` and `element_cache` are ignored.
+    """
+    #: the Born field is a sum of the scattered fields of all elements
+    separable = False
+    #: the phantom is rasterized with :func:`BasePhantom.draw`, which
+    #: adds the refractive index contrasts of overlapping elements
+    additive_contrast = True
+    #: whether the Born field is converted to a Rytov field
+    rytov = False
+    #: factor by which the 3D spectrum is oversampled (zero-padding)
+    upsampling = 2
+    #: approximate peak memory [bytes] for computing the spectrum
+    #: above which a :class:`SpectrumMemoryWarning` is issued
+    warn_bytes = 2**30
+
+    def propagate_array(self):
+        return self.propagate_angles(angles=[0])[0]
+
+    def propagate_angles(self, angles, axis_roll=0, displacements=None):
+        angles = np.atleast_1d(angles)
+        if displacements is None:
+            displacements = [self.displacement] * angles.size
+        displacements = np.asarray(displacements, dtype=float)
+        gx, gy = self.grid_size
+        px = self.pixel_size
+        km = 2 * np.pi * self.phantom.medium_index / self.wavelength
+        # detector frequencies
+        kx = 2 * np.pi * np.fft.fftfreq(gx, d=px).reshape(-1, 1)
+        ky = 2 * np.pi * np.fft.fftfreq(gy, d=px).reshape(1, -1)
+        kx, ky = np.broadcast_arrays(kx, ky)
+        valid = kx**2 + ky**2 < km**2
+        kz = np.sqrt(km**2 - kx[valid]**2 - ky[valid]**2)
+        # frequencies on the Ewald sphere (M, 3)
+        kvec = np.stack([kx[valid], ky[valid], kz - km], axis=1)
+        # frequencies in the coordinates of the phantom (N, M, 3);
+        # the frame is the phantom rotated by R, i.e. f(R^T r)
+        rot = rotation_matrix(rot_main=angles, rot_in_plane=axis_roll)
+        rot = rot.reshape(-1, 3, 3)
+        kvec = np.einsum("nji,mj->nmi", rot, kvec)
+        spec, offset = self.get_spectrum()
+        values = slice_spectrum(spectrum=spec,
+                                offset=offset,
+                                kvec=kvec,
+                                pixel_size=px)
+
+        fields = np.zeros((angles.size, gx, gy), dtype=self.field_dtype)
+        for ii in range(angles.size):
+            # scattered field in Fourier space
+            fft = np.zeros((gx, gy), dtype=self.field_dtype)
+            fft[valid] = 1j / (2 * kz) * values[ii]
+            # origin and lateral displacement of the detector
+            center = np.array([gx, gy]) / 2 - .5 + displacements[ii]
+            fft *= np.exp(-1j * px * (kx * center[0] + ky * center[1]))
+            scattered = np.fft.ifft2(fft) / px**2
+            if self.rytov:
+                fields[ii] = np.exp(scattered)
+            else:
+                fields[ii] = 1 + scattered
+        return fields
+
+    def propagate_sphere(self, sphere):
+        return self._get_sphere_propagator(sphere).propagate()
+
+    def propagate_sphere_array(self, sphere):
+        return self._get_sphere_propagator(sphere).propagate_array()
+
+    def _get_sphere_propagator(self, sphere):
+        """Return a propagator for a phantom consisting of `sphere`"""
+        ph = BasePhantom(medium_index=sphere.medium_index)
+        ph.append(sphere)
+        return self.__class__(phantom=ph,
+                              grid_size=self.grid_size,
+                              pixel_size=self.pixel_size,
+                              wavelength=self.wavelength,
+                              displacement=self.displacement,
+                              dtype=self.dtype)
+
+    def get_spectrum(self):
+        """Return the 3D Fourier transform of the scattering potential
+
+        The scattering potential :math:`k_\\mathrm{m}^2 ((n/n_\\mathrm{m})^2
+        - 1)` is rasterized in a cube with axes (x, y, z). The
+        result is cached for subsequent calls with the same
+        phantom and imaging parameters.
+
+        Returns
+        -------
+        spectrum: 3d complex ndarray
+            Real-to-complex FFT of the scattering potential
+        offset: 1d ndarray
+            Offset of the cube (see :func:`cellsino.fourier.volume_spectrum`)
+        """
+        size = self.get_spectrum_size()
+        key = (tuple(element_key(el) for el in self.phantom),
+               self.phantom.medium_index,
+               self.wavelength,
+               self.pixel_size,
+               size,
+               self.dtype.str)
+
+        def compute_spectrum():
+            _, peak = self.get_spectrum_memory()
+            if peak > self.warn_bytes:
+                warnings.warn(
+                    "Computing the spectrum of the phantom ({}^3 voxels) "
+                    "requires about {:.1f}GB of memory per process; "
+                    "consider a smaller grid size.".format(size, peak/1e9),
+                    SpectrumMemoryWarning)
+            nm = self.phantom.medium_index
+            km = 2 * np.pi * nm / self.wavelength
+            ri, fl = self.phantom.draw(grid_size=(size, size, size),
+                                       pixel_size=self.pixel_size,
+                                       dtype=self.dtype)
+            del fl
+            # scattering potential (in place)
+            ri /= nm
+            ri **= 2
+            ri -= 1
+            ri *= km**2
+            # ODTbrain convention (z, x, y) to (x, y, z)
+            return volume_spectrum(ri.transpose(1, 2, 0), size=size)
+
+        return _spectra.get(key, compute_spectrum)
+
+    def get_spectrum_memory(self):
+        """Return the approximate memory required for the spectrum
+
+        Returns
+        -------
+        spectrum: int
+            Size of the cached spectrum [bytes]
+        peak: int
+            Approximate peak memory while the spectrum is
+            computed [bytes]
+        """
+        size = self.get_spectrum_size()
+        voxels = size**3
+        spectrum = size**2 * (size // 2 + 1) \
+            * np.result_type(self.dtype, np.complex64).itemsize
+        # rasterized volumes and real-to-complex FFT (always double
+        # precision with NumPy < 2)
+        peak = 3 * voxels * self.dtype.itemsize \
+            + 3 * size**2 * (size // 2 + 1) * 16
+        return spectrum, peak
+
+    def get_spectrum_size(self):
+        """Return the side length of the rasterized cube [px]"""
+        return int(self.upsampling * np.max(self.grid_size))
+
+
+class RytovFourier(BornFourier):
+    """Rytov approximation (Fourier diffraction theorem)
+
+    Same as :class:`BornFourier`, but the scattered field is
+    interpreted as the complex phase of the field (Rytov
+    linearization).
+    """
+    #: the refractive index contrasts of overlapping elements are
+    #: added before the Rytov phase is computed, which is not the
+    #: same as multiplying the fields of the elements
+    separable = False
+    rytov = True
@@ -1,12 +1,39 @@
-import qpsphere
+import numpy as np
 
+from .. import profiling
+from ..fluorescence import _bounding_box
 from .base_propagator import BasePropagator
 
 
 class Projection(BasePropagator):
     """Projection approximation"""
+    depends_on_focus = False
+    #: the phase is proportional to the refractive index contrast
+    additive_contrast = True
+
+    def apply_sphere(self, field, sphere):
+        if self.field_cache is None:
+            # only the bounding box of the sphere is modified
+            self._apply_projection(field, sphere)
+        else:
+            super(Projection, self).apply_sphere(field, sphere)
+
+    def apply_sphere_collection(self, field, collection):
+        if self.field_cache is not None:
+            super(Projection, self).apply_sphere_collection(field, collection)
+            return
+        for ii in range(len(collection)):
+            with profiling.stage("propagate_sphere", "Sphere"):
+                roi, phase = self._get_phase_params(
+                    center=collection.centers[ii],
+                    radius=collection.radii[ii],
+                    object_index=collection.object_index[ii],
+                    medium_index=collection.medium_index)
+                field[roi] *= np.exp(1j * phase)
 
     def propagate_sphere(self, sphere):
+        import qpsphere
+
         center = self.center + sphere.center/self.pixel_size
         qpi = qpsphere.models.projection(radius=sphere.radius,
                                          sphere_index=sphere.object_index,
@@ -17,3 +44,55 @@ class Projection(BasePropagator):
                                          center=center[:2],
                                          )
         return qpi
+
+    def propagate_sphere_array(self, sphere):
+        field = np.ones(self.grid_size, dtype=self.field_dtype)
+        self._apply_projection(field, sphere)
+        return field
+
+    def propagate_sphere_cphase(self, sphere):
+        cphase = np.zeros(self.grid_size, dtype=complex)
+        roi, phase = self._get_phase(sphere)
+        cphase[roi] = 1j * phase
+        return cphase
+
+    def _apply_projection(self, field, sphere):
+        """Multiply `field` by the field of a sphere (in-place)"""
+        roi, phase = self._get_phase(sphere)
+        field[roi] *= np.exp(1j * phase)
+
+    def _get_phase(self, sphere):
+        """Phase of a sphere within its bounding box
+
+        Same model as :func:`qpsphere.models.projection`, but only
+        the bounding box of the sphere is evaluated.
+
+        Returns
+        -------
+        roi: tuple of slices
+            Bounding box of the sphere
+        phase: 2d ndarray
+            Phase [rad] within `roi`
+        """
+        return self._get_phase_params(center=sphere.center,
+                                      radius=sphere.radius,
+                                      object_index=sphere.object_index,
+                                      medium_index=sphere.medium_index)
+
+    def _get_phase_params(self, center, radius, object_index, medium_index):
+        """Same as :func:`_get_phase` for the parameters of a sphere"""
+        cx, cy = (self.center + center/self.pixel_size)[:2]
+        rpx = radius / self.pixel_size
+        (x0, x1), (y0, y1) = _bounding_box(center=(cx, cy),
+                                           radius=rpx,
+                                           grid_size=self.grid_size)
+        x = np.arange(x0, x1).reshape(-1, 1)
+        y = np.arange(y0, y1).reshape(1, -1)
+        r = rpx**2 - (x - cx)**2 - (y - cy)**2
+        # distance
+        z = np.zeros_like(r)
+        rvalid = r > 0
+        z[rvalid] = 2 * np.sqrt(r[rvalid]) * self.pixel_size
+        phase = (object_index - medium_index) \
+            * 2 * np.pi * z / self.wavelength
+        return (slice(x0, x1), slice(y0, y1)), phase
@@ -1,25 +1,233 @@
 import numpy as np
-import qpsphere
 
+from .. import profiling
 from .base_propagator import BasePropagator
 
 
 class Rytov(BasePropagator):
     """Rytov approximation"""
 
-    def propagate_sphere(self, sphere, grid_sampling=150):
-        center = self.center + sphere.points[0]/self.pixel_size
+    def apply_sphere_collection(self, field, collection):
+        if self.field_cache is not None:
+            super(Rytov, self).apply_sphere_collection(field, collection)
+            return
+        for ii in range(len(collection)):
+            with profiling.stage("propagate_sphere", "Sphere"):
+                field *= rytov_field(**self._get_kwargs(
+                    center=collection.centers[ii],
+                    radius=collection.radii[ii],
+                    sphere_index=collection.object_index[ii],
+                    medium_index=collection.medium_index))
+
+    def get_sphere_kwargs(self, sphere, grid_sampling=150):
+        """Keyword arguments for :func:`qpsphere.models.rytov`"""
+        return self._get_kwargs(center=sphere.points[0],
+                                radius=sphere.radius,
+                                sphere_index=sphere.object_index,
+                                medium_index=sphere.medium_index,
+                                grid_sampling=grid_sampling)
+
+    def _get_kwargs(self, center, radius, sphere_index, medium_index,
+                    grid_sampling=150):
+        """Keyword arguments for :func:`qpsphere.models.rytov`
+
+        Parameters
+        ----------
+        center: 1d ndarray of size 3
+            Sphere center (in the coordinates of the propagator) [m]
+        radius, sphere_index, medium_index: float
+            Sphere radius [m] and refractive indices
+        grid_sampling: int
+            Approximate number of pixels sampling the grid
+        """
+        center = self.center + center/self.pixel_size
         # speed up computation for smaller spheres on large grid
-        n = np.max(self.grid_size) * self.pixel_size / sphere.radius
+        n = np.max(self.grid_size) * self.pixel_size / radius
         radius_sampling = grid_sampling / n
-        qpi = qpsphere.models.rytov(radius=sphere.radius,
-                                    sphere_index=sphere.object_index,
-                                    medium_index=sphere.medium_index,
-                                    wavelength=self.wavelength,
-                                    pixel_size=self.pixel_size,
-                                    grid_size=self.grid_size,
-                                    center=center[:2],
-                                    focus=-center[2]*self.pixel_size,
-                                    radius_sampling=radius_sampling,
-                                    )
+        return {"radius": radius,
+                "sphere_index": sphere_index,
+                "medium_index": medium_index,
+                "wavelength": self.wavelength,
+                "pixel_size": self.pixel_size,
+                "grid_size": self.grid_size,
+                "center": center[:2],
+                "focus": -center[2]*self.pixel_size,
+                "radius_sampling": radius_sampling,
+                }
+
+    def propagate_sphere(self, sphere, grid_sampling=150):
+        import qpsphere
+
+        qpi = qpsphere.models.rytov(
+            **self.get_sphere_kwargs(sphere, grid_sampling=grid_sampling))
         return qpi
+
+    def propagate_sphere_array(self, sphere, grid_sampling=150):
+        return rytov_field(
+            **self.get_sphere_kwargs(sphere, grid_sampling=grid_sampling))
+
+
+def rytov_field(radius, sphere_index, medium_index, wavelength, pixel_size,
+                grid_size, center, focus, radius_sampling):
+    """Field of a sphere in the Rytov approximation as a 2d ndarray
+
+    Same as :func:`qpsphere.models.rytov`, but without creating a
+    :class:`qpimage.QPImage` (no phase unwrapping).
+
+    Notes
+    -----
+    The computation is adapted from :mod:`qpsphere.models.mod_rytov`
+    (see :func:`_sphere_prop_fslice_bessel`). The result is compared
+    to :func:`qpsphere.models.rytov` in tests/test_sphere_arrays.py.
+    """
+    # sample the sphere radius with `radius_sampling` pixels
+    samp_mult = radius_sampling * pixel_size / radius
+    grid_size_sim = (int(np.round(grid_size[0] * samp_mult)),
+                     int(np.round(grid_size[1] * samp_mult)))
+    size_factor = grid_size_sim[0] / grid_size[0]
+    pixel_size_sim = pixel_size / size_factor
+    field = _sphere_prop_fslice_bessel(radius=radius,
+                                       sphere_index=sphere_index,
+                                       medium_index=medium_index,
+                                       wavelength=wavelength,
+                                       pixel_size=pixel_size_sim,
+                                       grid_size=grid_size_sim,
+                                       focus=focus,
+                                       zeropad=5)
+    # interpolate the field at the detector coordinates
+    x_sim = (np.arange(grid_size_sim[0]) + .5) * pixel_size_sim
+    y_sim = (np.arange(grid_size_sim[1]) + .5) * pixel_size_sim
+    x = (np.arange(grid_size[0]) + grid_size[0] / 2 - center[0]) * pixel_size
+    y = (np.arange(grid_size[1]) + grid_size[1] / 2 - center[1]) * pixel_size
+    return _interpolate_grid(cin=(x_sim, y_sim), cout=(x, y), data=field)
+
+
+# The following functions are adapted from qpsphere
+# (qpsphere/models/mod_rytov.py, https://github.com/RI-imaging/qpsphere),
+# Copyright (c) 2017 Paul Müller, released under the MIT license.
+
+
+def _interpolate_grid(cin, cout, data, fillval=0):
+    """Bilinear interpolation of 2D data on a regular grid
+
+    Parameters
+    ----------
+    cin: tuple of two 1d ndarrays
+        Coordinates of the data along both axes
+    cout: tuple of two 1d ndarrays
+        Coordinates of the interpolated data along both axes
+    data: 2d ndarray
+        Real or complex data; for complex data, the amplitude
+        and the unwrapped phase are interpolated separately.
+    fillval: float
+        Value for coordinates outside of `cin` (for complex data,
+        the amplitude is filled with one and the phase with zero)
+    """
+    from scipy.interpolate import RegularGridInterpolator
+
+    if np.iscomplexobj(data):
+        from skimage.restoration import unwrap_phase
+        phase = _interpolate_grid(cin, cout, unwrap_phase(np.angle(data)),
+                                  fillval=0)
+        ampli = _interpolate_grid(cin, cout, np.abs(data), fillval=1)
+        return ampli * np.exp(1j * phase)
+
+    ipol = RegularGridInterpolator(points=cin,
+                                   values=data,
+                                   method="linear",
+                                   bounds_error=False,
+                                   fill_value=fillval)
+    xx, yy = np.meshgrid(cout[0], cout[1], indexing="ij")
+    return ipol((xx, yy))
+
+
+def _sphere_prop_fslice_bessel(radius, sphere_index, medium_index,
+                               wavelength, pixel_size, grid_size, focus=0,
+                               zeropad=5):
+    """Rytov field of a sphere (Fourier slice theorem)
+
+    The 2D Fourier transform of the projected scattering potential
+    is computed analytically (spherical Bessel function of the
+    first kind of order one) and propagated to the axial distance
+    `focus` from the sphere center.
+
+    Parameters
+    ----------
+    radius: float
+        Radius of the sphere [m]
+    sphere_index: float
+        Refractive index of the sphere
+    medium_index: float
+        Refractive index of the surrounding medium
+    wavelength: float
+        Vacuum wavelength of the imaging light [m]
+    pixel_size: float
+        Pixel size [m]
+    grid_size: tuple of ints
+        Size of the computed field [px]
+    focus: float
+        Axial distance from the center of the sphere at which
+        the field is computed [m]
+    zeropad: int
+        Zero-padding factor
+
+    Returns
+    -------
+    field: 2d complex ndarray
+        Field normalized to the incident field
+    """
+    import scipy.special
+
+    # convert everything to pixels
+    radius /= pixel_size
+    wavelength /= pixel_size
+    focus /= pixel_size
+
+    grid_size = np.array(np.round(grid_size), dtype=int)
+    opad_size = grid_size * zeropad
+
+    kx = 2 * np.pi * \
+        np.fft.ifftshift(np.fft.fftfreq(opad_size[0])).reshape(-1, 1)
+    ky = 2 * np.pi * \
+        np.fft.ifftshift(np.fft.fftfreq(opad_size[1])).reshape(1, -1)
+    km = 2 * np.pi * medium_index / wavelength
+
+    filter_klp = (kx**2 + ky**2 < km**2)
+    kz = np.sqrt((km**2 - kx**2 - ky**2) * filter_klp) - km
+    r = np.sqrt((kx**2 + ky**2 + kz**2) * filter_klp) / (2 * np.pi)
+
+    comp_id = r != 0
+    F = np.zeros_like(r)
+    F[comp_id] = scipy.special.spherical_jn(
+        1, r[comp_id] * radius * np.pi * 2) * radius**2 / r[comp_id] * 2
+    # the center has an analytical value
+    center_fft = np.where(np.abs(kx) + np.abs(ky) + np.abs(kz) == 0)
+    F[center_fft] = 4 / 3 * np.pi * radius**3
+    # object amplitude
+    F *= km**2 * ((sphere_index / medium_index)**2 - 1)
+
+    M = 1. / km * np.sqrt((km**2 - kx**2 - ky**2) * filter_klp)
+    A = -2j * km * M * np.exp(-1j * km * M * focus)
+
+    # shift by half a pixel, such that the field is centered
+    doffx = 0 if grid_size[0] % 2 else .5
+    doffy = 0 if grid_size[1] % 2 else .5
+    transl = np.exp(1j * (doffx * kx + doffy * ky))
+
+    valid = F != 0
+    Fconv = np.zeros((opad_size[0], opad_size[1]), dtype=complex)
+    Fconv[valid] = F[valid] / A[valid] * transl[valid]
+
+    p = np.fft.ifftshift(np.fft.ifftn(np.fft.fftshift(Fconv)))
+
+    if zeropad > 1:
+        # remove the zero-padding
+        a0, a1 = opad_size // 2
+        b0, b1 = grid_size // 2
+        of0, of1 = grid_size % 2
+        a0 += of0
+        a1 += of1
+        p = p[a0 - b0:a0 + b0 + of0, a1 - b1:a1 + b1 + of1]
+
+    # Rytov approximation: exp(u_B / u_0)
+    return np.exp(p / np.exp(1j * km * focus))
@@ -0,0 +1,236 @@
+import numpy as np
+
+from .cache import ElementCache, element_key
+from .elements import Sphere
+from .fluorescence import proj_dict
+from .phantoms.base_phantom import BasePhantom
+from .propagators import FieldCache, prop_dict
+from .sinogram import _check_mode
+
+
+class SinogramSession(object):
+    def __init__(self, sinogram, angles, axis_roll=0, displacements=None,
+                 times=3.0, mode=["field", "fluorescence"],
+                 propagator="rytov", bleach_decay=0,
+                 fluorescence_background=0, field_cache=None,
+                 fluorescence_projector="analytic"):
+        """Sinogram with incremental updates of single elements
+
+        The field of a phantom is the product of the fields of its
+        elements and the fluorescence is the sum of the fluorescence
+        of its elements. A session keeps the sinogram of each element
+        in memory, such that only the elements whose parameters
+        changed have to be recomputed (e.g. in a fitting loop).
+
+        Parameters
+        ----------
+        sinogram: cellsino.Sinogram
+            Sinogram defining the initial phantom and the imaging
+            parameters (`wavelength`, `pixel_size`, `grid_size`)
+        angles, axis_roll, displacements, times, mode, propagator,
+        bleach_decay, fluorescence_background, field_cache,
+        fluorescence_projector:
+            See :func:`cellsino.Sinogram.compute`. Only propagators
+            for which :data:`BasePropagator.separable` is set and
+            the "analytic" fluorescence projector are supported.
+
+        Notes
+        -----
+        The sinograms are updated by dividing out the old field
+        (subtracting the old fluorescence) of an element and by
+        applying the new one. The results are identical to those of
+        :func:`cellsino.Sinogram.compute` up to rounding errors.
+        Use :func:`refresh` to recompute the combined sinograms from
+        the element sinograms.
+        """
+        self.mode = _check_mode(mode)
+        prop_cls = prop_dict[propagator]
+        if "field" in self.mode and not prop_cls.separable:
+            raise ValueError("The propagator '{}' ".format(propagator)
+                             + "does not support incremental updates!")
+        if (fluorescence_projector != "analytic"
+                and "fluorescence" in self.mode):
+            raise ValueError("Only the 'analytic' fluorescence projector "
+                             + "supports incremental updates!")
+        angles, displacements, times = sinogram._get_frame_parameters(
+            angles=angles, displacements=displacements, times=times)
+        if field_cache is True:
+            field_cache = FieldCache()
+        elif field_cache is False:
+            field_cache = None
+        self.wavelength = sinogram.wavelength
+        self.pixel_size = sinogram.pixel_size
+        self.grid_size = sinogram.grid_size
+        self.angles = angles
+        self.axis_roll = axis_roll
+        self.displacements = displacements
+        self.times = times
+        self.propagator = propagator
+        self.bleach_decay = bleach_decay
+        self.fluorescence_background = fluorescence_background
+        self.field_cache = field_cache
+        self.fluorescence_projector = fluorescence_projector
+        #: current phantom
+        self.phantom = BasePhantom(medium_index=sinogram.phantom.medium_index)
+        #: element keys of the phantom elements
+        self._keys = []
+        #: field and fluorescence sinograms of each element
+        self._stacks = []
+        #: number of element sinograms computed
+        self.computed = 0
+        for element in sinogram.phantom:
+            self.phantom.append(element)
+            self._keys.append(element_key(element))
+            self._stacks.append(self._compute_element(element))
+        self.refresh()
+
+    @property
+    def field(self):
+        """Field sinogram (3d complex ndarray, do not modify)"""
+        return self._field
+
+    @property
+    def fluorescence(self):
+        """Fluorescence sinogram (3d ndarray)"""
+        if self._fluor is None:
+            return None
+        bleach_factors = np.exp(-self.bleach_decay*np.asarray(self.times))
+        return self._fluor * bleach_factors.reshape(-1, 1, 1) \
+            + self.fluorescence_background
+
+    def refresh(self):
+        """Recompute the sinograms from the element sinograms"""
+        shape = (self.angles.size,) + tuple(self.grid_size)
+        self._field = None
+        self._fluor = None
+        if "field" in self.mode:
+            self._field = np.ones(shape, dtype=np.complex128)
+        if "fluorescence" in self.mode:
+            self._fluor = np.zeros(shape, dtype=float)
+        for field, fluor in self._stacks:
+            if field is not None:
+                self._field *= field
+            if fluor is not None:
+                self._fluor += fluor
+
+    def update(self, phantom):
+        """Update the sinograms for a modified phantom
+
+        Elements are compared by their position in `phantom`; only
+        elements whose parameters changed are recomputed. Elements
+        may also be added to or removed from the end of the phantom.
+
+        Parameters
+        ----------
+        phantom: cellsino.phantoms.base_phantom.BasePhantom
+            Modified phantom with the same medium index
+
+        Returns
+        -------
+        changed: list of int
+            Indices of the elements that were recomputed
+        """
+        if phantom.medium_index != self.phantom.medium_index:
+            raise ValueError("The medium index of the phantom must not "
+                             + "change!")
+        elements = list(phantom)
+        changed = []
+        for ii, element in enumerate(elements):
+            if (ii >= len(self._keys)
+                    or element_key(element) != self._keys[ii]):
+                self.update_element(ii, element)
+                changed.append(ii)
+        # remove elements at the end
+        for ii in range(len(self._keys) - 1, len(elements) - 1, -1):
+            self.update_element(ii, None)
+            changed.append(ii)
+        return changed
+
+    def update_element(self, index, element):
+        """Replace, add, or remove a single element
+
+        Parameters
+        ----------
+        index: int
+            Index of the element in :data:`phantom`; if it equals
+            the number of elements, `element` is appended.
+        element: cellsino.elements.base_element.BaseElement or None
+            New element; if None, the element at `index` (which
+            must be the last element) is removed.
+        """
+        if index == len(self._keys):
+            if element is None:
+                raise IndexError("No element at index {}!".format(index))
+            self.phantom.append(element)
+            self._keys.append(None)
+            self._stacks.append((None, None))
+        elif element is None and index != len(self._keys) - 1:
+            raise IndexError("Only the last element can be removed!")
+        old_field, old_fluor = self._stacks[index]
+        if element is None:
+            new_field, new_fluor = None, None
+            self.phantom.elements.pop(index)
+            self._keys.pop(index)
+            self._stacks.pop(index)
+        else:
+            new_field, new_fluor = self._compute_element(element)
+            self.phantom.elements[index] = element
+            self._keys[index] = element_key(element)
+            self._stacks[index] = (new_field, new_fluor)
+
+        if (self._field is not None and old_field is not None
+                and np.min(np.abs(old_field)) < 1e-10):
+            # dividing out the old field is not accurate
+            self.refresh()
+            return
+        if self._field is not None:
+            if old_field is not None:
+                self._field /= old_field
+            if new_field is not None:
+                self._field *= new_field
+        if self._fluor is not None:
+            if old_fluor is not None:
+                self._fluor -= old_fluor
+            if new_fluor is not None:
+                self._fluor += new_fluor
+
+    def _compute_element(self, element):
+        """Compute the field and fluorescence sinograms of an element
+
+        Returns None for modalities to which the element does
+        not contribute.
+        """
+        if not isinstance(element, Sphere):
+            return None, None
+        self.computed += 1
+        ph = BasePhantom(medium_index=self.phantom.medium_index)
+        ph.append(element)
+        field = None
+        fluor = None
+        # e.g. spheres on the rotational axis are computed only once
+        repeated = ph.find_repeated_elements(
+            angles=self.angles,
+            axis_roll=self.axis_roll,
+            displacements=self.displacements)
+        element_cache = ElementCache(keys=repeated) if repeated else None
+        if "field" in self.mode:
+            pp = prop_dict[self.propagator](
+                phantom=ph,
+                grid_size=self.grid_size,
+                pixel_size=self.pixel_size,
+                wavelength=self.wavelength,
+                field_cache=self.field_cache,
+                element_cache=element_cache)
+            field = pp.propagate_angles(angles=self.angles,
+                                        axis_roll=self.axis_roll,
+                                        displacements=self.displacements)
+        if "fluorescence" in self.mode:
+            fluor = proj_dict[self.fluorescence_projector](
+                phantom=ph,
+                angles=self.angles,
+                grid_size=self.grid_size,
+                pixel_size=self.pixel_size,
+                axis_roll=self.axis_roll,
+                displacements=self.displacements,
+                element_cache=element_cache)
+        return field, fluor
@@ -1,11 +1,19 @@
-import flimage
-import h5py
+import concurrent.futures
+import functools
+
 import numpy as np
-import qpimage
 
-from .fluorescence import Fluorescence
-from .propagators import prop_dict
+from .cache import DiskCache, ElementCache, element_key
+from .fluorescence import proj_dict
+from .framestore import FrameStore
+from . import profiling
+from .propagators import FieldCache, prop_dict
 from .phantoms import phan_dict
+from .phantoms.compiler import compile_phantom
+
+
+#: version of the frame data format used as part of the disk cache keys
+_FRAME_CACHE_VERSION = 2
 
 
 class Sinogram(object):
@@ -21,7 +29,12 @@ class Sinogram(object):
     def compute(self, angles, axis_roll=0, displacements=None,
                 times=3.0, mode=["field", "fluorescence"], propagator="rytov",
                 bleach_decay=0, fluorescence_background=0, path=None,
-                count=None, max_count=None):
+                count=None, max_count=None, workers=None, executor=None,
+                writer_kw=None, field_cache=None,
+                fluorescence_projector="analytic", disk_cache=None,
+                resume=False, layout="series", out_field=None,
+                out_fluorescence=None, dtype=float,
+                background_writer=False, profiler=None):
         """Compute sinogram data
 
         Parameters
@@ -60,6 +73,85 @@ class Sinogram(object):
         max_count: multiprocessing.Value
             May be used for tracking progress. This value is
             incremented by `N`.
+        workers: int or None
+            Number of worker processes used for computing the frames.
+            If set to None or 1, all frames are computed serially in
+            the current process.
+        executor: concurrent.futures.Executor or None
+            Executor used for computing the frames in parallel. This
+            overrides `workers`. The executor is not shut down when
+            the computation is done, so it can be reused.
+        writer_kw: dict or None
+            Keyword arguments for :class:`cellsino.storage.SeriesWriter`
+            or :class:`cellsino.storage.FlatWriter` (e.g. `buffer_size`,
+            `compression`, or `chunks`) used when `path` is set.
+        field_cache: bool or cellsino.propagators.FieldCache
+            If True or a :class:`cellsino.propagators.FieldCache`,
+            the field of each sphere is computed only once at the grid
+            center (per axial position bin) and shifted laterally to
+            its position in each frame. This is much faster for large
+            numbers of angles, but introduces small errors at sharp
+            edges (see :class:`cellsino.propagators.FieldCache`). Pass
+            an instance to reuse cached fields in subsequent calls.
+        fluorescence_projector: str
+            The method used for computing the fluorescence projections.
+            Must be in :data:`cellsino.fluorescence.proj_dict`;
+            "analytic" computes the chord lengths of all spheres,
+            "fourier-slice" rasterizes the phantom and uses the
+            Fourier slice theorem (see
+            :class:`cellsino.fluorescence.FourierSliceProjector`).
+        disk_cache: str, pathlib.Path, or cellsino.cache.DiskCache
+            If set, the field and fluorescence of each frame are
+            stored in this cache directory (see
+            :class:`cellsino.cache.DiskCache`) under a hash of the
+            transformed phantom and the imaging parameters. Frames
+            that are already in the cache are not recomputed.
+        resume: bool
+            Only used if `path` is set. If True, the simulation
+            parameters and the indices of the completed frames are
+            recorded in the output file. If the file already exists
+            (e.g. because a previous computation was interrupted),
+            the parameters must match and only the missing frames
+            are computed (see :func:`cellsino.storage.init_progress`).
+        layout: str
+            Only used if `path` is set. The HDF5 layout of the output
+            file; "series" writes a :class:`qpimage.QPSeries` and a
+            :class:`flimage.FLSeries` (see
+            :class:`cellsino.storage.SeriesWriter`), "flat" writes
+            3D datasets with one chunk per frame (see
+            :class:`cellsino.storage.FlatWriter`) which can be read
+            with :func:`Sinogram.load`.
+        out_field: ndarray or None
+            Array of shape (N, gx, gy) into which the field sinogram
+            is written if `path` is not set; this may be a
+            :class:`numpy.memmap` or a
+            :class:`cellsino.framestore.FrameStore` for computing
+            sinograms that do not fit into memory. Frames are written
+            in order.
+        out_fluorescence: ndarray or None
+            Array of shape (N, gx, gy) into which the fluorescence
+            sinogram is written (see `out_field`)
+        dtype: dtype
+            Floating point precision of the computation. With
+            `np.float32`, the propagators, the fluorescence
+            projectors, and the rasterization of the phantom use
+            single precision and the sinograms are returned as
+            complex64 and float32 arrays (half the memory). The
+            errors are of the order of 1e-6 to 1e-5 (see
+            `benchmarks/bench_precision.py`). The fields of the
+            "rytov" and "projection" propagators are computed by
+            :ref:`qpsphere <qpsphere:index>` in double precision
+            and only accumulated in single precision.
+        background_writer: bool
+            Only used if `path` is set. If True, the frames are
+            written to disk in a background thread (see
+            :class:`cellsino.storage.ThreadedWriter`), such that
+            the computation of the next frames is not blocked
+            by disk I/O.
+        profiler: cellsino.profiling.Profiler or None
+            If set, the time spent in each stage of the computation
+            and for each frame is recorded (see
+            :func:`cellsino.profiling.Profiler.summary`).
 
         Returns
         -------
@@ -67,23 +159,550 @@ class Sinogram(object):
             Both sinograms are returned if `mode` is set to its
             default value, otherwise, only one sinogram is returned.
             If `path` is set, then the path is returned (no sinogram
-            data are written into memory).
+            data are written into memory). If `out_field` or
+            `out_fluorescence` are set, they are returned instead
+            of newly allocated arrays.
         """
-        if not isinstance(mode, (list, tuple)):
-            mode = [mode]
-        for mm in mode:
-            if mm not in ["field", "fluorescence"]:
-                raise ValueError("Invalid element in `mode`: `{}`".format(mm))
-        if len(mode) == 0:
-            raise ValueError("No `mode` specified!")
+        if profiler is not None:
+            # compute with the profiler activated
+            with profiler:
+                return self.compute(
+                    angles=angles,
+                    axis_roll=axis_roll,
+                    displacements=displacements,
+                    times=times,
+                    mode=mode,
+                    propagator=propagator,
+                    bleach_decay=bleach_decay,
+                    fluorescence_background=fluorescence_background,
+                    path=path,
+                    count=count,
+                    max_count=max_count,
+                    workers=workers,
+                    executor=executor,
+                    writer_kw=writer_kw,
+                    field_cache=field_cache,
+                    fluorescence_projector=fluorescence_projector,
+                    disk_cache=disk_cache,
+                    resume=resume,
+                    layout=layout,
+                    out_field=out_field,
+                    out_fluorescence=out_fluorescence,
+                    dtype=dtype,
+                    background_writer=background_writer,
+                    profiler=None)
+
+        mode = _check_mode(mode)
+        if layout not in ["series", "flat"]:
+            raise ValueError("Unknown layout: '{}'".format(layout))
+        if path and (out_field is not None or out_fluorescence is not None):
+            raise ValueError("`out_field` and `out_fluorescence` cannot "
+                             + "be used in combination with `path`!")
+        angles, displacements, times = self._get_frame_parameters(
+            angles=angles, displacements=displacements, times=times)
         do_qps = "field" in mode
         do_fls = "fluorescence" in mode
 
+        # indices of the frames to compute
+        todo = np.arange(angles.size)
+        if path:
+            # imported here, because h5py and qpimage are slow to import
+            from .storage import (FlatWriter, SeriesWriter, ThreadedWriter,
+                                  init_progress)
+            if resume:
+                parameters = self._get_parameters_record(
+                    angles=angles,
+                    axis_roll=axis_roll,
+                    displacements=displacements,
+                    times=times,
+                    mode=mode,
+                    propagator=propagator,
+                    bleach_decay=bleach_decay,
+                    fluorescence_background=fluorescence_background,
+                    field_cache=field_cache,
+                    fluorescence_projector=fluorescence_projector,
+                    dtype=dtype)
+                parameters["layout"] = layout
+                completed = init_progress(path=path,
+                                          parameters=parameters,
+                                          size=angles.size)
+                todo = np.where(~completed)[0]
+            write = True
+            if layout == "flat":
+                writer = FlatWriter(path=path,
+                                    wavelength=self.wavelength,
+                                    pixel_size=self.pixel_size,
+                                    medium_index=self.phantom.medium_index,
+                                    grid_size=self.grid_size,
+                                    angles=angles,
+                                    times=times,
+                                    displacements=displacements,
+                                    mode=mode,
+                                    dtype=dtype,
+                                    **(writer_kw or {}))
+            else:
+                writer = SeriesWriter(path=path,
+                                      wavelength=self.wavelength,
+                                      pixel_size=self.pixel_size,
+                                      medium_index=self.phantom.medium_index,
+                                      **(writer_kw or {}))
+            if background_writer:
+                writer = ThreadedWriter(writer)
+        else:
+            write = False
+            shape = (angles.size, self.grid_size[0], self.grid_size[1])
+            if do_qps:
+                sino_field = _get_output(out_field, shape,
+                                         np.result_type(dtype, np.complex64))
+            if do_fls:
+                sino_fluor = _get_output(out_fluorescence, shape, dtype)
+
+        frames = self.iter_frames(
+            angles=angles[todo],
+            axis_roll=axis_roll,
+            displacements=displacements[todo],
+            times=np.asarray(times)[todo],
+            mode=mode,
+            propagator=propagator,
+            bleach_decay=bleach_decay,
+            fluorescence_background=fluorescence_background,
+            count=count,
+            max_count=max_count,
+            workers=workers,
+            executor=executor,
+            field_cache=field_cache,
+            fluorescence_projector=fluorescence_projector,
+            disk_cache=disk_cache,
+            dtype=dtype,
+            chunk_size=None)
+        try:
+            for ii, _, time, field, fluor in frames:
+                ii = todo[ii]
+                if write:
+                    writer.write(field=field, fluor=fluor, time=time,
+                                 index=ii if resume or layout == "flat"
+                                 else None)
+                else:
+                    if do_qps:
+                        sino_field[ii] = field
+                    if do_fls:
+                        sino_fluor[ii] = fluor
+                profiling.add_frame(ii)
+        finally:
+            # cancel pending frames if an error occurred
+            frames.close()
+            if write:
+                writer.close()
+
+        if write:
+            return path
+        else:
+            if do_qps and do_fls:
+                return sino_field, sino_fluor
+            elif do_qps:
+                return sino_field
+            else:
+                return sino_fluor
+
+    async def aiter_frames(self, angles, axis_roll=0, displacements=None,
+                           times=3.0, mode=["field", "fluorescence"],
+                           propagator="rytov", bleach_decay=0,
+                           fluorescence_background=0, executor=None,
+                           field_cache=None, fluorescence_projector="analytic",
+                           disk_cache=None, dtype=float, progress=None,
+                           chunk_size=1, max_pending=None):
+        """Compute sinogram data frame by frame in an asyncio event loop
+
+        This is the asynchronous version of :func:`iter_frames`. The
+        frames are computed in chunks in `executor` (the default
+        executor of the event loop if None), such that the event
+        loop is not blocked. The frames are yielded in order. If the
+        iteration is stopped or the consuming task is cancelled,
+        pending chunks are cancelled (chunks that are already being
+        computed run to completion in the executor).
+
+        Parameters
+        ----------
+        progress: cellsino.aio.Progress or None
+            Object that is updated after each frame (instead of the
+            `count` and `max_count` arguments of :func:`iter_frames`)
+        chunk_size: int or None
+            Number of frames computed at once (see :func:`iter_frames`)
+        max_pending: int or None
+            Maximum number of frames submitted to `executor` that
+            have not yet been yielded; defaults to four chunks per
+            worker of `executor` or to two chunks for the default
+            executor.
+
+        Notes
+        -----
+        The remaining parameters are the same as in :func:`compute`.
+        Use a :class:`concurrent.futures.ProcessPoolExecutor` to
+        compute frames in parallel; with a thread pool, the
+        computation is mostly serialized by the global interpreter
+        lock.
+        """
+        from .aio import map_frames_async
+
+        if executor is None:
+            num_workers = None
+        else:
+            num_workers = getattr(executor, "_max_workers", 4)
+        angles, times, compute_frames, chunk_args = self._get_chunks(
+            angles=angles,
+            axis_roll=axis_roll,
+            displacements=displacements,
+            times=times,
+            mode=mode,
+            propagator=propagator,
+            bleach_decay=bleach_decay,
+            fluorescence_background=fluorescence_background,
+            field_cache=field_cache,
+            fluorescence_projector=fluorescence_projector,
+            disk_cache=disk_cache,
+            dtype=dtype,
+            num_workers=num_workers,
+            chunk_size=chunk_size)
+        if progress is not None:
+            progress._update(done=0, total=angles.size)
+
+        if max_pending is None and chunk_args:
+            size = len(chunk_args[0][0])
+            if executor is None:
+                max_pending = 2 * size
+            else:
+                max_pending = 4 * num_workers * size
+        chunks = map_frames_async(compute_frames, chunk_args,
+                                  executor=executor,
+                                  max_pending=max_pending)
+        try:
+            ii = 0
+            async for fields, fluors in chunks:
+                for field, fluor in zip(fields, fluors):
+                    yield ii, angles[ii], times[ii], field, fluor
+                    ii += 1
+                    if progress is not None:
+                        progress._update(done=ii)
+        finally:
+            await chunks.aclose()
+            if progress is not None:
+                progress._update(finished=True)
+
+    async def compute_async(self, angles, axis_roll=0, displacements=None,
+                            times=3.0, mode=["field", "fluorescence"],
+                            propagator="rytov", bleach_decay=0,
+                            fluorescence_background=0, executor=None,
+                            field_cache=None,
+                            fluorescence_projector="analytic",
+                            disk_cache=None, dtype=float, progress=None,
+                            out_field=None, out_fluorescence=None):
+        """Compute sinogram data in an asyncio event loop
+
+        This is the asynchronous version of :func:`compute` (without
+        HDF5 output). The frames are computed with
+        :func:`aiter_frames`; the parameters `executor` and
+        `progress` are described there, all other parameters are
+        the same as in :func:`compute`.
+
+        Returns
+        -------
+        sinogram_fields, sinogram_fluorescence: 3d np.ndarray
+            See :func:`compute`
+        """
+        mode = _check_mode(mode)
+        angles, displacements, times = self._get_frame_parameters(
+            angles=angles, displacements=displacements, times=times)
+        shape = (angles.size, self.grid_size[0], self.grid_size[1])
+        sino_field = None
+        sino_fluor = None
+        if "field" in mode:
+            sino_field = _get_output(out_field, shape,
+                                     np.result_type(dtype, np.complex64))
+        if "fluorescence" in mode:
+            sino_fluor = _get_output(out_fluorescence, shape, dtype)
+
+        frames = self.aiter_frames(
+            angles=angles,
+            axis_roll=axis_roll,
+            displacements=displacements,
+            times=times,
+            mode=mode,
+            propagator=propagator,
+            bleach_decay=bleach_decay,
+            fluorescence_background=fluorescence_background,
+            executor=executor,
+            field_cache=field_cache,
+            fluorescence_projector=fluorescence_projector,
+            disk_cache=disk_cache,
+            dtype=dtype,
+            progress=progress,
+            chunk_size=None)
+        try:
+            async for ii, _, _, field, fluor in frames:
+                if sino_field is not None:
+                    sino_field[ii] = field
+                if sino_fluor is not None:
+                    sino_fluor[ii] = fluor
+        finally:
+            await frames.aclose()
+
+        if sino_field is not None and sino_fluor is not None:
+            return sino_field, sino_fluor
+        elif sino_field is not None:
+            return sino_field
+        else:
+            return sino_fluor
+
+    @staticmethod
+    def load(path):
+        """Open a sinogram file written with the "flat" layout
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            HDF5 file written by :func:`Sinogram.compute` with
+            `layout="flat"`
+
+        Returns
+        -------
+        sino: cellsino.storage.FlatSinogram
+            Sinogram whose `field` and `fluorescence` datasets are
+            read lazily, e.g. `sino.field[10:20, :, 32]` only reads
+            the requested frames from disk. Use it as a context
+            manager or call `sino.close()` to close the file.
+        """
+        from .storage import FlatSinogram
+        return FlatSinogram(path)
+
+    def iter_frames(self, angles, axis_roll=0, displacements=None,
+                    times=3.0, mode=["field", "fluorescence"],
+                    propagator="rytov", bleach_decay=0,
+                    fluorescence_background=0, count=None, max_count=None,
+                    workers=None, executor=None, field_cache=None,
+                    fluorescence_projector="analytic", disk_cache=None,
+                    dtype=float, chunk_size=1, max_pending=None):
+        """Compute sinogram data frame by frame
+
+        This generator yields each frame as soon as it is computed,
+        which allows processing the sinogram data while the
+        simulation is still running. Only the frames that are being
+        computed or that have not yet been consumed are held in
+        memory.
+
+        Parameters
+        ----------
+        chunk_size: int or None
+            Number of frames computed at once (by one worker). Larger
+            chunks are computed faster (the fluorescence projection
+            is vectorized over each chunk), but the first frame is
+            only yielded when its entire chunk is computed. None
+            selects the chunk size automatically (up to 16 frames).
+        max_pending: int or None
+            Maximum number of frames submitted to the workers that
+            have not yet been yielded (at least one chunk is always
+            submitted); defaults to four chunks per worker. This
+            parameter has no effect for serial computation, where
+            only the current chunk is held in memory.
+
+        Notes
+        -----
+        The remaining parameters are the same as in :func:`compute`.
+
+        Yields
+        ------
+        index: int
+            Index of the frame in the sinogram
+        angle: float
+            Rotational position of the frame [rad]
+        time: float
+            Measurement time of the frame
+        field: 2d complex ndarray or None
+            Field data (None if "field" is not in `mode`)
+        fluorescence: 2d ndarray or None
+            Fluorescence data (None if "fluorescence" is not in `mode`)
+        """
+        if executor is not None:
+            num_workers = getattr(executor, "_max_workers", 4)
+        elif workers is not None and workers > 1:
+            num_workers = workers
+        else:
+            num_workers = None
+
+        angles, times, compute_frames, chunk_args = self._get_chunks(
+            angles=angles,
+            axis_roll=axis_roll,
+            displacements=displacements,
+            times=times,
+            mode=mode,
+            propagator=propagator,
+            bleach_decay=bleach_decay,
+            fluorescence_background=fluorescence_background,
+            field_cache=field_cache,
+            fluorescence_projector=fluorescence_projector,
+            disk_cache=disk_cache,
+            dtype=dtype,
+            num_workers=num_workers,
+            chunk_size=chunk_size)
         if max_count is not None:
             max_count.value += angles.size
 
+        if executor is None and num_workers is not None:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            pool = None
+        if max_pending is None and num_workers is not None and chunk_args:
+            max_pending = 4 * num_workers * len(chunk_args[0][0])
+        chunks = _map_frames(compute_frames, chunk_args,
+                             executor=pool or executor,
+                             max_pending=max_pending)
+        try:
+            ii = 0
+            for fields, fluors in chunks:
+                profiling.add_chunk(len(fields))
+                for field, fluor in zip(fields, fluors):
+                    yield ii, angles[ii], times[ii], field, fluor
+                    ii += 1
+                    if count is not None:
+                        count.value += 1
+        finally:
+            # cancel pending frames if the generator is closed early
+            chunks.close()
+            if pool is not None:
+                pool.shutdown()
+
+    def _get_chunks(self, angles, axis_roll, displacements, times, mode,
+                    propagator, bleach_decay, fluorescence_background,
+                    field_cache, fluorescence_projector, disk_cache, dtype,
+                    num_workers=None, chunk_size=None):
+        """Prepare the computation of the frames in chunks
+
+        The parameters are the same as in :func:`compute`;
+        `num_workers` is the number of parallel workers (None
+        for serial computation) and `chunk_size` is the number of
+        frames per chunk (None for an automatic choice based on
+        the number of frames and workers).
+
+        Returns
+        -------
+        angles, times: 1d ndarrays
+            Rotational positions and measurement times of all frames
+        compute_frames: callable
+            Function that computes the frames of one chunk (see
+            :func:`_compute_frames`); it is picklable, such that it
+            can be sent to a process pool.
+        chunk_args: list of tuples
+            Argument of `compute_frames` for each chunk
+        """
+        mode = _check_mode(mode)
+        angles, displacements, times = self._get_frame_parameters(
+            angles=angles, displacements=displacements, times=times)
+
+        if field_cache is True:
+            field_cache = FieldCache()
+        elif field_cache is False:
+            field_cache = None
+
+        if disk_cache is not None and not isinstance(disk_cache, DiskCache):
+            disk_cache = DiskCache(disk_cache)
+
+        # Elements that do not contribute to a modality are removed
+        # before the frames are computed.
+        phantoms = {}
+        for mm in mode:
+            if mm == "field":
+                merge = prop_dict[propagator].additive_contrast
+            else:
+                merge = True
+            phantoms[mm] = compile_phantom(self.phantom, mode=mm, merge=merge)
+
+        # Elements that occur in several frames with the same
+        # parameters (e.g. spheres on the rotational axis) are
+        # computed only once.
+        repeated = set()
+        for mm in mode:
+            repeated |= phantoms[mm].find_repeated_elements(
+                angles=angles, axis_roll=axis_roll,
+                displacements=displacements)
+        if repeated:
+            element_cache = ElementCache(keys=repeated)
+        else:
+            element_cache = None
+
+        compute_frames = functools.partial(
+            self._compute_frames,
+            axis_roll=axis_roll,
+            mode=mode,
+            propagator=propagator,
+            bleach_decay=bleach_decay,
+            fluorescence_background=fluorescence_background,
+            field_cache=field_cache,
+            element_cache=element_cache,
+            fluorescence_projector=fluorescence_projector,
+            disk_cache=disk_cache,
+            dtype=dtype,
+            phantoms=phantoms)
+
+        # Frames are computed in chunks (the fluorescence projection is
+        # vectorized over each chunk). For parallel computation, the
+        # chunks are kept small enough to balance the load.
+        if chunk_size is not None:
+            chunk = max(1, int(chunk_size))
+        elif num_workers is None:
+            chunk = 16
+        else:
+            chunk = int(np.ceil(angles.size / (4 * num_workers)))
+            chunk = min(16, max(1, chunk))
+        chunk_args = [(angles[ii:ii+chunk],
+                       displacements[ii:ii+chunk],
+                       times[ii:ii+chunk])
+                      for ii in range(0, angles.size, chunk)]
+        return angles, times, compute_frames, chunk_args
+
+    def _get_parameters_record(self, angles, axis_roll, displacements,
+                               times, mode, propagator, bleach_decay,
+                               fluorescence_background, field_cache,
+                               fluorescence_projector, dtype=float):
+        """Return the simulation parameters as a JSON-compatible dict
+
+        The phantom is described by a hash of its element parameters.
+        """
+        if field_cache is True:
+            field_cache = FieldCache()
+        if field_cache:
+            field_cache = [field_cache.focus_step, field_cache.refocus,
+                           field_cache.max_phase]
+        else:
+            field_cache = None
+        phantom_key = [element_key(el) for el in self.phantom]
+        return {
+            "angles": np.asarray(angles, dtype=float).tolist(),
+            "axis_roll": float(axis_roll),
+            "bleach_decay": float(bleach_decay),
+            "displacements": np.asarray(displacements,
+                                        dtype=float).tolist(),
+            "dtype": np.dtype(dtype).str,
+            "field_cache": field_cache,
+            "fluorescence_background": float(fluorescence_background),
+            "fluorescence_projector": fluorescence_projector,
+            "grid_size": [int(gg) for gg in self.grid_size],
+            "medium_index": float(self.phantom.medium_index),
+            "mode": list(mode),
+            "phantom": DiskCache.hash(phantom_key),
+            "pixel_size": float(self.pixel_size),
+            "propagator": propagator,
+            "times": np.asarray(times, dtype=float).tolist(),
+            "wavelength": float(self.wavelength),
+        }
+
+    def _get_frame_parameters(self, angles, displacements, times):
+        """Return angles, displacements, and times as arrays of size N
+
+        See :func:`compute` for a description of the parameters.
+        """
         if isinstance(angles, int):
             angles = np.linspace(0, 2*np.pi, angles, endpoint=False)
+        else:
+            angles = np.asarray(angles)
 
         if isinstance(times, (int, float)):
             times = np.linspace(0, times, angles.shape[0], endpoint=False)
@@ -94,68 +713,239 @@ class Sinogram(object):
             np.random.seed(47)  # for reproducibility
             displacements = np.random.normal(scale=displacements,
                                              size=(angles.shape[0], 2))
+        return angles, displacements, times
 
-        if path:
-            write = True
-        else:
-            write = False
-            if do_qps:
-                sino_field = np.zeros((angles.size,
-                                       self.grid_size[0],
-                                       self.grid_size[1]),
-                                      dtype=complex)
-            if do_fls:
-                sino_fluor = np.zeros((angles.size,
-                                       self.grid_size[0],
-                                       self.grid_size[1]),
-                                      dtype=float)
+    def _compute_frames(self, args, axis_roll, mode, propagator,
+                        bleach_decay, fluorescence_background, field_cache,
+                        element_cache, fluorescence_projector,
+                        disk_cache=None, dtype=float, phantoms=None):
+        """Compute the field and fluorescence data of a chunk of frames
 
-        for ii, ang in enumerate(angles):
-            ph = self.phantom.transform(rot_main=ang, rot_in_plane=axis_roll)
-            if do_qps:  # QPI
-                pp = prop_dict[propagator](phantom=ph,
-                                           grid_size=self.grid_size,
-                                           pixel_size=self.pixel_size,
-                                           wavelength=self.wavelength,
-                                           displacement=displacements[ii])
-                qpi = pp.propagate()
-                qpi["time"] = times[ii]
-            if do_fls:  # Fluorescence
-                bleach_factor = np.exp(-bleach_decay*times[ii])
-                fli = Fluorescence(phantom=ph,
-                                   grid_size=self.grid_size,
-                                   pixel_size=self.pixel_size,
-                                   displacement=displacements[ii],
-                                   bleach_factor=bleach_factor,
-                                   background=fluorescence_background,
-                                   ).project()
-                fli["time"] = times[ii]
+        This method is called by :func:`Sinogram.iter_frames` (possibly
+        in a separate process). `args` is the tuple
+        (angles, displacements, times) of the frames in the chunk.
+        If `disk_cache` is set, only frames that are not in the
+        cache are computed. `phantoms` maps the modalities to the
+        phantoms used for computing them (see
+        :func:`cellsino.phantoms.compiler.compile_phantom`); modalities
+        that are not in `phantoms` are computed from :data:`phantom`.
 
-            if write:
-                with h5py.File(path, "a") as h5:
-                    if do_qps:
-                        qps = qpimage.QPSeries(
-                            h5file=h5.require_group("qpseries"))
-                        qps.add_qpimage(qpi)
-                    if do_fls:
-                        fls = flimage.FLSeries(
-                            h5file=h5.require_group("flseries"))
-                        fls.add_flimage(fli)
-            else:
-                if do_qps:
-                    sino_field[ii] = qpi.field
-                if do_fls:
-                    sino_fluor[ii] = fli.fl
+        Returns
+        -------
+        fields: 3d complex ndarray (or list of None)
+            Field data of each frame
+        fluors: 3d ndarray (or list of None)
+            Fluorescence data of each frame
+        """
+        angles, displacements, times = args
+        if disk_cache is not None:
+            return self._compute_frames_cached(
+                args=args,
+                axis_roll=axis_roll,
+                mode=mode,
+                propagator=propagator,
+                bleach_decay=bleach_decay,
+                fluorescence_background=fluorescence_background,
+                field_cache=field_cache,
+                element_cache=element_cache,
+                fluorescence_projector=fluorescence_projector,
+                disk_cache=disk_cache,
+                dtype=dtype,
+                phantoms=phantoms)
+        if phantoms is None:
+            phantoms = {}
+        fields = [None] * len(angles)
+        fluors = [None] * len(angles)
+        if "field" in mode:  # QPI
+            pp = prop_dict[propagator](phantom=phantoms.get("field",
+                                                            self.phantom),
+                                       grid_size=self.grid_size,
+                                       pixel_size=self.pixel_size,
+                                       wavelength=self.wavelength,
+                                       field_cache=field_cache,
+                                       element_cache=element_cache,
+                                       dtype=dtype)
+            with profiling.stage("field"):
+                fields = pp.propagate_angles(angles=angles,
+                                             axis_roll=axis_roll,
+                                             displacements=displacements)
+        if "fluorescence" in mode:  # Fluorescence
+            with profiling.stage("fluorescence"):
+                fluors = proj_dict[fluorescence_projector](
+                    phantom=phantoms.get("fluorescence", self.phantom),
+                    angles=angles,
+                    grid_size=self.grid_size,
+                    pixel_size=self.pixel_size,
+                    axis_roll=axis_roll,
+                    displacements=displacements,
+                    bleach_factors=np.exp(-bleach_decay*np.asarray(times)),
+                    background=fluorescence_background,
+                    element_cache=element_cache,
+                    dtype=dtype)
+        return fields, fluors
 
-            if count is not None:
-                count.value += 1
+    def _compute_frames_cached(self, args, axis_roll, mode, propagator,
+                               bleach_decay, fluorescence_background,
+                               field_cache, element_cache,
+                               fluorescence_projector, disk_cache,
+                               dtype=float, phantoms=None):
+        """Same as :func:`_compute_frames`, but using a disk cache
 
-        if write:
-            return path
+        The fluorescence data are cached without photobleaching and
+        background, such that they can be reused for other values
+        of `bleach_decay` and `fluorescence_background`.
+        """
+        angles, displacements, times = args
+        if field_cache is None:
+            field_settings = None
         else:
-            if do_qps and do_fls:
-                return sino_field, sino_fluor
-            elif do_qps:
-                return sino_field
-            else:
-                return sino_fluor
+            field_settings = (field_cache.__class__.__name__,
+                              field_cache.focus_step,
+                              field_cache.refocus,
+                              field_cache.max_phase)
+        dtype = np.dtype(dtype).str
+        settings = {
+            "field": ("field", _FRAME_CACHE_VERSION, propagator,
+                      field_settings, self.wavelength, self.pixel_size,
+                      tuple(self.grid_size), self.phantom.medium_index,
+                      dtype),
+            "fluorescence": ("fluorescence", _FRAME_CACHE_VERSION,
+                             fluorescence_projector, self.pixel_size,
+                             tuple(self.grid_size), dtype),
+        }
+        exclude = {"field": (),
+                   "fluorescence": ("object_index", "medium_index")}
+        data = {"field": [None] * len(angles),
+                "fluorescence": [None] * len(angles)}
+        for ii, (ang, displacement) in enumerate(zip(angles, displacements)):
+            ph = self.phantom.transform(rot_main=ang, rot_in_plane=axis_roll)
+            for mm in mode:
+                # the fluorescence does not depend on refractive indices
+                phantom_key = [element_key(el, exclude=exclude[mm])
+                               for el in ph]
+                key = (settings[mm], tuple(displacement), phantom_key)
+                data[mm][ii] = disk_cache.load(key)
+                if data[mm][ii] is None:
+                    data[mm][ii] = key
+        for mm in mode:
+            # compute the missing frames
+            missing = [ii for ii, item in enumerate(data[mm])
+                       if isinstance(item, tuple)]
+            if not missing:
+                continue
+            computed = self._compute_frames(
+                args=(angles[missing], displacements[missing],
+                      np.asarray(times)[missing]),
+                axis_roll=axis_roll,
+                mode=[mm],
+                propagator=propagator,
+                bleach_decay=0,
+                fluorescence_background=0,
+                field_cache=field_cache,
+                element_cache=element_cache,
+                fluorescence_projector=fluorescence_projector,
+                dtype=dtype,
+                phantoms=phantoms)
+            computed = computed[0] if mm == "field" else computed[1]
+            for ii, value in zip(missing, computed):
+                disk_cache.store(data[mm][ii], value)
+                data[mm][ii] = value
+        fields = [None] * len(angles)
+        fluors = [None] * len(angles)
+        if "field" in mode:
+            fields = np.array(data["field"])
+        if "fluorescence" in mode:
+            bleach_factors = np.exp(-bleach_decay*np.asarray(times))
+            fluors = np.array(data["fluorescence"])
+            fluors *= bleach_factors.reshape(-1, 1, 1)
+            fluors += fluorescence_background
+        return fields, fluors
+
+
+def _check_mode(mode):
+    """Return the imaging modalities in `mode` as a list"""
+    if not isinstance(mode, (list, tuple)):
+        mode = [mode]
+    for mm in mode:
+        if mm not in ["field", "fluorescence"]:
+            raise ValueError("Invalid element in `mode`: `{}`".format(mm))
+    if len(mode) == 0:
+        raise ValueError("No `mode` specified!")
+    return list(mode)
+
+
+def _get_output(out, shape, dtype):
+    """Return an output array of the given shape for the sinogram
+
+    If `out` is None, a new array is allocated. Otherwise, the
+    shape and data type of `out` are checked.
+    """
+    if out is None:
+        return np.zeros(shape, dtype=dtype)
+    if isinstance(out, FrameStore):
+        if len(out):
+            raise ValueError("The frame store must be empty!")
+        out_shape = (out.capacity,) + out.frame_shape
+    else:
+        out_shape = out.shape
+    if tuple(out_shape) != shape:
+        raise ValueError("Expected output of shape {}, got {}!".format(
+            shape, tuple(out_shape)))
+    if not np.can_cast(dtype, out.dtype, casting="same_kind"):
+        raise ValueError("Cannot write {} data to {} ".format(
+            np.dtype(dtype), out.dtype) + "output!")
+    return out
+
+
+def _map_frames(func, iterable, executor=None, max_pending=None):
+    """Apply `func` to each chunk of frames and yield the results
+
+    Parameters
+    ----------
+    func: callable
+        Function applied to each chunk; it must be picklable if
+        `executor` is a process pool.
+    iterable: iterable
+        Chunks to be processed; the first item of each chunk is
+        the array of its angles, i.e. its length is the number
+        of frames in the chunk (see :func:`Sinogram._get_chunks`).
+    executor: concurrent.futures.Executor or None
+        If None, the chunks are processed serially in the current
+        thread. Otherwise, the chunks are submitted to `executor`.
+    max_pending: int or None
+        Maximum number of frames submitted to `executor` that
+        have not yet been yielded. This bounds the memory used for
+        results that are waiting to be consumed. At least one chunk
+        is always submitted. Defaults to four times the number of
+        workers of `executor` (or 16 if this number cannot be
+        determined).
+
+    Notes
+    -----
+    The results are always yielded in the order of `iterable`,
+    regardless of the order in which the workers finish.
+    """
+    if executor is None:
+        for item in iterable:
+            yield func(item)
+        return
+
+    if max_pending is None:
+        max_pending = 4 * getattr(executor, "_max_workers", 4)
+    # futures and number of frames of the submitted chunks
+    pending = []
+    num_pending = 0
+    try:
+        for item in iterable:
+            size = len(item[0])
+            while pending and num_pending + size > max_pending:
+                future, num = pending.pop(0)
+                num_pending -= num
+                yield future.result()
+            pending.append((executor.submit(func, item), size))
+            num_pending += size
+        while pending:
+            yield pending.pop(0)[0].result()
+    finally:
+        for future, _ in pending:
+            future.cancel()
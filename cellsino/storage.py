@@ -0,0 +1,523 @@
+import json
+import pathlib
+import queue
+import threading
+
+import flimage
+import h5py
+import numpy as np
+import qpimage
+
+from . import profiling
+
+
+class SeriesWriter(object):
+    def __init__(self, path, wavelength, pixel_size, medium_index,
+                 buffer_size=16, compression="gzip", compression_opts=9,
+                 chunks=None):
+        """Write sinogram frames to an HDF5 file
+
+        The data are stored as a :class:`qpimage.QPSeries` in the
+        group "qpseries" and as a :class:`flimage.FLSeries` in the
+        group "flseries" of the HDF5 file, in the same format as
+        :func:`qpimage.QPSeries.add_qpimage` and
+        :func:`flimage.FLSeries.add_flimage` would write them.
+
+        Parameters
+        ----------
+        path: str, pathlib.Path, or h5py.Group
+            Output HDF5 file; if it already exists, new frames are
+            appended to the existing series. If an HDF5 group is
+            given, the series are written to this group and the
+            file is not closed by :func:`close`.
+        wavelength: float
+            Vacuum wavelength [m] stored in the field meta data
+        pixel_size: float
+            Pixel size [m] stored in the meta data
+        medium_index: float
+            Medium refractive index stored in the field meta data
+        buffer_size: int
+            Number of frames that are held in memory before they
+            are written to the file
+        compression: str or None
+            HDF5 compression filter of the image datasets
+        compression_opts: int or None
+            Options of the compression filter
+        chunks: tuple, bool, or None
+            HDF5 chunk shape of the image datasets; the default
+            (None) uses the frame shape (one chunk per image).
+
+        Notes
+        -----
+        The file is opened once and kept open until :func:`close`
+        is called. Use this class as a context manager to make sure
+        that all buffered frames are written, also if an exception
+        occurs during sinogram computation.
+        """
+        self.wavelength = wavelength
+        self.pixel_size = pixel_size
+        self.medium_index = medium_index
+        self.buffer_size = buffer_size
+        self.dataset_kw = {"fletcher32": True,
+                           "chunks": chunks,
+                           "compression": compression,
+                           "compression_opts": compression_opts,
+                           }
+        if isinstance(path, h5py.Group):
+            self.path = pathlib.Path(path.file.filename)
+            self.h5 = path
+            self._owner = False
+        else:
+            self.path = pathlib.Path(path)
+            self.h5 = h5py.File(self.path, "a")
+            self._owner = True
+        self._buffer = []
+        #: number of images in each series (counted only once)
+        self._counts = {}
+        for group, prefix in [("qpseries", "qpi_"), ("flseries", "fli_")]:
+            if group in self.h5:
+                self._counts[group] = len([kk for kk in self.h5[group].keys()
+                                           if kk.startswith(prefix)])
+            else:
+                self._counts[group] = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Write all buffered frames and close the file"""
+        if self.h5 is not None:
+            try:
+                self.flush()
+            finally:
+                if self._owner:
+                    self.h5.close()
+                self.h5 = None
+
+    def flush(self):
+        """Write all buffered frames to the file"""
+        indices = []
+        for field, fluor, time, index in self._buffer:
+            if field is not None:
+                with profiling.stage("qpimage"):
+                    qpi = qpimage.QPImage(
+                        data=field,
+                        which_data="field",
+                        meta_data={
+                            "wavelength": self.wavelength,
+                            "pixel size": self.pixel_size,
+                            "medium index": self.medium_index,
+                            "time": time,
+                            }
+                        )
+                with profiling.stage("hdf5"):
+                    self._append(qpi, group="qpseries", prefix="qpi_")
+            if fluor is not None:
+                with profiling.stage("flimage"):
+                    fli = flimage.FLImage(
+                        data=fluor,
+                        meta_data={
+                            "pixel size": self.pixel_size,
+                            "time": time,
+                            }
+                        )
+                with profiling.stage("hdf5"):
+                    self._append(fli, group="flseries", prefix="fli_")
+            if index is not None:
+                indices.append(index)
+        with profiling.stage("hdf5"):
+            if indices and "progress" in self.h5:
+                # record the completed frames (see :func:`init_progress`)
+                completed = self.h5["progress/completed"]
+                completed[sorted(indices)] = True
+            self._buffer.clear()
+            self.h5.file.flush()
+
+    def write(self, field, fluor, time, index=None):
+        """Add a frame
+
+        Parameters
+        ----------
+        field: 2d complex ndarray or None
+            Field data of the frame
+        fluor: 2d ndarray or None
+            Fluorescence data of the frame
+        time: float
+            Measurement time of the frame
+        index: int or None
+            Index of the frame in the sinogram; if set and progress
+            is recorded in the file (see :func:`init_progress`), the
+            frame is marked as completed once it is written.
+        """
+        self._buffer.append((field, fluor, time, index))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def _append(self, image, group, prefix):
+        """Append a QPImage or FLImage to a series group"""
+        series = self.h5.require_group(group)
+        num = self._counts[group]
+        self._copy(image.h5, series.create_group(prefix + str(num)))
+        self._counts[group] = num + 1
+
+    def _copy(self, inh5, outh5):
+        """Recursively copy image data (see :func:`qpimage.core.copyh5`)"""
+        for key in inh5:
+            if isinstance(inh5[key], h5py.Group):
+                self._copy(inh5[key], outh5.create_group(key))
+            else:
+                data = inh5[key][:]
+                kwargs = dict(self.dataset_kw)
+                if kwargs["chunks"] is None:
+                    kwargs["chunks"] = data.shape
+                dset = outh5.create_dataset(key, data=data, **kwargs)
+                # see :func:`qpimage.image_data.write_image_dataset`
+                dset.attrs.create('CLASS', np.bytes_('IMAGE'))
+                dset.attrs.create('IMAGE_VERSION', np.bytes_('1.2'))
+                dset.attrs.create('IMAGE_SUBCLASS',
+                                  np.bytes_('IMAGE_GRAYSCALE'))
+                dset.attrs.update(inh5[key].attrs)
+        outh5.attrs.update(inh5.attrs)
+
+
+class FlatWriter(object):
+    def __init__(self, path, wavelength, pixel_size, medium_index,
+                 grid_size, angles, times, displacements,
+                 mode=["field", "fluorescence"], buffer_size=16,
+                 compression=None, compression_opts=None, chunks=None,
+                 dtype=float):
+        """Write sinogram frames to contiguous 3D HDF5 datasets
+
+        In contrast to :class:`SeriesWriter`, all frames are stored
+        in the datasets "field" and "fluorescence" of shape
+        (N, gx, gy). The datasets "angles", "times", and
+        "displacements" describe the frames. This layout allows
+        to efficiently read the sinogram (see :class:`FlatSinogram`).
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Output HDF5 file; existing datasets with the same shape
+            are overwritten frame by frame.
+        wavelength: float
+            Vacuum wavelength [m]
+        pixel_size: float
+            Pixel size [m]
+        medium_index: float
+            Medium refractive index
+        grid_size: tuple of int
+            Frame shape (gx, gy)
+        angles: 1d ndarray of size N
+            Rotational position of each frame [rad]
+        times: 1d ndarray of size N
+            Measurement time of each frame
+        displacements: 2d ndarray of shape (N, 2)
+            Lateral displacement of each frame [px]
+        mode: list of str
+            Imaging modalities ("field" and/or "fluorescence")
+        buffer_size: int
+            Number of frames that are held in memory before they
+            are written to the file
+        compression: str or None
+            HDF5 compression filter of the image datasets
+        compression_opts: int or None
+            Options of the compression filter
+        chunks: tuple or None
+            HDF5 chunk shape of the image datasets; the default
+            (None) uses one chunk per frame, i.e. (1, gx, gy).
+        dtype: dtype
+            Floating point type of the fluorescence data; the field
+            data are stored with the corresponding complex type.
+        """
+        self.path = pathlib.Path(path)
+        self.buffer_size = buffer_size
+        self.h5 = h5py.File(self.path, "a")
+        self.h5.attrs["layout"] = "flat"
+        self.h5.attrs["wavelength"] = wavelength
+        self.h5.attrs["pixel size"] = pixel_size
+        self.h5.attrs["medium index"] = medium_index
+        angles = np.asarray(angles, dtype=float)
+        for key, data in [("angles", angles),
+                          ("times", np.asarray(times, dtype=float)),
+                          ("displacements",
+                           np.asarray(displacements, dtype=float))]:
+            if key in self.h5:
+                del self.h5[key]
+            self.h5.create_dataset(key, data=data)
+        shape = (angles.size,) + tuple(grid_size)
+        if chunks is None:
+            chunks = (1,) + tuple(grid_size)
+        self._datasets = {}
+        self._counter = 0
+        self._buffer = []
+        for key, dtype in [("field", np.result_type(dtype, np.complex64)),
+                           ("fluorescence", np.dtype(dtype))]:
+            if key not in mode:
+                continue
+            if key in self.h5 and self.h5[key].shape != shape:
+                raise ValueError("Dataset '{}' in '{}' ".format(key, path)
+                                 + "has the shape {}, ".format(
+                                     self.h5[key].shape)
+                                 + "expected {}!".format(shape))
+            elif key not in self.h5:
+                self.h5.create_dataset(key,
+                                       shape=shape,
+                                       dtype=dtype,
+                                       chunks=chunks,
+                                       compression=compression,
+                                       compression_opts=compression_opts)
+            self._datasets[key] = self.h5[key]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Write all buffered frames and close the file"""
+        if self.h5 is not None:
+            try:
+                self.flush()
+            finally:
+                self.h5.close()
+                self.h5 = None
+
+    def flush(self):
+        """Write all buffered frames to the file"""
+        with profiling.stage("hdf5"):
+            indices = []
+            for field, fluor, index in self._buffer:
+                if field is not None:
+                    self._write_frame("field", index, field)
+                if fluor is not None:
+                    self._write_frame("fluorescence", index, fluor)
+                indices.append(index)
+            if indices and "progress" in self.h5:
+                # record the completed frames (see :func:`init_progress`)
+                self.h5["progress/completed"][sorted(indices)] = True
+            self._buffer.clear()
+            self.h5.flush()
+
+    def write(self, field, fluor, time=None, index=None):
+        """Add a frame
+
+        Parameters
+        ----------
+        field: 2d complex ndarray or None
+            Field data of the frame
+        fluor: 2d ndarray or None
+            Fluorescence data of the frame
+        time: float
+            Ignored (the times are stored on initialization)
+        index: int or None
+            Index of the frame; defaults to the index following
+            the last frame written.
+        """
+        if index is None:
+            index = self._counter
+        self._counter = index + 1
+        self._buffer.append((field, fluor, index))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def _write_frame(self, key, index, data):
+        self._datasets[key][index] = data
+
+
+class FlatSinogram(object):
+    def __init__(self, path):
+        """Read a sinogram written with :class:`FlatWriter`
+
+        The file is kept open until :func:`close` is called (use
+        this class as a context manager). The attributes `field`
+        and `fluorescence` are :class:`h5py.Dataset` instances, i.e.
+        the data are only read when they are sliced.
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            HDF5 file
+        """
+        self.path = pathlib.Path(path)
+        self.h5 = h5py.File(self.path, "r")
+        if self.h5.attrs.get("layout") != "flat":
+            self.h5.close()
+            raise ValueError("'{}' was not written ".format(path)
+                             + "with the flat layout!")
+        #: field sinogram (3d dataset or None)
+        self.field = self.h5.get("field")
+        #: fluorescence sinogram (3d dataset or None)
+        self.fluorescence = self.h5.get("fluorescence")
+        #: rotational positions [rad]
+        self.angles = self.h5["angles"][:]
+        #: measurement times
+        self.times = self.h5["times"][:]
+        #: lateral displacements [px]
+        self.displacements = self.h5["displacements"][:]
+        #: wavelength [m]
+        self.wavelength = self.h5.attrs["wavelength"]
+        #: pixel size [m]
+        self.pixel_size = self.h5.attrs["pixel size"]
+        #: medium refractive index
+        self.medium_index = self.h5.attrs["medium index"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.angles.size
+
+    def close(self):
+        self.h5.close()
+
+
+class ThreadedWriter(object):
+    def __init__(self, writer, max_pending=16):
+        """Write frames in a background thread
+
+        Frames passed to :func:`write` are put into a queue that is
+        processed by a dedicated thread, such that writing to disk
+        overlaps with the computation of the next frames.
+
+        Parameters
+        ----------
+        writer: SeriesWriter or FlatWriter
+            Writer that is used (and closed) by the background thread
+        max_pending: int
+            Maximum number of frames in the queue; :func:`write`
+            blocks if the queue is full (backpressure).
+
+        Notes
+        -----
+        An exception raised in the background thread is raised
+        again by the next call to :func:`write` or by :func:`close`.
+        Frames that are queued after an error are discarded.
+        """
+        self.writer = writer
+        self._queue = queue.Queue(maxsize=max_pending)
+        #: exception raised in the background thread (until re-raised)
+        self._error = None
+        #: whether an exception occurred in the background thread
+        self._failed = False
+        self._thread = threading.Thread(target=self._run,
+                                        name="cellsino-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Write all queued frames, close the writer, and stop the thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._raise_error()
+
+    def write(self, field, fluor, time, index=None):
+        """Queue a frame (see :func:`SeriesWriter.write`)"""
+        self._raise_error()
+        self._queue.put((field, fluor, time, index))
+
+    def _raise_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+
+    def _run(self):
+        """Write the queued frames (executed in the background thread)"""
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if not self._failed:
+                    try:
+                        self.writer.write(*item)
+                    except BaseException as exc:
+                        # discard the remaining frames
+                        self._error = exc
+                        self._failed = True
+        finally:
+            try:
+                self.writer.close()
+            except BaseException as exc:
+                if not self._failed:
+                    self._error = exc
+                    self._failed = True
+
+
+def init_progress(path, parameters, size):
+    """Record or check the progress of a sinogram computation
+
+    The simulation parameters and the completed frames are stored
+    in the group "progress" of the HDF5 file, such that an
+    interrupted computation can be resumed.
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Output HDF5 file (created if it does not exist)
+    parameters: dict
+        JSON-serializable simulation parameters
+    size: int
+        Number of frames of the sinogram
+
+    Returns
+    -------
+    completed: 1d boolean ndarray of size `size`
+        Frames that are already stored in the file
+
+    Notes
+    -----
+    Frames are written in the order of their indices. Frames in the
+    series that were not recorded as completed (e.g. because the
+    computation was interrupted while the frames were written) are
+    removed from the file.
+    """
+    pstring = json.dumps(parameters, sort_keys=True)
+    with h5py.File(path, "a") as h5:
+        if "progress" in h5:
+            old = h5["progress"].attrs["parameters"]
+            if json.loads(old) != json.loads(pstring):
+                raise ValueError("Cannot resume '{}', ".format(path)
+                                 + "because the simulation parameters "
+                                 + "do not match!")
+            completed = np.array(h5["progress/completed"][:], dtype=bool)
+            if completed.size != size:
+                raise ValueError("Cannot resume '{}', ".format(path)
+                                 + "because the number of frames does "
+                                 + "not match!")
+        elif any(key in h5 for key in ["qpseries", "flseries",
+                                       "field", "fluorescence"]):
+            raise ValueError("Cannot resume '{}', ".format(path)
+                             + "because no progress was recorded!")
+        else:
+            group = h5.create_group("progress")
+            group.attrs["parameters"] = pstring
+            group.create_dataset("completed", data=np.zeros(size, dtype=bool))
+            completed = np.zeros(size, dtype=bool)
+        num = int(completed.sum())
+        if not np.all(completed[:num]):
+            raise ValueError("Cannot resume '{}', ".format(path)
+                             + "because the frames are not in order!")
+        # remove frames that were written but not recorded
+        for group, prefix in [("qpseries", "qpi_"), ("flseries", "fli_")]:
+            if group in h5:
+                for key in list(h5[group].keys()):
+                    if (key.startswith(prefix)
+                            and int(key[len(prefix):]) >= num):
+                        del h5[group][key]
+    return completed
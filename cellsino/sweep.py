@@ -0,0 +1,319 @@
+import collections
+import concurrent.futures
+import copy
+import itertools
+import json
+import os
+import pathlib
+
+from .cache import DiskCache, _json_default
+from .phantoms import phan_dict
+from .propagators import FieldCache
+from .sinogram import Sinogram
+
+
+#: parameters passed to :class:`cellsino.Sinogram`
+SINOGRAM_KEYS = ["phantom", "wavelength", "pixel_size", "grid_size"]
+#: default maximum size of the frame cache of a sweep [bytes]
+CACHE_SIZE = 2**30
+#: parameters passed to :func:`cellsino.Sinogram.compute`
+COMPUTE_KEYS = ["angles", "axis_roll", "displacements", "times", "mode",
+                "propagator", "bleach_decay", "fluorescence_background",
+                "field_cache", "fluorescence_projector"]
+
+
+def load_config(path):
+    """Load a sweep configuration from a TOML file
+
+    Relative paths in the "sweep" table are interpreted relative
+    to the location of the configuration file.
+    """
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        import tomli as tomllib
+    path = pathlib.Path(path)
+    with path.open("rb") as fd:
+        config = tomllib.load(fd)
+    sweep = config.setdefault("sweep", {})
+    for key in ["output", "cache_dir"]:
+        if sweep.get(key):
+            sweep[key] = str(path.parent / sweep[key])
+    return config
+
+
+def expand_grid(config):
+    """Expand the parameter grid of a sweep configuration
+
+    Parameters
+    ----------
+    config: dict
+        Sweep configuration with the tables
+
+        - "parameters": fixed parameters of :class:`cellsino.Sinogram`
+          and :func:`cellsino.Sinogram.compute`
+        - "phantom_kw": fixed keyword arguments for the phantom
+          class (e.g. "nucleoli_index" for "simple cell")
+        - "grid": lists of values for any of the above parameters;
+          lists of phantom keyword arguments are given in the
+          sub-table "grid.phantom_kw". All combinations are computed.
+
+    Returns
+    -------
+    jobs: list of dict
+        Each job has the keys "name" (unique name derived from the
+        parameters), "parameters", and "phantom_kw".
+    """
+    params = dict(config.get("parameters", {}))
+    phantom_kw = dict(config.get("phantom_kw", {}))
+    grid = dict(config.get("grid", {}))
+    grid_phantom = dict(grid.pop("phantom_kw", {}))
+    for key in list(params) + list(grid):
+        if key not in SINOGRAM_KEYS + COMPUTE_KEYS:
+            raise ValueError("Unknown sweep parameter: '{}'".format(key))
+    for key in ["wavelength", "pixel_size", "grid_size"]:
+        if key not in params and key not in grid:
+            raise ValueError("Sweep parameter '{}' missing!".format(key))
+    params.setdefault("phantom", "simple cell")
+
+    axes = [("parameters", key, values) for key, values in grid.items()] \
+        + [("phantom_kw", key, values) for key, values in grid_phantom.items()]
+    jobs = []
+    for combination in itertools.product(*[ax[2] for ax in axes]):
+        job = {"parameters": copy.deepcopy(params),
+               "phantom_kw": copy.deepcopy(phantom_kw)}
+        for (table, key, _), value in zip(axes, combination):
+            job[table][key] = value
+        job["name"] = "job_" + DiskCache.hash(
+            [job["parameters"], job["phantom_kw"]])[:16]
+        jobs.append(job)
+    return jobs
+
+
+def run_sweep(config, output=None, workers=None, cache_dir=None,
+              max_bytes=None, resume=True, verbose=False):
+    """Compute all sinograms of a parameter sweep
+
+    Parameters
+    ----------
+    config: dict, str, or pathlib.Path
+        Sweep configuration (see :func:`expand_grid`) or path to a
+        TOML file (see :func:`load_config`). The optional "sweep"
+        table may define "output", "workers", "cache_dir", and
+        "cache_size" (in MB), which are overridden by the keyword
+        arguments.
+    output: str or pathlib.Path
+        Output HDF5 file; each job is written to a separate group
+        (see :class:`cellsino.storage.SeriesWriter`) whose attributes
+        hold the job parameters. A manifest of all jobs is written
+        to a JSON file with the suffix ".manifest.json".
+    workers: int or None
+        Number of worker processes; jobs are computed in parallel.
+        Each worker writes its job to a temporary HDF5 file in the
+        directory with the suffix ".jobs" next to `output`, which
+        is copied to `output` and removed when the job is finished.
+        At most two jobs per worker are submitted at a time.
+    cache_dir: str, pathlib.Path, or None
+        Directory of a :class:`cellsino.cache.DiskCache` shared by
+        all jobs (e.g. fluorescence data do not depend on the
+        wavelength or on refractive indices). Defaults to the
+        directory with the suffix ".cache" next to `output`; set
+        to an empty string to disable caching.
+    max_bytes: int or None
+        Maximum size of the frame cache [bytes]; defaults to
+        :data:`CACHE_SIZE`. Set to 0 for an unbounded cache.
+    resume: bool
+        If True, jobs that are already in `output` are skipped.
+        Otherwise, existing jobs are recomputed.
+    verbose: bool
+        Print the progress
+
+    Returns
+    -------
+    manifest: list of dict
+        Name, parameters, and status ("done" or "skipped") of each job
+    """
+    import h5py
+
+    if not isinstance(config, dict):
+        config = load_config(config)
+    sweep = config.get("sweep", {})
+    output = output or sweep.get("output")
+    if not output:
+        raise ValueError("No output file specified!")
+    output = pathlib.Path(output)
+    if workers is None:
+        workers = sweep.get("workers")
+    if cache_dir is None:
+        cache_dir = sweep.get("cache_dir", str(output) + ".cache")
+    if max_bytes is None:
+        if "cache_size" in sweep:
+            max_bytes = int(sweep["cache_size"] * 2**20)
+        else:
+            max_bytes = CACHE_SIZE
+    if cache_dir:
+        disk_cache = DiskCache(cache_dir, max_bytes=max_bytes or None)
+    else:
+        disk_cache = None
+
+    jobs = expand_grid(config)
+    # The field cache (if requested) is shared between all jobs; each
+    # worker process uses its own instance (see `MemoryCache`).
+    if any(job["parameters"].get("field_cache") for job in jobs):
+        field_cache = FieldCache()
+    else:
+        field_cache = None
+    manifest = collections.OrderedDict()
+    with h5py.File(output, "a") as h5:
+        todo = []
+        for job in jobs:
+            status = "pending"
+            if job["name"] in h5:
+                if resume and h5[job["name"]].attrs.get("finished", False):
+                    status = "skipped"
+                else:
+                    del h5[job["name"]]
+            manifest[job["name"]] = {"name": job["name"],
+                                     "parameters": job["parameters"],
+                                     "phantom_kw": job["phantom_kw"],
+                                     "status": status}
+            if status == "pending":
+                todo.append(job)
+        _write_manifest(output, manifest)
+
+        if workers is not None and workers > 1:
+            # Each worker writes its job to a temporary file, such that
+            # the frames are not sent back to (and collected in) this
+            # process.
+            job_dir = pathlib.Path(str(output) + ".jobs")
+            job_dir.mkdir(exist_ok=True)
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            results = _map_jobs(pool=pool,
+                                jobs=todo,
+                                targets=[job_dir / (job["name"] + ".h5")
+                                         for job in todo],
+                                max_pending=2 * workers,
+                                field_cache=field_cache,
+                                disk_cache=disk_cache)
+        else:
+            pool = None
+            results = (_run_job(job=job,
+                                target=h5.create_group(job["name"]),
+                                field_cache=field_cache,
+                                disk_cache=disk_cache)
+                       for job in todo)
+        try:
+            for ii, (job, target) in enumerate(results):
+                if isinstance(target, h5py.Group):
+                    group = target
+                else:
+                    group = h5.create_group(job["name"])
+                    with h5py.File(target, "r") as src:
+                        for key in src:
+                            src.copy(src[key], group, name=key)
+                        group.attrs.update(src.attrs)
+                    target.unlink()
+                group.attrs["parameters"] = json.dumps(
+                    job["parameters"], default=_json_default)
+                group.attrs["phantom_kw"] = json.dumps(
+                    job["phantom_kw"], default=_json_default)
+                group.attrs["finished"] = True
+                h5.flush()
+                manifest[job["name"]]["status"] = "done"
+                _write_manifest(output, manifest)
+                if verbose:
+                    print("{}/{}: {}".format(ii + 1, len(todo), job["name"]))
+        finally:
+            if pool is not None:
+                results.close()
+                pool.shutdown()
+                try:
+                    job_dir.rmdir()
+                except OSError:
+                    # files of interrupted jobs
+                    pass
+    return list(manifest.values())
+
+
+def _map_jobs(pool, jobs, targets, max_pending, field_cache, disk_cache):
+    """Compute sweep jobs in `pool` and yield them when they are done
+
+    At most `max_pending` jobs are submitted at a time; the jobs
+    are yielded in the order in which they are finished (see
+    :func:`_run_job` for the other parameters).
+    """
+    items = iter(zip(jobs, targets))
+    pending = set()
+    try:
+        while True:
+            for job, target in items:
+                pending.add(pool.submit(_run_job,
+                                        job=job,
+                                        target=target,
+                                        field_cache=field_cache,
+                                        disk_cache=disk_cache))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _run_job(job, target, field_cache, disk_cache):
+    """Compute the sinogram of a sweep job and write it to `target`
+
+    Parameters
+    ----------
+    job: dict
+        The job (see :func:`expand_grid`)
+    target: h5py.Group or pathlib.Path
+        HDF5 group or file (overwritten) to which the frames are
+        written with :class:`cellsino.storage.SeriesWriter`
+    field_cache: cellsino.propagators.FieldCache or None
+        Field cache used if the job parameter "field_cache" is set
+    disk_cache: cellsino.cache.DiskCache or None
+        Frame cache
+
+    Returns
+    -------
+    job: dict
+        The job
+    target: h5py.Group or pathlib.Path
+        The target
+    """
+    from .storage import SeriesWriter
+
+    params = dict(job["parameters"])
+    phantom = phan_dict[params.pop("phantom")](**job["phantom_kw"])
+    sino = Sinogram(phantom=phantom,
+                    **{key: params.pop(key) for key in SINOGRAM_KEYS[1:]})
+    if params.get("field_cache"):
+        params["field_cache"] = field_cache
+    if isinstance(target, pathlib.Path) and target.exists():
+        # left over from an interrupted sweep
+        target.unlink()
+    with SeriesWriter(path=target,
+                      wavelength=sino.wavelength,
+                      pixel_size=sino.pixel_size,
+                      medium_index=phantom.medium_index) as writer:
+        # The frames are computed in chunks (vectorized fluorescence).
+        for _, _, time, field, fluor in sino.iter_frames(
+                disk_cache=disk_cache, chunk_size=None, **params):
+            writer.write(field=field, fluor=fluor, time=time)
+    return job, target
+
+
+def _write_manifest(output, manifest):
+    """Atomically write the manifest of a sweep to a JSON file"""
+    path = pathlib.Path(str(output) + ".manifest.json")
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w") as fd:
+        json.dump(list(manifest.values()), fd, indent=2,
+                  default=_json_default)
+    os.replace(str(tmp), str(path))
@@ -29,8 +29,16 @@ setup(
                       "qpimage",
                       "qpsphere>=0.5.0",
                       "numpy>=1.12.0",
+                      "scikit-image",
+                      "scipy",
+                      "tomli; python_version < '3.11'",
                       ],
-    python_requires='>=3.6, <4',
+    entry_points={
+        "console_scripts": [
+            "cellsino-sweep = cellsino.cli:sweep",
+        ],
+    },
+    python_requires='>=3.7, <4',
     keywords=["phase microscopy",
               "fluorescence imaging",
               "optical tomography",
@@ -0,0 +1,69 @@
+"""Functions shared by the tests"""
+import inspect
+import pathlib
+import tempfile
+
+import h5py
+import numpy as np
+
+import cellsino
+
+
+class CrashAfter(object):
+    """Progress counter that raises an error after `num` frames"""
+
+    def __init__(self, num):
+        self.num = num
+        self._value = 0
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        if value >= self.num:
+            raise KeyboardInterrupt("Simulated crash")
+
+
+def assert_h5_equal(h5a, h5b):
+    """Assert that two HDF5 groups have the same data and attributes"""
+    assert sorted(h5a.keys()) == sorted(h5b.keys())
+    assert sorted(h5a.attrs.keys()) == sorted(h5b.attrs.keys())
+    for key in h5a.attrs:
+        assert np.all(h5a.attrs[key] == h5b.attrs[key]), key
+    for key in h5a:
+        if isinstance(h5a[key], h5py.Group):
+            assert_h5_equal(h5a[key], h5b[key])
+        else:
+            assert h5a[key].dtype == h5b[key].dtype
+            assert h5a[key].chunks == h5b[key].chunks
+            assert h5a[key].compression == h5b[key].compression
+            assert np.all(h5a[key][:] == h5b[key][:])
+
+
+def get_sinogram(grid_size=(25, 25)):
+    """Return a sinogram of the simple cell phantom"""
+    kw = {"phantom": "simple cell",
+          "wavelength": 550e-9,
+          "pixel_size": 0.7e-6,
+          "grid_size": grid_size,
+          }
+    return cellsino.Sinogram(**kw)
+
+
+def run_tests(loc):
+    """Run all tests of a test module (e.g. ``run_tests(locals())``)
+
+    Tests with the argument `tmp_path` are given a temporary
+    directory that is removed afterwards (like the pytest fixture).
+    """
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            if "tmp_path" in inspect.signature(loc[key]).parameters:
+                with tempfile.TemporaryDirectory(
+                        prefix="cellsino_test_") as tmp:
+                    loc[key](tmp_path=pathlib.Path(tmp))
+            else:
+                loc[key]()
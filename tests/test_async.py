@@ -0,0 +1,90 @@
+import asyncio
+import concurrent.futures
+
+import numpy as np
+import pytest
+
+from cellsino.aio import Progress
+
+from helpers import get_sinogram
+
+
+kw = {"angles": 20,
+      "propagator": "projection",
+      "bleach_decay": .1,
+      }
+
+
+def test_compute_async():
+    sino = get_sinogram()
+    field, fluor = sino.compute(**kw)
+    field_a, fluor_a = asyncio.run(sino.compute_async(**kw))
+    assert np.all(field == field_a)
+    assert np.all(fluor == fluor_a)
+
+
+def test_compute_async_process_pool():
+    sino = get_sinogram()
+    fluor = sino.compute(mode="fluorescence", **kw)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as pool:
+        fluor_a = asyncio.run(sino.compute_async(mode="fluorescence",
+                                                 executor=pool, **kw))
+    assert np.all(fluor == fluor_a)
+
+
+def test_aiter_frames_progress():
+    sino = get_sinogram()
+    progress = Progress()
+    updates = []
+
+    async def watch():
+        async for done, total in progress:
+            updates.append((done, total))
+
+    async def run():
+        watcher = asyncio.ensure_future(watch())
+        indices = []
+        async for ii, _, _, _, _ in sino.aiter_frames(progress=progress,
+                                                      **kw):
+            indices.append(ii)
+            # give the watcher a chance to run
+            await asyncio.sleep(0)
+        await watcher
+        return indices
+
+    indices = asyncio.run(run())
+    assert indices == list(range(20))
+    assert progress.finished
+    assert updates[-1] == (20, 20)
+    # all frames were reported in order
+    done = [uu[0] for uu in updates]
+    assert done == sorted(done)
+    assert len(updates) > 10
+
+
+def test_compute_async_cancel():
+    sino = get_sinogram()
+    progress = Progress()
+
+    async def run():
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            task = asyncio.ensure_future(
+                sino.compute_async(executor=pool, progress=progress,
+                                   angles=64, propagator="projection"))
+            while progress.done == 0:
+                await progress.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(run())
+    assert progress.finished
+    assert 0 < progress.done < 64
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
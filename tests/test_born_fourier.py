@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+import cellsino
+from cellsino.elements import Sphere
+from cellsino.phantoms.base_phantom import BasePhantom
+from cellsino.propagators import BornFourier, RytovFourier, prop_dict
+from cellsino.propagators.pp_born_fourier import SpectrumMemoryWarning
+
+
+def get_phantom(center=(1e-6, -.5e-6, 0)):
+    ph = BasePhantom(medium_index=1.335)
+    ph.append(Sphere(object_index=1.34,
+                     medium_index=1.335,
+                     fl_brightness=1,
+                     center=center,
+                     radius=3e-6))
+    return ph
+
+
+kw = {"grid_size": (48, 48),
+      "pixel_size": .3e-6,
+      "wavelength": 550e-9}
+
+
+def test_available():
+    assert prop_dict["born-fourier"] is BornFourier
+    assert prop_dict["rytov-fourier"] is RytovFourier
+
+
+def test_rytov_fourier_vs_rytov():
+    ph = get_phantom()
+    angles = np.linspace(0, np.pi, 4)
+    displacements = np.ones((4, 2)) * 1.5
+    field1 = RytovFourier(phantom=ph, **kw).propagate_angles(
+        angles=angles, axis_roll=.2, displacements=displacements)
+    field2 = prop_dict["rytov"](phantom=ph, **kw).propagate_angles(
+        angles=angles, axis_roll=.2, displacements=displacements)
+    assert field1.shape == (4, 48, 48)
+    phase = np.angle(field1 / field2)
+    assert np.sqrt(np.mean(phase**2)) < 0.005
+    assert np.abs(phase).max() < 0.05
+
+
+def test_born_vs_rytov_linearization():
+    ph = get_phantom()
+    born = BornFourier(phantom=ph, **kw).propagate_array()
+    rytov = RytovFourier(phantom=ph, **kw).propagate_array()
+    # the linearizations agree for the complex phase
+    assert np.allclose(born - 1, np.log(rytov), rtol=0, atol=1e-12)
+
+
+def test_rotation_invariance():
+    # a sphere at the origin is the same in all frames
+    ph = get_phantom(center=(0, 0, 0))
+    angles = np.linspace(0, 2*np.pi, 7)
+    fields = RytovFourier(phantom=ph, **kw).propagate_angles(
+        angles=angles, axis_roll=.5)
+    for field in fields[1:]:
+        # interpolation errors in the rotated spectrum
+        error = np.abs(field - fields[0])
+        assert np.sqrt(np.mean(error**2)) < 5e-3
+        assert error.max() < 0.05
+
+
+def test_propagate_sphere():
+    ph = get_phantom()
+    pp = RytovFourier(phantom=ph, **kw)
+    qpi = pp.propagate_sphere(list(ph)[0])
+    assert np.allclose(qpi.field, pp.propagate_array())
+
+
+def test_sinogram():
+    sino = cellsino.Sinogram(phantom="simple cell",
+                             wavelength=550e-9,
+                             pixel_size=.4e-6,
+                             grid_size=(40, 40))
+    field1 = sino.compute(angles=4, mode="field", propagator="rytov-fourier")
+    field2 = sino.compute(angles=4, mode="field", propagator="rytov")
+    assert field1.shape == (4, 40, 40)
+    phase = np.angle(field1 / field2)
+    # similar to the deviation of the projection approximation
+    assert np.sqrt(np.mean(phase**2)) < 0.1
+
+
+def test_spectrum_memory():
+    pp = BornFourier(phantom=get_phantom(center=(0, 1e-6, 0)), **kw)
+    spectrum, peak = pp.get_spectrum_memory()
+    assert spectrum == pp.get_spectrum()[0].nbytes
+    assert peak > spectrum
+    # warn for large phantoms
+    pp = BornFourier(phantom=get_phantom(center=(0, 2e-6, 0)), **kw)
+    pp.warn_bytes = peak - 1
+    with pytest.warns(SpectrumMemoryWarning, match="96\\^3 voxels"):
+        pp.get_spectrum()
+
+
+def test_spectrum_cache():
+    _spectra = cellsino.propagators.pp_born_fourier._spectra
+    cellsino.clear_caches()
+    assert len(_spectra) == 0
+    pp = BornFourier(phantom=get_phantom(), **kw)
+    spectrum, offset = pp.get_spectrum()
+    assert len(_spectra) == 1
+    assert _spectra.nbytes == spectrum.nbytes + offset.nbytes
+    # spectra larger than the limit are not kept
+    max_bytes = _spectra.max_bytes
+    try:
+        _spectra.max_bytes = spectrum.nbytes
+        pp2 = BornFourier(phantom=get_phantom(center=(0, 0, 0)), **kw)
+        pp2.get_spectrum()
+        assert len(_spectra) == 1
+        assert _spectra.nbytes == spectrum.nbytes + offset.nbytes
+    finally:
+        _spectra.max_bytes = max_bytes
+    cellsino.clear_caches()
+    assert len(_spectra) == 0
+    assert _spectra.nbytes == 0
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,185 @@
+import os
+from unittest import mock
+
+import numpy as np
+
+from cellsino.cache import DiskCache
+
+from helpers import get_sinogram, run_tests
+
+
+def test_store_load(tmp_path):
+    path = tmp_path / "cache"
+    cache = DiskCache(path)
+    data = np.arange(12).reshape(3, 4) + 1j
+    key = ("field", 1.5, np.float64(2), [1, 2])
+    assert cache.load(key) is None
+    assert cache.misses == 1
+    cache.store(key, data)
+    assert key in cache
+    assert len(cache) == 1
+    assert np.all(cache.load(key) == data)
+    assert cache.hits == 1
+    # equivalent keys
+    assert cache.hash(key) == cache.hash(("field", 1.5, 2.0, (1, 2)))
+    assert cache.hash(key) != cache.hash(("field", 1.5, 2.1, (1, 2)))
+    # get computes missing items only
+    value = cache.get("other", lambda: np.ones(3))
+    assert np.all(value == 1)
+    value = cache.get("other", lambda: np.zeros(3))
+    assert np.all(value == 1)
+    # a new instance uses the same data
+    assert len(DiskCache(path)) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_corrupt_file(tmp_path):
+    path = tmp_path / "cache"
+    cache = DiskCache(path)
+    cache.store("key", np.ones(10))
+    cache._get_path("key").write_bytes(b"not a numpy file")
+    assert cache.load("key") is None
+    assert "key" not in cache
+
+
+def test_eviction(tmp_path):
+    path = tmp_path / "cache"
+    data = np.zeros(1000)
+    fsize = 8000 + 128  # data and .npy header
+    cache = DiskCache(path, max_bytes=3 * fsize)
+    for ii in range(3):
+        cache.store(ii, data)
+    assert len(cache) == 3
+    # define the access order, then mark item 0 as recently used
+    for ii in range(3):
+        os.utime(str(cache._get_path(ii)), (1e9 + ii, 1e9 + ii))
+    cache.load(0)
+    # files are removed until 90% of `max_bytes` are reached
+    cache.store(3, data)
+    assert len(cache) == 2
+    assert 0 in cache
+    assert 1 not in cache
+    assert 2 not in cache
+    assert 3 in cache
+
+
+def test_eviction_shared(tmp_path):
+    path = tmp_path / "cache"
+    data = np.zeros(1000)
+    fsize = 8000 + 128  # data and .npy header
+    # two instances (e.g. in different processes) share the limit
+    caches = [DiskCache(path, max_bytes=4 * fsize) for _ in range(2)]
+    for cache in caches:
+        cache.rescan_interval = 2
+    for ii in range(6):
+        for jj, cache in enumerate(caches):
+            cache.store((ii, jj), data)
+            # each instance knows at least its own files
+            assert len(cache) <= 4 + 2
+    # the directory is listed when the next write is due
+    caches[0].rescan_interval = 1
+    caches[0].store("last", data)
+    assert len(caches[0]) <= 4
+    assert "last" in caches[0]
+
+
+def test_eviction_rescan(tmp_path):
+    class CountingCache(DiskCache):
+        listed = 0
+
+        def _evict(self):
+            self.listed += 1
+            return super(CountingCache, self)._evict()
+
+    data = np.zeros(1000)
+    fsize = 8000 + 128  # data and .npy header
+    cache = CountingCache(tmp_path / "cache", max_bytes=100 * fsize)
+    # the directory is only listed for the first write
+    for ii in range(100):
+        cache.store(ii, data)
+    assert cache.listed == 1
+    # exceeding the limit removes files down to 90% of `max_bytes`
+    cache.store(100, data)
+    assert cache.listed == 2
+    assert len(cache) == 90
+    for ii in range(10):
+        cache.store(101 + ii, data)
+    assert cache.listed == 2
+    assert len(cache) == 100
+    # after `rescan_interval` writes
+    cache.max_bytes = 10**9
+    for ii in range(cache.rescan_interval):
+        cache.store(200 + ii, data)
+    assert cache.listed == 3
+
+
+def test_permission_error(tmp_path):
+    cache = DiskCache(tmp_path / "cache", max_bytes=10**6)
+    cache.store("key", np.ones(10))
+    # files in use by another process on Windows
+    with mock.patch("os.replace", side_effect=PermissionError):
+        cache.store("other", np.ones(10))
+    assert "other" not in cache
+    assert len(list((tmp_path / "cache").glob("*/.tmp_*"))) == 0
+    with mock.patch("numpy.load", side_effect=PermissionError):
+        assert cache.load("key") is None
+    assert "key" in cache
+    assert np.all(cache.load("key") == 1)
+    with mock.patch("os.remove", side_effect=PermissionError):
+        cache.clear()
+    assert "key" in cache
+
+
+def test_sinogram(tmp_path):
+    path = tmp_path / "cache"
+    sino = get_sinogram()
+    kw = {"angles": 5,
+          "propagator": "projection",
+          "displacements": .5,
+          "bleach_decay": .1}
+    field_ref, fluor_ref = sino.compute(**kw)
+
+    cache = DiskCache(path)
+    field1, fluor1 = sino.compute(disk_cache=cache, **kw)
+    assert cache.hits == 0
+    assert len(cache) == 10
+    assert np.all(field1 == field_ref)
+    assert np.all(fluor1 == fluor_ref)
+
+    field2, fluor2 = sino.compute(disk_cache=cache, **kw)
+    assert cache.hits == 10
+    assert np.all(field2 == field_ref)
+    assert np.all(fluor2 == fluor_ref)
+
+    # fluorescence is reused for different bleaching and background
+    kw2 = dict(kw)
+    kw2["bleach_decay"] = .3
+    kw2["fluorescence_background"] = 2
+    _, fluor_ref3 = sino.compute(**kw2)
+    fluor3 = sino.compute(disk_cache=path, mode="fluorescence", **kw2)
+    assert np.all(fluor3 == fluor_ref3)
+    assert len(cache) == 10
+
+    # different settings are not reused
+    sino.compute(disk_cache=cache, mode="field", angles=5,
+                 propagator="rytov")
+    assert len(cache) == 15
+
+
+def test_sinogram_parallel(tmp_path):
+    path = tmp_path / "cache"
+    sino = get_sinogram()
+    kw = {"angles": 6,
+          "propagator": "projection"}
+    field_ref, fluor_ref = sino.compute(**kw)
+    for _ in range(2):
+        field, fluor = sino.compute(disk_cache=path, workers=2, **kw)
+        assert np.all(field == field_ref)
+        assert np.all(fluor == fluor_ref)
+    assert len(DiskCache(path)) == 12
+
+
+if __name__ == "__main__":
+    # Run all tests
+    run_tests(locals())
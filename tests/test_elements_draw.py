@@ -0,0 +1,56 @@
+import numpy as np
+
+import cellsino
+from cellsino.elements import Sphere
+
+
+def draw_sphere_full(sphere, grid_size, pixel_size):
+    """Evaluate the sphere on the full grid (reference)"""
+    center = np.array(grid_size) / 2 - .5
+    x = (np.arange(grid_size[0]) - center[0]) * pixel_size
+    y = (np.arange(grid_size[1]) - center[1]) * pixel_size
+    z = (np.arange(grid_size[2]) - center[2]) * pixel_size
+    xx, yy, zz = np.meshgrid(x, y, z, indexing="ij", sparse=True)
+    cy, cz, cx = sphere.center
+    return (cx-xx)**2 + (cy-yy)**2 + (cz-zz)**2 <= sphere.radius**2
+
+
+def test_sphere_draw():
+    grid_size = (30, 34, 32)
+    for center in [(0, 0, 0), (1e-6, -4e-6, 6e-6), (8e-6, 0, 0)]:
+        sphere = Sphere(object_index=1.36,
+                        medium_index=1.335,
+                        fl_brightness=2,
+                        center=center,
+                        radius=3.1e-6)
+        inside = draw_sphere_full(sphere, grid_size, .5e-6)
+        ri, fl = sphere.draw(grid_size, .5e-6)
+        assert np.all(ri[inside] == 1.36)
+        assert np.all(ri[~inside] == 1.335)
+        assert np.all(fl[inside] == 2)
+        assert np.all(fl[~inside] == 0)
+        # partially outside of the volume
+        if center[0] == 8e-6:
+            assert 0 < np.sum(inside) < 4/3*np.pi*(3.1/.5)**3
+
+
+def test_phantom_draw_into():
+    phantom = cellsino.phantoms.SimpleCell()
+    grid_size = (40, 40, 40)
+    ri, fl = phantom.draw(grid_size, .35e-6)
+    ri_ref = np.ones(grid_size) * phantom.medium_index
+    fl_ref = np.zeros(grid_size)
+    for el in phantom:
+        riel, flel = el.draw(grid_size, .35e-6)
+        ri_ref += riel - el.medium_index
+        fl_ref += flel
+    assert np.all(ri == ri_ref)
+    assert np.all(fl == fl_ref)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,193 @@
+import concurrent.futures
+import pickle
+
+import numpy as np
+
+import cellsino
+from cellsino.elements import Sphere
+from cellsino.phantoms.base_phantom import BasePhantom
+from cellsino.propagators import FieldCache, prop_dict
+from cellsino.propagators.field_cache import fourier_shift
+
+
+def test_fourier_shift_integer():
+    data = np.random.RandomState(42).rand(10, 12)
+    assert np.allclose(fourier_shift(data, (2, -3)),
+                       np.roll(data, (2, -3), axis=(0, 1)),
+                       rtol=0, atol=1e-14)
+
+
+def test_fourier_shift_subpixel():
+    x = np.arange(64).reshape(-1, 1)
+    y = np.arange(64).reshape(1, -1)
+    gauss = np.exp(-((x-30)**2 + (y-32)**2)/20)
+    gauss_shifted = np.exp(-((x-30.3)**2 + (y-31.6)**2)/20)
+    assert np.allclose(fourier_shift(gauss, (.3, -.4)), gauss_shifted,
+                       rtol=0, atol=1e-10)
+
+
+def test_field_cache_exact_integer_positions():
+    # At angle zero, all sphere centers of the simple cell phantom
+    # are located at integer pixel positions for this pixel size.
+    phantom = cellsino.phantoms.SimpleCell()
+    cache = FieldCache()
+    kw = {"phantom": phantom,
+          "grid_size": (64, 64),
+          "pixel_size": .25e-6,
+          "wavelength": 550e-9,
+          "displacement": (1, -2),
+          }
+    field1 = prop_dict["projection"](**kw).propagate_array()
+    field2 = prop_dict["projection"](field_cache=cache,
+                                     **kw).propagate_array()
+    assert np.allclose(field1, field2, rtol=0, atol=1e-12)
+    # the two nucleoli share the same cached field
+    assert cache.misses == 4
+
+
+def test_field_cache_sinogram():
+    sino = cellsino.Sinogram(phantom="simple cell",
+                             wavelength=550e-9,
+                             pixel_size=.25e-6,
+                             grid_size=(64, 64))
+    cache = FieldCache()
+    kw = {"angles": 6,
+          "mode": "field",
+          "propagator": "projection"}
+    field1 = sino.compute(**kw)
+    field2 = sino.compute(field_cache=cache, **kw)
+    # 3 unique spheres, focus-independent (the nucleus shell
+    # has no refractive index contrast and is not computed)
+    assert cache.misses == 3
+    # the cytoplasm is located on the rotational axis and is
+    # only computed in the first frame
+    assert cache.hits == 16
+    # errors due to ringing at the sphere edges
+    assert np.sqrt(np.mean(np.abs(field1 - field2)**2)) < 0.05
+    # reuse the cache
+    field3 = sino.compute(field_cache=cache, **kw)
+    assert cache.misses == 3
+    assert np.all(field2 == field3)
+
+
+def test_field_cache_pickle():
+    cache = FieldCache(focus_step=.5)
+    cache.get("key", lambda: 1)
+    cache2 = pickle.loads(pickle.dumps(cache))
+    cache3 = pickle.loads(pickle.dumps(cache))
+    assert cache2 is cache3
+    assert cache2.focus_step == .5
+    assert len(cache2) == 0
+    assert len(cache) == 1
+
+
+def test_field_cache_workers():
+    sino = cellsino.Sinogram(phantom="simple cell",
+                             wavelength=550e-9,
+                             pixel_size=.25e-6,
+                             grid_size=(32, 32))
+    kw = {"angles": 4,
+          "mode": "field",
+          "propagator": "projection",
+          "field_cache": True}
+    field1 = sino.compute(**kw)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=2) as ex:
+        field2 = sino.compute(executor=ex, **kw)
+    assert np.allclose(field1, field2, rtol=0, atol=1e-12)
+
+
+def test_memory_cache_max_bytes():
+    cache = cellsino.cache.MemoryCache(maxsize=None, max_bytes=300)
+    for ii in range(3):
+        cache.get(ii, lambda: np.zeros(10))
+    assert cache.nbytes == 240
+    # mark item 0 as recently used
+    cache.get(0, lambda: None)
+    cache.get(3, lambda: np.zeros(10))
+    assert 1 not in cache
+    assert cache.nbytes == 240
+    # too large
+    cache.get(4, lambda: np.zeros(100))
+    assert 4 not in cache
+    assert cache.nbytes == 240
+    cache.clear()
+    assert cache.nbytes == 0
+
+
+def test_field_cache_refocus():
+    cache = FieldCache(refocus=True, focus_step=.5)
+    for zz in [0, 1e-6, -2e-6, 1e-6]:
+        phantom = BasePhantom(medium_index=1.335)
+        phantom.append(Sphere(object_index=1.36,
+                              medium_index=1.335,
+                              fl_brightness=0,
+                              center=(0, 0, zz),
+                              radius=2e-6))
+        kw = {"phantom": phantom,
+              "grid_size": (48, 48),
+              "pixel_size": .25e-6,
+              "wavelength": 550e-9,
+              }
+        field1 = prop_dict["rytov"](**kw).propagate_array()
+        field2 = prop_dict["rytov"](field_cache=cache,
+                                    **kw).propagate_array()
+        assert np.sqrt(np.mean(np.abs(field1 - field2)**2)) < 0.02
+    # only one model evaluation
+    assert cache.misses == 1
+    # three different kernels (one was reused)
+    assert cache.kernels.misses == 3
+    assert cache.kernels.hits == 1
+
+
+def test_field_cache_refocus_strong():
+    # strongly scattering spheres are not refocused
+    cache = FieldCache(refocus=True, focus_step=.5)
+    for zz in [1e-6, -2e-6, 1e-6]:
+        phantom = BasePhantom(medium_index=1.335)
+        phantom.append(Sphere(object_index=1.415,
+                              medium_index=1.335,
+                              fl_brightness=0,
+                              center=(0, 0, zz),
+                              radius=2e-6))
+        kw = {"phantom": phantom,
+              "grid_size": (48, 48),
+              "pixel_size": .25e-6,
+              "wavelength": 550e-9,
+              }
+        pp = prop_dict["rytov"](field_cache=cache, **kw)
+        assert cache.get_max_phase(pp, phantom.elements[0]) > np.pi
+        field1 = prop_dict["rytov"](**kw).propagate_array()
+        field2 = pp.propagate_array()
+        assert np.sqrt(np.mean(np.abs(field1 - field2)**2)) < 0.02
+    # one model evaluation per axial position, no kernels
+    assert cache.misses == 2
+    assert cache.hits == 1
+    assert cache.kernels.misses == 0
+
+
+def test_field_cache_refocus_kernel():
+    cache = FieldCache(refocus=True)
+    kernel = cache.get_kernel(grid_size=(32, 32),
+                              pixel_size=.5e-6,
+                              wavelength=550e-9,
+                              medium_index=1.335,
+                              distance=10)
+    # plane wave is not affected
+    assert kernel[0, 0] == 1
+    # phase-only kernel
+    assert np.allclose(np.abs(kernel), 1)
+    # zero distance
+    kernel0 = cache.get_kernel(grid_size=(32, 32),
+                               pixel_size=.5e-6,
+                               wavelength=550e-9,
+                               medium_index=1.335,
+                               distance=0)
+    assert np.all(kernel0 == 1)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
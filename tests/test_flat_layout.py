@@ -0,0 +1,89 @@
+import h5py
+import numpy as np
+import pytest
+
+import cellsino
+from cellsino.storage import FlatSinogram
+
+from helpers import CrashAfter, get_sinogram, run_tests
+
+
+kw = {"angles": 10,
+      "propagator": "projection",
+      "displacements": np.random.RandomState(42).normal(0, .5, (10, 2)),
+      "bleach_decay": .1,
+      }
+
+
+def test_flat_layout(tmp_path):
+    sino = get_sinogram()
+    field, fluor = sino.compute(**kw)
+    path = sino.compute(path=tmp_path / "flat.h5", layout="flat",
+                        writer_kw={"buffer_size": 3}, **kw)
+    with h5py.File(path, "r") as h5:
+        assert h5["field"].shape == (10, 25, 25)
+        assert h5["field"].chunks == (1, 25, 25)
+        assert h5["fluorescence"].chunks == (1, 25, 25)
+        assert h5["field"].compression is None
+
+    with cellsino.Sinogram.load(path) as data:
+        assert len(data) == 10
+        assert np.all(data.field[:] == field)
+        assert np.all(data.fluorescence[:] == fluor)
+        # lazy slicing
+        assert np.all(data.field[3:5, 10] == field[3:5, 10])
+        assert np.allclose(data.angles, np.linspace(0, 2*np.pi, 10,
+                                                    endpoint=False))
+        assert np.allclose(data.times, np.linspace(0, 3, 10,
+                                                   endpoint=False))
+        assert np.all(data.displacements == kw["displacements"])
+        assert data.wavelength == sino.wavelength
+        assert data.pixel_size == sino.pixel_size
+        assert data.medium_index == sino.phantom.medium_index
+
+
+def test_flat_layout_compression_mode(tmp_path):
+    sino = get_sinogram()
+    fluor = sino.compute(mode="fluorescence", **kw)
+    path = sino.compute(path=tmp_path / "flat.h5", layout="flat",
+                        mode="fluorescence",
+                        writer_kw={"compression": "gzip"}, **kw)
+    with cellsino.Sinogram.load(path) as data:
+        assert data.field is None
+        assert data.fluorescence.compression == "gzip"
+        assert np.all(data.fluorescence[:] == fluor)
+
+
+def test_flat_layout_resume(tmp_path):
+    sino = get_sinogram()
+    field, fluor = sino.compute(**kw)
+    path = tmp_path / "flat.h5"
+    try:
+        sino.compute(path=path, layout="flat", resume=True,
+                     writer_kw={"buffer_size": 3}, count=CrashAfter(4), **kw)
+    except KeyboardInterrupt:
+        pass
+    else:
+        assert False, "crash expected"
+    with h5py.File(path, "r") as h5:
+        assert np.sum(h5["progress/completed"][:]) == 4
+    sino.compute(path=path, layout="flat", resume=True, **kw)
+    with cellsino.Sinogram.load(path) as data:
+        assert np.all(data.field[:] == field)
+        assert np.all(data.fluorescence[:] == fluor)
+    # switching the layout is not allowed
+    with pytest.raises(ValueError, match="parameters do not match"):
+        sino.compute(path=path, layout="series", resume=True, **kw)
+
+
+def test_load_series_layout(tmp_path):
+    sino = get_sinogram()
+    path = sino.compute(path=tmp_path / "series.h5", angles=2,
+                        propagator="projection")
+    with pytest.raises(ValueError, match="flat layout"):
+        FlatSinogram(path)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    run_tests(locals())
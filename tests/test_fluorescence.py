@@ -0,0 +1,160 @@
+import numpy as np
+
+import cellsino
+from cellsino.elements import Sphere
+from cellsino.fluorescence import (Fluorescence, FourierSliceProjector,
+                                   project_angles, project_angles_fourier)
+from cellsino.phantoms.base_phantom import BasePhantom
+
+
+def test_project_angles():
+    phantom = cellsino.phantoms.SimpleCell()
+    angles = np.linspace(0, 2*np.pi, 7)
+    displacements = np.random.RandomState(42).normal(size=(7, 2))
+    bleach_factors = np.linspace(1, .5, 7)
+    kw = {"grid_size": (30, 34),
+          "pixel_size": .5e-6,
+          }
+    fluor = project_angles(phantom=phantom,
+                           angles=angles,
+                           axis_roll=.4,
+                           displacements=displacements,
+                           bleach_factors=bleach_factors,
+                           background=2,
+                           # force chunking
+                           max_bytes=30*34*8*3*2,
+                           **kw)
+    for ii, ang in enumerate(angles):
+        ph = phantom.transform(rot_main=ang, rot_in_plane=.4)
+        ref = Fluorescence(phantom=ph,
+                           displacement=displacements[ii],
+                           bleach_factor=bleach_factors[ii],
+                           background=2,
+                           **kw).project_array()
+        assert np.allclose(fluor[ii], ref, rtol=0, atol=1e-10)
+
+
+def test_project_angles_repeated():
+    phantom = BasePhantom(medium_index=1.335)
+    # on the rotational axis (identical in all frames)
+    phantom.append(Sphere(object_index=1.36,
+                          medium_index=1.335,
+                          fl_brightness=1,
+                          center=(0, 2e-6, 0),
+                          radius=3e-6))
+    phantom.append(Sphere(object_index=1.36,
+                          medium_index=1.335,
+                          fl_brightness=2,
+                          center=(2e-6, 0, 1e-6),
+                          radius=2e-6))
+    angles = np.linspace(0, 2*np.pi, 6)
+    # same displacement in the first three frames
+    displacements = np.zeros((6, 2))
+    displacements[3:] = np.random.RandomState(42).normal(size=(3, 2))
+    kw = {"grid_size": (30, 34),
+          "pixel_size": .5e-6,
+          }
+    fluor = project_angles(phantom=phantom,
+                           angles=angles,
+                           displacements=displacements,
+                           **kw)
+    for ii, ang in enumerate(angles):
+        ph = phantom.transform(rot_main=ang)
+        ref = Fluorescence(phantom=ph,
+                           displacement=displacements[ii],
+                           **kw).project_array()
+        assert np.allclose(fluor[ii], ref, rtol=0, atol=1e-10)
+
+
+def test_project_angles_empty():
+    phantom = cellsino.phantoms.base_phantom.BasePhantom(medium_index=1.335)
+    fluor = project_angles(phantom=phantom,
+                           angles=np.arange(3),
+                           grid_size=(10, 10),
+                           pixel_size=1e-6,
+                           background=.5)
+    assert fluor.shape == (3, 10, 10)
+    assert np.all(fluor == .5)
+
+
+def test_project_sphere_bounding_box():
+    phantom = cellsino.phantoms.base_phantom.BasePhantom(medium_index=1.335)
+    fl = Fluorescence(phantom=phantom,
+                      grid_size=(40, 50),
+                      pixel_size=1e-6,
+                      displacement=(.3, -.2))
+    x = np.arange(40).reshape(-1, 1)
+    y = np.arange(50).reshape(1, -1)
+    # inside, at the border, and outside of the grid
+    for center in [(0, 0, 0), (19e-6, -22e-6, 0), (100e-6, 0, 0)]:
+        sphere = Sphere(object_index=1.36,
+                        medium_index=1.335,
+                        fl_brightness=2,
+                        center=center,
+                        radius=5.3e-6)
+        cx, cy, _ = fl.center + sphere.center / 1e-6
+        rpx = sphere.radius / 1e-6
+        r = rpx**2 - (x - cx)**2 - (y - cy)**2
+        ref = 2 * np.sqrt(np.maximum(r, 0)) * 2
+        assert np.all(fl.project_sphere(sphere) == ref)
+        out = np.ones((40, 50))
+        fl.project_sphere(sphere, out=out)
+        assert np.all(out == ref + 1)
+
+
+def test_fourier_slice_voxel_sum():
+    phantom = cellsino.phantoms.SimpleCell()
+    _, fl = phantom.draw(grid_size=(32, 32, 32), pixel_size=.5e-6)
+    projector = FourierSliceProjector(volume=fl, pixel_size=.5e-6)
+    fluor = projector.project_angles(angles=[0], grid_size=(32, 32))
+    # no rotation: sum along the optical axis
+    assert np.allclose(fluor[0], fl.sum(axis=0), rtol=0, atol=1e-10)
+    # integer displacements
+    fluor = projector.project_angles(angles=[0], grid_size=(32, 32),
+                                     displacements=[[2, -3]],
+                                     bleach_factors=.5,
+                                     background=1)
+    ref = np.roll(fl.sum(axis=0), (2, -3), axis=(0, 1)) * .5 + 1
+    assert np.allclose(fluor[0], ref, rtol=0, atol=1e-10)
+
+
+def test_fourier_slice_vs_analytic():
+    phantom = BasePhantom(medium_index=1.335)
+    phantom.append(Sphere(object_index=1.36,
+                          medium_index=1.335,
+                          fl_brightness=1,
+                          center=(2e-6, -1e-6, 1e-6),
+                          radius=3e-6))
+    angles = np.linspace(0, 2*np.pi, 7)
+    kw = {"phantom": phantom,
+          "angles": angles,
+          "grid_size": (40, 40),
+          "pixel_size": .3e-6,
+          "axis_roll": .3,
+          "displacements": np.random.RandomState(42).normal(size=(7, 2)),
+          }
+    fluor1 = project_angles(**kw)
+    fluor2 = project_angles_fourier(**kw)
+    # errors due to rasterization and interpolation in Fourier space
+    assert np.sqrt(np.mean((fluor1 - fluor2)**2)) < 0.05 * fluor1.max()
+    assert np.allclose(fluor1.sum(axis=(1, 2)), fluor2.sum(axis=(1, 2)),
+                       rtol=0.01, atol=0)
+
+
+def test_sinogram_fourier_slice():
+    sino = cellsino.Sinogram(phantom="simple cell",
+                             wavelength=550e-9,
+                             pixel_size=.5e-6,
+                             grid_size=(32, 32))
+    fluor = sino.compute(angles=[0, 1], mode="fluorescence",
+                         fluorescence_projector="fourier-slice")
+    _, fl = sino.phantom.draw(grid_size=(32, 32, 32), pixel_size=.5e-6)
+    assert np.allclose(fluor[0], fl.sum(axis=0), rtol=0, atol=1e-10)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
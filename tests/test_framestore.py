@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from cellsino.framestore import FrameStore
+
+from helpers import get_sinogram, run_tests
+
+
+kw = {"angles": 6,
+      "propagator": "projection",
+      "bleach_decay": .1,
+      }
+
+
+def test_framestore_append_read(tmp_path):
+    path = tmp_path / "frames.raw"
+    data = np.random.RandomState(42).random_sample((3, 4, 5))
+    store = FrameStore.create(path, shape=(3, 4, 5), dtype=float)
+    # a reader sees only the frames that were completely written
+    reader = FrameStore(path)
+    assert len(reader) == 0
+    assert reader.shape == (0, 4, 5)
+    store.append(data[0])
+    store[1] = data[1]
+    assert len(reader) == 2
+    assert np.all(reader[:] == data[:2])
+    assert np.all(reader[1, 2] == data[1, 2])
+    with pytest.raises(ValueError, match="in order"):
+        store[0] = data[0]
+    store.append(data[2])
+    with pytest.raises(ValueError, match="full"):
+        store.append(data[2])
+    store.close()
+    assert np.all(np.asarray(reader) == data)
+    reader.close()
+    # file size: header and data
+    assert path.stat().st_size == 256 + data.nbytes
+
+
+def test_framestore_invalid_file(tmp_path):
+    path = tmp_path / "frames.raw"
+    path.write_bytes(b"no frame store")
+    with pytest.raises(ValueError, match="not a frame store"):
+        FrameStore(path)
+
+
+def test_compute_framestore(tmp_path):
+    sino = get_sinogram()
+    field, fluor = sino.compute(**kw)
+    out_field = FrameStore.create(tmp_path / "field.raw",
+                                  shape=(6, 25, 25), dtype=complex)
+    out_fluor = FrameStore.create(tmp_path / "fluor.raw",
+                                  shape=(6, 25, 25), dtype=float)
+    res_field, res_fluor = sino.compute(out_field=out_field,
+                                        out_fluorescence=out_fluor, **kw)
+    assert res_field is out_field
+    assert res_fluor is out_fluor
+    out_field.close()
+    out_fluor.close()
+    with FrameStore(tmp_path / "field.raw") as store:
+        assert np.all(store[:] == field)
+    with FrameStore(tmp_path / "fluor.raw") as store:
+        assert np.all(store[:] == fluor)
+
+
+def test_compute_memmap(tmp_path):
+    sino = get_sinogram()
+    fluor = sino.compute(mode="fluorescence", **kw)
+    out = np.lib.format.open_memmap(tmp_path / "fluor.npy", mode="w+",
+                                    dtype=float, shape=(6, 25, 25))
+    res = sino.compute(mode="fluorescence", out_fluorescence=out, **kw)
+    assert res is out
+    out.flush()
+    assert np.all(np.load(tmp_path / "fluor.npy") == fluor)
+
+
+def test_compute_out_invalid():
+    sino = get_sinogram()
+    with pytest.raises(ValueError, match="shape"):
+        sino.compute(mode="fluorescence",
+                     out_fluorescence=np.zeros((5, 25, 25)), **kw)
+    with pytest.raises(ValueError, match="Cannot write"):
+        sino.compute(mode="field",
+                     out_field=np.zeros((6, 25, 25)), **kw)
+    with pytest.raises(ValueError, match="path"):
+        sino.compute(path="test.h5", out_field=np.zeros((6, 25, 25)),
+                     **kw)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    run_tests(locals())
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import cellsino
+
+
+def test_lazy_imports():
+    """Heavy dependencies must not be imported by `import cellsino`"""
+    heavy = ["h5py", "qpimage", "flimage", "qpsphere", "subprocess"]
+    code = "import sys; import cellsino; " \
+           + "print(','.join(m for m in {!r} if m in sys.modules))".format(
+               heavy)
+    out = subprocess.check_output([sys.executable, "-c", code])
+    assert out.decode().strip() == ""
+
+
+def test_version():
+    assert isinstance(cellsino.__version__, str)
+    assert cellsino.__version__
+
+
+def test_version_without_git():
+    """`git describe` is not called if the version is saved/installed"""
+    code = "import sys; sys.modules['cellsino._version'] = None; " \
+           + "import cellsino; print(cellsino.__version__); " \
+           + "print('subprocess' in sys.modules)"
+    out = subprocess.check_output([sys.executable, "-c", code])
+    version, git = out.decode().split()
+    assert version == cellsino.__version__
+    assert git == "False"
+
+
+def test_missing_attribute():
+    try:
+        cellsino.does_not_exist
+    except AttributeError:
+        pass
+    else:
+        assert False, "AttributeError expected"
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,107 @@
+import concurrent.futures
+import multiprocessing as mp
+import threading
+from time import sleep
+
+import numpy as np
+
+from cellsino import sinogram
+
+from helpers import get_sinogram
+
+
+class CountingSinogram(sinogram.Sinogram):
+    """Sinogram that counts the frames whose computation started"""
+
+    def __init__(self, *args, **kwargs):
+        super(CountingSinogram, self).__init__(*args, **kwargs)
+        self.started = 0
+        self.lock = threading.Lock()
+
+    def _compute_frames(self, args, **kwargs):
+        with self.lock:
+            self.started += len(args[0])
+        return super(CountingSinogram, self)._compute_frames(args, **kwargs)
+
+
+def test_iter_frames():
+    sino = get_sinogram()
+    angles = np.linspace(0, np.pi, 4)
+    kw = {"angles": angles,
+          "displacements": .3,
+          "times": 2.,
+          "propagator": "projection",
+          }
+    field, fluor = sino.compute(**kw)
+    for ii, ang, time, fii, flii in sino.iter_frames(**kw):
+        assert ang == angles[ii]
+        assert time == ii * .5
+        assert np.all(fii == field[ii])
+        assert np.all(flii == fluor[ii])
+    assert ii == 3
+
+
+def test_iter_frames_mode():
+    sino = get_sinogram()
+    frames = list(sino.iter_frames(angles=3, mode="fluorescence"))
+    assert len(frames) == 3
+    for _, _, _, field, fluor in frames:
+        assert field is None
+        assert fluor.shape == (25, 25)
+
+
+def test_iter_frames_close_early():
+    sino = get_sinogram()
+    count = mp.Value("I", 0, lock=True)
+    max_count = mp.Value("I", 0, lock=True)
+    frames = sino.iter_frames(angles=10, mode="fluorescence", workers=2,
+                              count=count, max_count=max_count)
+    for ii, _, _, _, _ in frames:
+        if ii == 2:
+            break
+    frames.close()
+    assert count.value == 2
+    assert max_count.value == 10
+
+
+def test_iter_frames_first_frame():
+    sino = CountingSinogram(phantom="simple cell",
+                            wavelength=550e-9,
+                            pixel_size=.7e-6,
+                            grid_size=(25, 25))
+    frames = sino.iter_frames(angles=32, propagator="projection")
+    next(frames)
+    # only the first frame was computed
+    assert sino.started == 1
+    for _ in frames:
+        pass
+    assert sino.started == 32
+
+
+def test_iter_frames_max_pending():
+    sino = CountingSinogram(phantom="simple cell",
+                            wavelength=550e-9,
+                            pixel_size=.7e-6,
+                            grid_size=(25, 25))
+    for max_pending, expected in [(None, 8), (3, 3)]:
+        sino.started = 0
+        peak = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            frames = sino.iter_frames(angles=40, propagator="projection",
+                                      executor=pool,
+                                      max_pending=max_pending)
+            for ii, _, _, _, _ in frames:
+                # frames computed or being computed, but not yet consumed
+                peak = max(peak, sino.started - ii)
+                sleep(.002)
+        assert sino.started == 40
+        # four chunks of one frame per worker by default
+        assert peak <= expected
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
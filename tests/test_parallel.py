@@ -0,0 +1,63 @@
+import concurrent.futures
+import multiprocessing as mp
+
+import h5py
+import numpy as np
+import qpimage
+
+from helpers import get_sinogram, run_tests
+
+
+def test_parallel_workers():
+    sino = get_sinogram()
+    kw = {"angles": np.linspace(0, np.pi, 7),
+          "displacements": .5,
+          "propagator": "projection",
+          }
+    field1, fluor1 = sino.compute(**kw)
+    field2, fluor2 = sino.compute(workers=2, **kw)
+    assert np.all(field1 == field2)
+    assert np.all(fluor1 == fluor2)
+
+
+def test_parallel_executor():
+    sino = get_sinogram()
+    kw = {"angles": 5,
+          "mode": "fluorescence",
+          "propagator": "projection",
+          }
+    fluor1 = sino.compute(**kw)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as ex:
+        fluor2 = sino.compute(executor=ex, **kw)
+    assert np.all(fluor1 == fluor2)
+
+
+def test_parallel_count():
+    sino = get_sinogram()
+    count = mp.Value("I", 0, lock=True)
+    max_count = mp.Value("I", 0, lock=True)
+    sino.compute(angles=4, mode="fluorescence", workers=2,
+                 count=count, max_count=max_count)
+    assert count.value == 4
+    assert max_count.value == 4
+
+
+def test_parallel_path(tmp_path):
+    sino = get_sinogram()
+    kw = {"angles": np.linspace(0, np.pi, 3),
+          "propagator": "projection",
+          }
+    path1 = sino.compute(path=tmp_path / "serial.h5", **kw)
+    path2 = sino.compute(path=tmp_path / "parallel.h5", workers=2, **kw)
+    with h5py.File(path1, "r") as h51, h5py.File(path2, "r") as h52:
+        qps1 = qpimage.QPSeries(h5file=h51["qpseries"], h5mode="r")
+        qps2 = qpimage.QPSeries(h5file=h52["qpseries"], h5mode="r")
+        assert len(qps1) == len(qps2) == 3
+        for ii in range(3):
+            assert np.all(qps1[ii].field == qps2[ii].field)
+            assert qps1[ii]["time"] == qps2[ii]["time"]
+
+
+if __name__ == "__main__":
+    # Run all tests
+    run_tests(locals())
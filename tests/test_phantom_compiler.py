@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+import cellsino
+from cellsino.elements import Sphere
+from cellsino.elements.base_element import BaseElement
+from cellsino.phantoms import SimpleCell, SphereCollection
+from cellsino.phantoms.base_phantom import BasePhantom
+from cellsino.phantoms.compiler import compile_phantom
+
+
+def get_phantom():
+    """Simple cell with two concentric spheres of the same radius"""
+    ph = BasePhantom(medium_index=1.335)
+    for el in SimpleCell():
+        ph.append(el)
+    ph.append(Sphere(object_index=1.345,
+                     medium_index=1.335,
+                     fl_brightness=2,
+                     center=(1e-6, 0, 0),
+                     radius=2e-6))
+    ph.append(Sphere(object_index=1.340,
+                     medium_index=1.335,
+                     fl_brightness=-2,
+                     center=(1e-6, 0, 0),
+                     radius=2e-6))
+    return ph
+
+
+def test_prune():
+    ph = SimpleCell()
+    field = compile_phantom(ph, mode="field")
+    assert isinstance(field, SphereCollection)
+    # the nucleus shell has no refractive index contrast
+    assert len(field) == 4
+    assert np.all(field.radii == [1.5e-6, 1.5e-6, 4e-6, 5.5e-6])
+    fluor = compile_phantom(ph, mode="fluorescence")
+    # the cytoplasm is not fluorescent
+    assert len(fluor) == 4
+    assert np.all(fluor.radii == [1.5e-6, 1.5e-6, 4e-6, 3.8e-6])
+    # the original phantom is not modified
+    assert len(ph.elements) == 5
+
+
+def test_merge():
+    ph = get_phantom()
+    field = compile_phantom(ph, mode="field", merge=True)
+    assert len(field) == 5
+    assert np.allclose(field.object_index[-1], 1.35, atol=0, rtol=1e-15)
+    assert np.all(field.centers[-1] == [1e-6, 0, 0])
+    # the fluorescence of the merged spheres cancels
+    fluor = compile_phantom(ph, mode="fluorescence", merge=True)
+    assert len(fluor) == 4
+    # spheres are not merged by default
+    field = compile_phantom(ph, mode="field")
+    assert len(field) == 6
+
+
+def test_other_elements():
+    ph = SimpleCell()
+    ph.append(BaseElement(object_index=1.36,
+                          medium_index=1.335,
+                          fl_brightness=0,
+                          points=[[0, 0, 0]]))
+    field = compile_phantom(ph, mode="field", merge=True)
+    assert not isinstance(field, SphereCollection)
+    assert len(field.elements) == 5
+    assert isinstance(field.elements[-1], BaseElement)
+    fluor = compile_phantom(ph, mode="fluorescence", merge=True)
+    assert isinstance(fluor, SphereCollection)
+    assert len(fluor) == 4
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError, match="Invalid mode"):
+        compile_phantom(SimpleCell(), mode="phase")
+
+
+def test_sinogram_unchanged():
+    ph = get_phantom()
+    sino = cellsino.Sinogram(phantom=ph,
+                             wavelength=550e-9,
+                             pixel_size=.4e-6,
+                             grid_size=(32, 32))
+    field, fluor = sino.compute(angles=5, propagator="projection")
+    # reference: sum of the contributions of all elements
+    angles = np.linspace(0, 2*np.pi, 5, endpoint=False)
+    for ii, ang in enumerate(angles):
+        tph = ph.transform(rot_main=ang)
+        pp = cellsino.propagators.Projection(phantom=tph,
+                                             grid_size=(32, 32),
+                                             pixel_size=.4e-6,
+                                             wavelength=550e-9)
+        fl = cellsino.fluorescence.Fluorescence(phantom=tph,
+                                                grid_size=(32, 32),
+                                                pixel_size=.4e-6)
+        assert np.allclose(field[ii], pp.propagate_array(),
+                           atol=1e-14, rtol=0)
+        assert np.allclose(fluor[ii], fl.project_array(),
+                           atol=1e-12, rtol=0)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,66 @@
+import numpy as np
+
+import cellsino
+
+from helpers import get_sinogram, run_tests
+
+
+def test_single_precision_analytic():
+    sino = get_sinogram(grid_size=(32, 32))
+    kw = {"angles": 5,
+          "propagator": "projection",
+          "bleach_decay": .1,
+          "fluorescence_background": .5,
+          }
+    field64, fluor64 = sino.compute(**kw)
+    field32, fluor32 = sino.compute(dtype=np.float32, **kw)
+    assert field32.dtype == np.complex64
+    assert fluor32.dtype == np.float32
+    assert np.allclose(field32, field64, rtol=0, atol=1e-6)
+    assert np.allclose(fluor32, fluor64, rtol=1e-5, atol=0)
+
+
+def test_single_precision_fourier():
+    sino = get_sinogram(grid_size=(32, 32))
+    kw = {"angles": 5,
+          "propagator": "rytov-fourier",
+          "fluorescence_projector": "fourier-slice",
+          }
+    field64, fluor64 = sino.compute(**kw)
+    field32, fluor32 = sino.compute(dtype=np.float32, **kw)
+    assert field32.dtype == np.complex64
+    assert fluor32.dtype == np.float32
+    assert np.allclose(field32, field64, rtol=0, atol=1e-5)
+    assert np.allclose(fluor32, fluor64, rtol=0,
+                       atol=1e-5 * np.abs(fluor64).max())
+
+
+def test_single_precision_draw():
+    phantom = cellsino.phantoms.SimpleCell()
+    ri64, fl64 = phantom.draw(grid_size=(20, 20, 20), pixel_size=1e-6)
+    ri32, fl32 = phantom.draw(grid_size=(20, 20, 20), pixel_size=1e-6,
+                              dtype=np.float32)
+    assert ri32.dtype == np.float32
+    assert fl32.dtype == np.float32
+    assert np.allclose(ri32, ri64, rtol=1e-6, atol=0)
+    assert np.allclose(fl32, fl64, rtol=1e-6, atol=0)
+
+
+def test_single_precision_flat_layout(tmp_path):
+    sino = get_sinogram(grid_size=(32, 32))
+    kw = {"angles": 3,
+          "propagator": "projection",
+          "dtype": np.float32,
+          }
+    field, fluor = sino.compute(**kw)
+    path = sino.compute(path=tmp_path / "flat.h5", layout="flat", **kw)
+    with cellsino.Sinogram.load(path) as data:
+        assert data.field.dtype == np.complex64
+        assert data.fluorescence.dtype == np.float32
+        assert np.all(data.field[:] == field)
+        assert np.all(data.fluorescence[:] == fluor)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    run_tests(locals())
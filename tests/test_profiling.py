@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+
+from cellsino import profiling
+
+from helpers import get_sinogram, run_tests
+
+
+def test_profile_compute(tmp_path):
+    sino = get_sinogram()
+    prof = profiling.Profiler()
+    path = sino.compute(angles=5, propagator="projection",
+                        path=tmp_path / "data.h5", profiler=prof)
+    assert path == tmp_path / "data.h5"
+    summary = prof.summary()
+    stages = summary["stages"]
+    for name in ["field", "transform", "propagate_sphere", "fluorescence",
+                 "project_sphere", "qpimage", "flimage", "hdf5"]:
+        assert stages[name]["calls"] > 0, name
+        assert stages[name]["wall"] >= 0
+        assert stages[name]["net_bytes"] is None
+    # one transform per frame, one call per element and frame
+    # (the nucleus shell has no refractive index contrast)
+    num = 5 * (len(sino.phantom.elements) - 1)
+    assert stages["transform"]["calls"] == 5
+    assert stages["propagate_sphere"]["calls"] == num
+    assert summary["elements"]["propagate_sphere"]["Sphere"]["calls"] == num
+    assert [ff["index"] for ff in summary["frames"]] == list(range(5))
+    assert summary["total"]["wall"] >= stages["field"]["wall"]
+    # export
+    prof.to_json(tmp_path / "profile.json")
+    with (tmp_path / "profile.json").open() as fd:
+        assert json.load(fd) == json.loads(json.dumps(summary))
+    # the profiler is deactivated
+    assert profiling._active is None
+
+
+def test_profile_results_unchanged():
+    sino = get_sinogram()
+    field, fluor = sino.compute(angles=3, propagator="projection")
+    prof = profiling.Profiler(trace_memory=True)
+    with prof:
+        field_p, fluor_p = sino.compute(angles=3, propagator="projection")
+    assert np.all(field == field_p)
+    assert np.all(fluor == fluor_p)
+    stages = prof.summary()["stages"]
+    assert isinstance(stages["field"]["net_bytes"], int)
+    assert "qpimage" not in stages
+
+
+def test_profile_frames_chunked():
+    sino = get_sinogram()
+    prof = profiling.Profiler()
+    sino.compute(angles=20, propagator="projection", profiler=prof)
+    summary = prof.summary()
+    walls = [ff["wall"] for ff in summary["frames"]]
+    assert [ff["index"] for ff in summary["frames"]] == list(range(20))
+    # the time of a chunk (16 frames) is split across its frames
+    assert len(set(walls[:16])) == 1
+    assert len(set(walls[16:])) == 1
+    assert walls[0] > 0
+    assert sum(walls) <= summary["total"]["wall"]
+
+
+def test_profile_inactive():
+    assert profiling.stage("field") is profiling._null
+    # does nothing
+    profiling.add_frame(0)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    run_tests(locals())
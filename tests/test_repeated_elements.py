@@ -0,0 +1,116 @@
+import numpy as np
+
+import cellsino
+from cellsino.cache import ElementCache, element_key
+from cellsino.elements import Sphere
+from cellsino.fluorescence import project_angles
+from cellsino.phantoms.compiler import compile_phantom
+
+from helpers import get_sinogram
+
+
+def test_element_key():
+    sphere = Sphere(object_index=1.36,
+                    medium_index=1.335,
+                    fl_brightness=1,
+                    center=(1e-6, 0, 0),
+                    radius=2e-6)
+    # rotation about the main axis does not change the sphere
+    assert element_key(sphere) == element_key(
+        sphere.transform(rot_main=1.3))
+    assert element_key(sphere) != element_key(
+        sphere.transform(rot_in_plane=1.3))
+
+
+def test_find_repeated_elements():
+    sino = get_sinogram()
+    angles = np.linspace(0, np.pi, 10, endpoint=False)
+    repeated = sino.phantom.find_repeated_elements(
+        angles=angles,
+        axis_roll=0,
+        displacements=np.zeros((10, 2)))
+    # only the cytoplasm is located on the rotational axis
+    assert len(repeated) == 1
+    ekey = list(repeated)[0]
+    assert ekey[0] == element_key(sino.phantom.elements[4])
+    # displacements
+    displacements = np.zeros((10, 2))
+    displacements[::2] = 1
+    repeated = sino.phantom.find_repeated_elements(
+        angles=angles,
+        axis_roll=0,
+        displacements=displacements)
+    assert len(repeated) == 2
+
+
+def test_repeated_elements_sinogram():
+    sino = get_sinogram()
+    angles = np.linspace(0, np.pi, 4)
+    kw = {"angles": angles,
+          "propagator": "projection",
+          }
+    field1, fluor1 = sino.compute(**kw)
+    field2 = np.zeros_like(field1)
+    fluor2 = np.zeros_like(fluor1)
+    for ii, ang in enumerate(angles):
+        ph = sino.phantom.transform(rot_main=ang)
+        field2[ii] = cellsino.propagators.Projection(
+            phantom=ph,
+            grid_size=sino.grid_size,
+            pixel_size=sino.pixel_size,
+            wavelength=sino.wavelength).propagate_array()
+        fluor2[ii] = cellsino.fluorescence.Fluorescence(
+            phantom=ph,
+            grid_size=sino.grid_size,
+            pixel_size=sino.pixel_size).project_array()
+    assert np.all(field1 == field2)
+    assert np.all(fluor1 == fluor2)
+
+
+def test_element_cache():
+    sphere = Sphere(object_index=1.36,
+                    medium_index=1.335,
+                    fl_brightness=1,
+                    center=(0, 0, 0),
+                    radius=2e-6)
+    cache = ElementCache(keys={(element_key(sphere), (0, 0))})
+    calls = []
+
+    def func():
+        calls.append(1)
+        return len(calls)
+
+    for _ in range(3):
+        assert cache.get_contribution(sphere, (0, 0), "a", func) == 1
+    assert cache.get_contribution(sphere, (0, 0), "b", func) == 2
+    # not in keys
+    assert cache.get_contribution(sphere, (1, 0), "a", func) == 3
+    assert cache.get_contribution(sphere, (1, 0), "a", func) == 4
+
+
+def test_element_cache_fluorescence():
+    cell = cellsino.phantoms.SimpleCell(cytoplasm_fl=1)
+    angles = np.linspace(0, np.pi, 10, endpoint=False)
+    kw = {"grid_size": (25, 25),
+          "pixel_size": .7e-6}
+    for phantom in [cell, compile_phantom(cell, mode="fluorescence")]:
+        cache = ElementCache(keys=phantom.find_repeated_elements(angles))
+        fluor = project_angles(phantom=phantom, angles=angles, **kw)
+        # one frame per call (as in `Sinogram.iter_frames`)
+        for ii in range(angles.size):
+            fluor_ii = project_angles(phantom=phantom,
+                                      angles=angles[ii:ii+1],
+                                      element_cache=cache,
+                                      **kw)
+            assert np.all(fluor_ii[0] == fluor[ii])
+        # the cytoplasm on the rotational axis is projected only once
+        assert cache.misses == 1
+        assert cache.hits == 9
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,91 @@
+import h5py
+import numpy as np
+
+import cellsino
+
+from helpers import CrashAfter, assert_h5_equal, get_sinogram, run_tests
+
+
+kw = {"angles": 10,
+      "propagator": "projection",
+      "displacements": .5,
+      "bleach_decay": .1,
+      "writer_kw": {"buffer_size": 3},
+      }
+
+
+def test_resume(tmp_path):
+    sino = get_sinogram()
+    path_ref = sino.compute(path=tmp_path / "reference.h5", **kw)
+
+    path = tmp_path / "resume.h5"
+    try:
+        sino.compute(path=path, resume=True, count=CrashAfter(4), **kw)
+    except KeyboardInterrupt:
+        pass
+    else:
+        assert False, "crash expected"
+    with h5py.File(path, "r") as h5:
+        assert np.sum(h5["progress/completed"][:]) == 4
+        assert len(h5["qpseries"].keys()) == 4
+
+    # simulate frames that were written but not recorded
+    with h5py.File(path, "a") as h5:
+        h5["progress/completed"][3] = False
+    sino.compute(path=path, resume=True, **kw)
+    with h5py.File(path, "r") as h5, h5py.File(path_ref, "r") as h5ref:
+        assert np.all(h5["progress/completed"][:])
+        for group in ["qpseries", "flseries"]:
+            assert_h5_equal(h5[group], h5ref[group])
+
+    # nothing is computed for a complete file
+    count = CrashAfter(1)
+    sino.compute(path=path, resume=True, count=count, **kw)
+    assert count.value == 0
+
+
+def test_resume_parameter_mismatch(tmp_path):
+    sino = get_sinogram()
+    path = tmp_path / "mismatch.h5"
+    sino.compute(path=path, resume=True, angles=3, propagator="projection")
+    for change in [{"angles": 4},
+                   {"propagator": "rytov"},
+                   {"bleach_decay": .1}]:
+        ckw = {"angles": 3, "propagator": "projection"}
+        ckw.update(change)
+        try:
+            sino.compute(path=path, resume=True, **ckw)
+        except ValueError:
+            pass
+        else:
+            assert False, "parameter change not detected: {}".format(change)
+    # different phantom
+    sino2 = get_sinogram()
+    sino2.phantom = cellsino.phantoms.SimpleCell(nucleoli_index=1.4)
+    try:
+        sino2.compute(path=path, resume=True, angles=3,
+                      propagator="projection")
+    except ValueError:
+        pass
+    else:
+        assert False, "phantom change not detected"
+
+
+def test_resume_without_progress(tmp_path):
+    sino = get_sinogram()
+    path = tmp_path / "no_progress.h5"
+    sino.compute(path=path, angles=3, propagator="projection")
+    with h5py.File(path, "r") as h5:
+        assert "progress" not in h5
+    try:
+        sino.compute(path=path, resume=True, angles=3,
+                     propagator="projection")
+    except ValueError:
+        pass
+    else:
+        assert False, "resume requires recorded progress"
+
+
+if __name__ == "__main__":
+    # Run all tests
+    run_tests(locals())
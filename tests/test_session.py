@@ -0,0 +1,119 @@
+import numpy as np
+
+import cellsino
+from cellsino.elements import Sphere
+
+
+kw = {"wavelength": 550e-9,
+      "pixel_size": .7e-6,
+      "grid_size": (25, 25)}
+
+compute_kw = {"angles": 6,
+              "propagator": "projection",
+              "displacements": .5,
+              "bleach_decay": .1,
+              "fluorescence_background": 1}
+
+
+def test_session_initial():
+    sino = cellsino.Sinogram(phantom="simple cell", **kw)
+    session = cellsino.SinogramSession(sino, **compute_kw)
+    field, fluor = sino.compute(**compute_kw)
+    assert session.computed == 5
+    assert np.allclose(session.field, field, rtol=0, atol=1e-14)
+    assert np.allclose(session.fluorescence, fluor, rtol=0, atol=1e-12)
+
+
+def test_session_update():
+    sino = cellsino.Sinogram(phantom="simple cell", **kw)
+    session = cellsino.SinogramSession(sino, **compute_kw)
+    phantom = cellsino.phantoms.SimpleCell(nucleoli_index=1.4,
+                                           nucleus_fl=5)
+    changed = session.update(phantom)
+    # the nucleoli and the nucleus shell changed
+    assert changed == [0, 1, 3]
+    assert session.computed == 8
+    field, fluor = cellsino.Sinogram(phantom=phantom, **kw).compute(
+        **compute_kw)
+    assert np.allclose(session.field, field, rtol=0, atol=1e-12)
+    assert np.allclose(session.fluorescence, fluor, rtol=0, atol=1e-12)
+    # nothing changed
+    assert session.update(phantom) == []
+    assert session.computed == 8
+
+
+def test_session_add_remove():
+    sino = cellsino.Sinogram(phantom="simple cell", **kw)
+    session = cellsino.SinogramSession(sino, **compute_kw)
+    phantom = cellsino.phantoms.SimpleCell()
+    phantom.append(Sphere(object_index=1.37,
+                          medium_index=phantom.medium_index,
+                          fl_brightness=2,
+                          center=(2e-6, 0, -1e-6),
+                          radius=1e-6))
+    assert session.update(phantom) == [5]
+    field, fluor = cellsino.Sinogram(phantom=phantom, **kw).compute(
+        **compute_kw)
+    assert np.allclose(session.field, field, rtol=0, atol=1e-12)
+    assert np.allclose(session.fluorescence, fluor, rtol=0, atol=1e-12)
+    # remove the sphere again
+    assert session.update(cellsino.phantoms.SimpleCell()) == [5]
+    assert len(session.phantom.elements) == 5
+    field, fluor = sino.compute(**compute_kw)
+    assert np.allclose(session.field, field, rtol=0, atol=1e-12)
+    assert np.allclose(session.fluorescence, fluor, rtol=0, atol=1e-12)
+
+
+def test_session_refresh():
+    sino = cellsino.Sinogram(phantom="simple cell", **kw)
+    session = cellsino.SinogramSession(sino, mode="fluorescence",
+                                       **compute_kw)
+    assert session.field is None
+    fluor = session.fluorescence
+    for ii in range(5):
+        session.update(cellsino.phantoms.SimpleCell(nucleus_fl=3 + ii))
+    session.update(cellsino.phantoms.SimpleCell())
+    session.refresh()
+    assert np.allclose(session.fluorescence, fluor, rtol=0, atol=1e-12)
+
+
+def test_session_rytov_overlapping():
+    # the nucleus, nucleoli and cytoplasm of the simple cell overlap
+    sino = cellsino.Sinogram(phantom="simple cell", **kw)
+    rytov_kw = {"angles": 4,
+                "propagator": "rytov",
+                "mode": "field"}
+    session = cellsino.SinogramSession(sino, **rytov_kw)
+    field = sino.compute(**rytov_kw)
+    assert np.allclose(session.field, field, rtol=0, atol=1e-12)
+
+
+def test_session_not_separable():
+    sino = cellsino.Sinogram(phantom="simple cell", **kw)
+    try:
+        cellsino.SinogramSession(sino, angles=2, propagator="born-fourier")
+    except ValueError:
+        pass
+    else:
+        assert False, "born-fourier is not separable"
+    try:
+        cellsino.SinogramSession(sino, angles=2, propagator="rytov-fourier")
+    except ValueError:
+        pass
+    else:
+        assert False, "rytov-fourier is not separable"
+    try:
+        cellsino.SinogramSession(sino, angles=2, mode="fluorescence",
+                                 fluorescence_projector="fourier-slice")
+    except ValueError:
+        pass
+    else:
+        assert False, "fourier-slice is not supported"
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
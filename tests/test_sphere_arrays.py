@@ -0,0 +1,92 @@
+import numpy as np
+import qpimage
+
+import cellsino
+from cellsino.elements import Sphere
+from cellsino.phantoms.base_phantom import BasePhantom
+from cellsino.propagators import prop_dict
+
+
+def get_propagator(name, center=(2e-6, -1e-6, 1e-6)):
+    sphere = Sphere(object_index=1.36,
+                    medium_index=1.335,
+                    fl_brightness=1,
+                    center=center,
+                    radius=3e-6)
+    phantom = BasePhantom(medium_index=1.335)
+    phantom.append(sphere)
+    pp = prop_dict[name](phantom=phantom,
+                         grid_size=(40, 42),
+                         pixel_size=.3e-6,
+                         wavelength=550e-9,
+                         displacement=(.5, -1))
+    return pp, sphere
+
+
+def test_sphere_array_matches_qpimage():
+    # QPImage stores the data in single precision
+    for name in ["projection", "rytov", "rytov-fourier"]:
+        pp, sphere = get_propagator(name)
+        field_qpi = pp.propagate_sphere(sphere).field
+        field_arr = pp.propagate_sphere_array(sphere)
+        assert np.allclose(field_qpi, field_arr, rtol=0, atol=1e-6), name
+
+
+def test_rytov_field_matches_qpsphere():
+    import qpsphere
+    from cellsino.propagators.pp_rytov import rytov_field
+
+    # off-center, defocused, and a rectangular grid
+    for kw in [{"center": (20.3, 19.1), "focus": 0},
+               {"center": (15, 25.5), "focus": -2e-6},
+               {"center": (26.2, 17), "focus": 3e-6}]:
+        kw.update({"radius": 3e-6,
+                   "sphere_index": 1.36,
+                   "medium_index": 1.335,
+                   "wavelength": 550e-9,
+                   "pixel_size": .3e-6,
+                   "grid_size": (40, 42),
+                   "radius_sampling": 20})
+        field = rytov_field(**kw)
+        ref = qpsphere.models.rytov(**kw)
+        # QPImage stores the data in single precision
+        assert np.allclose(field, ref.field, rtol=0, atol=1e-6)
+        assert np.allclose(np.abs(field), ref.amp, rtol=0, atol=1e-6)
+
+
+def test_sphere_array_projection_border():
+    # sphere partially outside of the grid
+    pp, sphere = get_propagator("projection", center=(5e-6, -6e-6, 0))
+    field_qpi = pp.propagate_sphere(sphere).field
+    field_arr = pp.propagate_sphere_array(sphere)
+    assert np.allclose(field_qpi, field_arr, rtol=0, atol=1e-6)
+    cphase = pp.propagate_sphere_cphase(sphere)
+    assert np.allclose(np.exp(cphase), field_arr, rtol=0, atol=1e-14)
+
+
+def test_no_qpimage_without_path():
+    sino = cellsino.Sinogram(phantom="simple cell",
+                             wavelength=550e-9,
+                             pixel_size=0.7e-6,
+                             grid_size=(25, 25))
+    reference = sino.compute(angles=3, mode="field", propagator="projection")
+
+    init = qpimage.QPImage.__init__
+
+    def fail(*args, **kwargs):
+        raise AssertionError("QPImage must not be created")
+
+    qpimage.QPImage.__init__ = fail
+    try:
+        field = sino.compute(angles=3, mode="field", propagator="projection")
+    finally:
+        qpimage.QPImage.__init__ = init
+    assert np.all(field == reference)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
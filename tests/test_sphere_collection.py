@@ -0,0 +1,123 @@
+import numpy as np
+
+import cellsino
+from cellsino.fluorescence import Fluorescence, project_angles
+from cellsino.phantoms import SimpleCell, SphereCollection
+from cellsino.propagators import prop_dict
+
+
+def get_collection(num=50):
+    rs = np.random.RandomState(42)
+    return SphereCollection(centers=rs.uniform(-5e-6, 5e-6, size=(num, 3)),
+                            radii=rs.uniform(.5e-6, 2e-6, size=num),
+                            object_index=rs.uniform(1.34, 1.36, size=num),
+                            fl_brightness=rs.uniform(0, 1, size=num),
+                            medium_index=1.335)
+
+
+def test_from_phantom():
+    ph = SimpleCell()
+    coll = SphereCollection.from_phantom(ph)
+    assert len(coll) == len(ph.elements)
+    for el1, el2 in zip(coll, ph):
+        assert np.all(el1.center == el2.center)
+        assert el1.radius == el2.radius
+        assert el1.object_index == el2.object_index
+        assert el1.fl_brightness == el2.fl_brightness
+
+
+def test_draw():
+    coll = get_collection()
+    ph = cellsino.phantoms.base_phantom.BasePhantom(medium_index=1.335)
+    for el in coll:
+        ph.append(el)
+    ri1, fl1 = coll.draw(grid_size=(30, 30, 30), pixel_size=.5e-6)
+    ri2, fl2 = ph.draw(grid_size=(30, 30, 30), pixel_size=.5e-6)
+    assert np.all(ri1 == ri2)
+    assert np.all(fl1 == fl2)
+
+
+def test_find_repeated_elements():
+    coll = SphereCollection.from_phantom(SimpleCell())
+    ph = SimpleCell()
+    angles = np.linspace(0, np.pi, 10, endpoint=False)
+    displacements = np.zeros((10, 2))
+    displacements[1] = 1
+    displacements[3] = 1
+    rep1 = coll.find_repeated_elements(angles=angles,
+                                       displacements=displacements)
+    rep2 = ph.find_repeated_elements(angles=angles,
+                                     displacements=displacements)
+    assert rep1 == rep2
+    assert len(rep1) == 2
+
+
+def test_fluorescence():
+    coll = get_collection()
+    ph = cellsino.phantoms.base_phantom.BasePhantom(medium_index=1.335)
+    for el in coll:
+        ph.append(el)
+    tcoll = coll.transform(rot_main=.3, rot_in_plane=.1)
+    tph = ph.transform(rot_main=.3, rot_in_plane=.1)
+    for el1, el2 in zip(tcoll, tph):
+        assert np.allclose(el1.center, el2.center, rtol=0, atol=1e-20)
+    fl1 = Fluorescence(phantom=tcoll, grid_size=(40, 40),
+                       pixel_size=.5e-6).project_array()
+    fl2 = Fluorescence(phantom=tph, grid_size=(40, 40),
+                       pixel_size=.5e-6).project_array()
+    assert np.allclose(fl1, fl2, rtol=0, atol=1e-12)
+    angles = np.linspace(0, np.pi, 7)
+    fls1 = project_angles(phantom=coll, angles=angles, grid_size=(40, 40),
+                          pixel_size=.5e-6)
+    fls2 = project_angles(phantom=ph, angles=angles, grid_size=(40, 40),
+                          pixel_size=.5e-6)
+    assert np.all(fls1 == fls2)
+
+
+def test_propagation():
+    coll = SphereCollection.from_phantom(SimpleCell())
+    ph = SimpleCell()
+    kw = {"grid_size": (25, 25),
+          "pixel_size": .7e-6,
+          "wavelength": 550e-9}
+    field1 = prop_dict["projection"](phantom=coll, **kw).propagate_array()
+    field2 = prop_dict["projection"](phantom=ph, **kw).propagate_array()
+    assert np.all(field1 == field2)
+
+
+def test_propagation_arrays():
+    class ArrayCollection(SphereCollection):
+        def __getitem__(self, index):
+            assert False, "no Sphere instances for propagation"
+
+    # the parameters are read from the arrays of the collection
+    coll = ArrayCollection.from_phantom(SimpleCell())
+    ph = SimpleCell()
+    kw = {"grid_size": (25, 25),
+          "pixel_size": .7e-6,
+          "wavelength": 550e-9}
+    for name in ["projection", "rytov"]:
+        field1 = prop_dict[name](phantom=coll, **kw).propagate_array()
+        field2 = prop_dict[name](phantom=ph, **kw).propagate_array()
+        assert np.all(field1 == field2), name
+
+
+def test_sinogram():
+    kw = {"wavelength": 550e-9,
+          "pixel_size": .7e-6,
+          "grid_size": (25, 25)}
+    sino1 = cellsino.Sinogram(
+        phantom=SphereCollection.from_phantom(SimpleCell()), **kw)
+    sino2 = cellsino.Sinogram(phantom="simple cell", **kw)
+    field1, fluor1 = sino1.compute(angles=5, propagator="projection")
+    field2, fluor2 = sino2.compute(angles=5, propagator="projection")
+    assert np.allclose(field1, field2, rtol=0, atol=1e-14)
+    assert np.allclose(fluor1, fluor2, rtol=0, atol=1e-14)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
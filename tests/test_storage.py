@@ -0,0 +1,181 @@
+import flimage
+import h5py
+import numpy as np
+import pytest
+import qpimage
+
+from cellsino.storage import SeriesWriter, ThreadedWriter
+
+from helpers import assert_h5_equal, get_sinogram, run_tests
+
+
+def test_series_writer_reference(tmp_path):
+    sino = get_sinogram()
+    kw = {"angles": np.linspace(0, np.pi, 5),
+          "propagator": "projection",
+          }
+    path = sino.compute(path=tmp_path / "writer.h5",
+                        writer_kw={"buffer_size": 2},
+                        **kw)
+    field, fluor = sino.compute(**kw)
+    times = np.linspace(0, 3.0, 5, endpoint=False)
+
+    # reference file written frame-by-frame with qpimage/flimage
+    path_ref = tmp_path / "reference.h5"
+    for ii in range(5):
+        qpi = qpimage.QPImage(data=field[ii],
+                              which_data="field",
+                              meta_data={"wavelength": 550e-9,
+                                         "pixel size": 0.7e-6,
+                                         "medium index": 1.335,
+                                         "time": times[ii],
+                                         })
+        fli = flimage.FLImage(data=fluor[ii],
+                              meta_data={"pixel size": 0.7e-6,
+                                         "time": times[ii],
+                                         })
+        with h5py.File(path_ref, "a") as h5:
+            qps = qpimage.QPSeries(h5file=h5.require_group("qpseries"))
+            qps.add_qpimage(qpi)
+            fls = flimage.FLSeries(h5file=h5.require_group("flseries"))
+            fls.add_flimage(fli)
+
+    with h5py.File(path, "r") as h5, h5py.File(path_ref, "r") as h5ref:
+        assert_h5_equal(h5, h5ref)
+
+
+def test_series_writer_flush_on_error(tmp_path):
+    path = tmp_path / "error.h5"
+    fluor = np.ones((10, 10))
+    try:
+        with SeriesWriter(path=path,
+                          wavelength=550e-9,
+                          pixel_size=1e-6,
+                          medium_index=1.335,
+                          buffer_size=5) as writer:
+            for ii in range(3):
+                writer.write(field=None, fluor=fluor*ii, time=ii)
+            raise ValueError("Simulated error")
+    except ValueError:
+        pass
+    with h5py.File(path, "r") as h5:
+        fls = flimage.FLSeries(h5file=h5["flseries"], h5mode="r")
+        assert len(fls) == 3
+        assert np.all(fls[2].fl == 2)
+        assert "qpseries" not in h5
+
+
+def test_series_writer_append(tmp_path):
+    path = tmp_path / "append.h5"
+    fluor = np.ones((10, 10))
+    kw = {"path": path,
+          "wavelength": 550e-9,
+          "pixel_size": 1e-6,
+          "medium_index": 1.335,
+          "buffer_size": 2}
+    with SeriesWriter(**kw) as writer:
+        for ii in range(3):
+            writer.write(field=None, fluor=fluor*ii, time=ii)
+    # new frames are appended to the existing series
+    with SeriesWriter(**kw) as writer:
+        for ii in range(3, 5):
+            writer.write(field=fluor*ii, fluor=fluor*ii, time=ii)
+    with h5py.File(path, "r") as h5:
+        fls = flimage.FLSeries(h5file=h5["flseries"], h5mode="r")
+        assert len(fls) == 5
+        for ii in range(5):
+            assert np.all(fls[ii].fl == ii)
+        assert sorted(h5["qpseries"].keys()) == ["qpi_0", "qpi_1"]
+
+
+def test_series_writer_compression(tmp_path):
+    path = tmp_path / "compression.h5"
+    with SeriesWriter(path=path,
+                      wavelength=550e-9,
+                      pixel_size=1e-6,
+                      medium_index=1.335,
+                      compression="lzf",
+                      compression_opts=None,
+                      chunks=(5, 10)) as writer:
+        writer.write(field=np.ones((10, 10), dtype=complex),
+                     fluor=None,
+                     time=0)
+    with h5py.File(path, "r") as h5:
+        dset = h5["qpseries/qpi_0/phase/raw"]
+        assert dset.compression == "lzf"
+        assert dset.chunks == (5, 10)
+
+
+def test_threaded_writer_reference(tmp_path):
+    sino = get_sinogram()
+    kw = {"angles": 7,
+          "propagator": "projection",
+          "writer_kw": {"buffer_size": 2},
+          }
+    path_ref = sino.compute(path=tmp_path / "serial.h5", **kw)
+    path = sino.compute(path=tmp_path / "threaded.h5",
+                        background_writer=True, **kw)
+    with h5py.File(path, "r") as h5, h5py.File(path_ref, "r") as h5ref:
+        assert_h5_equal(h5, h5ref)
+
+
+class FailingWriter(object):
+    """Writer that raises an error after `num` frames"""
+
+    def __init__(self, num):
+        self.num = num
+        self.frames = []
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def write(self, field, fluor, time, index=None):
+        if len(self.frames) == self.num:
+            raise OSError("Simulated disk error")
+        self.frames.append(time)
+
+
+def test_threaded_writer_error():
+    failing = FailingWriter(num=2)
+    writer = ThreadedWriter(failing, max_pending=2)
+    with pytest.raises(OSError, match="Simulated disk error"):
+        for ii in range(100):
+            writer.write(field=None, fluor=None, time=ii)
+    writer.close()
+    assert failing.frames == [0, 1]
+    assert failing.closed
+
+
+def test_threaded_writer_error_on_close():
+    failing = FailingWriter(num=0)
+    writer = ThreadedWriter(failing)
+    writer.write(field=None, fluor=None, time=0)
+    with pytest.raises(OSError, match="Simulated disk error"):
+        writer.close()
+    assert failing.closed
+
+
+def test_threaded_writer_compute_error(tmp_path):
+    path = tmp_path / "error.h5"
+    fluor = np.ones((10, 10))
+    try:
+        with ThreadedWriter(SeriesWriter(path=path,
+                                         wavelength=550e-9,
+                                         pixel_size=1e-6,
+                                         medium_index=1.335)) as writer:
+            for ii in range(3):
+                writer.write(field=None, fluor=fluor*ii, time=ii)
+            raise ValueError("Simulated error")
+    except ValueError:
+        pass
+    # all frames queued before the error are written
+    with h5py.File(path, "r") as h5:
+        fls = flimage.FLSeries(h5file=h5["flseries"], h5mode="r")
+        assert len(fls) == 3
+        assert np.all(fls[2].fl == 2)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    run_tests(locals())
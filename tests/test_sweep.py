@@ -0,0 +1,147 @@
+import json
+
+import h5py
+import numpy as np
+import qpimage
+
+import cellsino
+from cellsino import cli
+from cellsino.sweep import expand_grid, run_sweep
+
+from helpers import run_tests
+
+
+config_text = """
+[sweep]
+output = "sweep.h5"
+
+[parameters]
+phantom = "simple cell"
+pixel_size = 0.7e-6
+grid_size = [25, 25]
+angles = 3
+propagator = "projection"
+
+[phantom_kw]
+nucleus_index = 1.36
+
+[grid]
+wavelength = [500e-9, 550e-9]
+
+[grid.phantom_kw]
+nucleoli_index = [1.38, 1.39]
+"""
+
+
+def get_config_path(path):
+    cpath = path / "config.toml"
+    cpath.write_text(config_text)
+    return cpath
+
+
+def test_expand_grid(tmp_path):
+    jobs = expand_grid(cellsino.sweep.load_config(get_config_path(tmp_path)))
+    assert len(jobs) == 4
+    assert len(set(job["name"] for job in jobs)) == 4
+    assert jobs[0]["parameters"]["wavelength"] == 500e-9
+    assert jobs[0]["phantom_kw"] == {"nucleus_index": 1.36,
+                                     "nucleoli_index": 1.38}
+    try:
+        expand_grid({"parameters": {"wavelength": 1, "pixel_size": 1,
+                                    "grid_size": [2, 2], "angle": 2}})
+    except ValueError:
+        pass
+    else:
+        assert False, "invalid parameter"
+
+
+def test_sweep_cli(tmp_path):
+    cpath = get_config_path(tmp_path)
+    output = cpath.parent / "sweep.h5"
+    cli.sweep([str(cpath), "--cache-dir", str(cpath.parent / "sweep.cache"),
+               "--cache-size", "10"])
+    manifest = json.loads(
+        (cpath.parent / "sweep.h5.manifest.json").read_text())
+    assert len(manifest) == 4
+    assert all(job["status"] == "done" for job in manifest)
+
+    # compare to direct computation
+    job = manifest[3]
+    phantom = cellsino.phantoms.SimpleCell(**job["phantom_kw"])
+    sino = cellsino.Sinogram(phantom=phantom,
+                             wavelength=job["parameters"]["wavelength"],
+                             pixel_size=.7e-6,
+                             grid_size=(25, 25))
+    field, fluor = sino.compute(angles=3, propagator="projection")
+    with h5py.File(output, "r") as h5:
+        assert len(h5.keys()) == 4
+        group = h5[job["name"]]
+        assert json.loads(group.attrs["parameters"]) == job["parameters"]
+        with qpimage.QPSeries(h5file=group["qpseries"], h5mode="r") as qps:
+            assert len(qps) == 3
+            # qpimage stores the data with single precision
+            assert np.allclose(qps[2].field, field[2], rtol=0, atol=1e-6)
+            assert qps[2]["wavelength"] == job["parameters"]["wavelength"]
+
+    # resume: nothing is recomputed
+    manifest = run_sweep(cpath)
+    assert all(job["status"] == "skipped" for job in manifest)
+
+    # unfinished jobs are recomputed
+    with h5py.File(output, "a") as h5:
+        del h5[manifest[1]["name"]].attrs["finished"]
+    manifest = run_sweep(cpath)
+    status = [job["status"] for job in manifest]
+    assert status == ["skipped", "done", "skipped", "skipped"]
+    with h5py.File(output, "r") as h5:
+        assert len(h5[manifest[1]["name"]]["qpseries"].keys()) == 3
+
+    # the fluorescence is shared between all jobs via the disk cache
+    cache = cellsino.cache.DiskCache(cpath.parent / "sweep.cache")
+    num_fluor = 3
+    num_field = 4 * 3
+    assert len(cache) == num_fluor + num_field
+
+
+def test_sweep_parallel(tmp_path):
+    cpath = get_config_path(tmp_path)
+    output = cpath.parent / "parallel.h5"
+    manifest = run_sweep(cpath, output=output, workers=2)
+    assert all(job["status"] == "done" for job in manifest)
+    with h5py.File(output, "r") as h5:
+        assert len(h5.keys()) == 4
+        # same data as in a serial sweep
+        serial = cpath.parent / "serial.h5"
+        run_sweep(cpath, output=serial)
+        with h5py.File(serial, "r") as h5s:
+            for job in manifest:
+                group = h5[job["name"]]
+                assert group.attrs["finished"]
+                for key in ["qpseries", "flseries"]:
+                    assert len(group[key]) == 3
+                with qpimage.QPSeries(h5file=group["qpseries"],
+                                      h5mode="r") as qps, \
+                        qpimage.QPSeries(h5file=h5s[job["name"]]["qpseries"],
+                                         h5mode="r") as qps_s:
+                    assert np.all(qps[1].field == qps_s[1].field)
+    # the jobs share a frame cache by default
+    assert len(cellsino.cache.DiskCache(cpath.parent / "parallel.h5.cache"))
+    # temporary files are removed
+    assert not (cpath.parent / "parallel.h5.jobs").exists()
+
+
+def test_sweep_cache_size(tmp_path):
+    cpath = get_config_path(tmp_path)
+    fsize = 25 * 25 * 16 + 128  # complex field and .npy header
+    run_sweep(cpath, max_bytes=5 * fsize)
+    cache = cellsino.cache.DiskCache(cpath.parent / "sweep.h5.cache")
+    assert sum(pp.stat().st_size
+               for pp in cache.path.glob("*/*.npy")) <= 5 * fsize
+    # caching disabled
+    run_sweep(cpath, output=cpath.parent / "nocache.h5", cache_dir="")
+    assert not (cpath.parent / "nocache.h5.cache").exists()
+
+
+if __name__ == "__main__":
+    # Run all tests
+    run_tests(locals())